@@ -1,3 +1,5 @@
+import numpy as np
+
 # Random policy agent for poker
 class Always_Fold_Agent:
     def __init__(self):
@@ -13,4 +15,10 @@ class Always_Fold_Agent:
 
         state: (player_hand, community_cards, history)
         """
-        return 0
\ No newline at end of file
+        return 0
+
+    def take_actions(self, states, opp_states):
+        """
+        batched take_action(): return an array with one action per row of the batch (see batch_poker.py)
+        """
+        return np.zeros(len(states[0]), dtype=np.int8)
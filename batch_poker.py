@@ -0,0 +1,152 @@
+import numpy as np
+import showdown_table
+from deck import NUM_CARDS
+
+# Play many games of our simplified poker at once, with every game stored as a row of integer arrays.
+#
+# A batched agent has a take_actions(states, opp_states) function that returns an array of actions (0 or 1),
+# one per row. Each states tuple is (hands, community cards, history): hands is an int array of shape (n, 1),
+# community cards an int array of shape (n, 3) and history the betting history shared by every row in the call.
+# Agents without take_actions() are wrapped in ScalarPolicyAdapter, which calls take_action() row by row.
+
+
+class ScalarPolicyAdapter:
+    """ Batched interface for an agent that only has take_action(state, opp_state). """
+    def __init__(self, agent):
+        self._agent = agent
+
+    def __str__(self):
+        return str(self._agent)
+
+    def take_actions(self, states, opp_states):
+        hands, community_cards, history = states
+        hands = hands.tolist()
+        community_cards = community_cards.tolist()
+        # opp_states is None when the opponent's cards are unknown (see best_response.py)
+        opp_hands = opp_states[0].tolist() if opp_states is not None else None
+        actions = np.empty(len(hands), dtype=np.int8)
+        for i in range(len(hands)):
+            opp_state = (opp_hands[i], community_cards[i], list(history)) if opp_hands is not None else None
+            actions[i] = self._agent.take_action((hands[i], community_cards[i], list(history)), opp_state)
+        return actions
+
+
+def batch_policy(agent):
+    """ Return agent if it can act on a batch of states, otherwise wrap it in a ScalarPolicyAdapter. """
+    if hasattr(agent, "take_actions"):
+        return agent
+    return ScalarPolicyAdapter(agent)
+
+
+def deal_batch(rng, n, num_cards):
+    """ Deal the top num_cards cards of n independently shuffled decks, with a numpy Generator: int array of shape
+    (n, num_cards). """
+    dealt = np.empty((n, num_cards), dtype=np.int64)
+    taken = np.empty((n, 0), dtype=np.int64) # Cards dealt so far in each game, sorted
+    for k in range(num_cards):
+        # Pick the r-th card among those still in the deck, by stepping over the smaller cards already dealt
+        card = rng.integers(0, NUM_CARDS - k, size=n)
+        for j in range(k):
+            card += card >= taken[:, j]
+        dealt[:, k] = card
+        taken = np.sort(dealt[:, :k + 1], axis=1)
+    return dealt
+
+
+class BatchPokerGame:
+    def __init__(self, seed=None, history_writer=None):
+        self._rng = np.random.default_rng(seed)
+        self._history_writer = history_writer # Records every game played, if set (see hand_history.py)
+        self._num_community_cards = 3
+        self._num_player_cards = 1
+        self._blind = 1
+        self._bet = 2
+        self._strengths = np.frombuffer(showdown_table.get_strength_table(), dtype=np.uint16)
+
+    def deal_cards(self, n):
+        """ Deal n games from n independently shuffled decks.
+        Returns:
+            hands: int array of shape (n, 2), hands[:, p] is player p's card
+            community cards: int array of shape (n, 3)
+        """
+        dealt = deal_batch(self._rng, n, 2 * self._num_player_cards + self._num_community_cards)
+        return dealt[:, :2], dealt[:, 2:]
+
+    def showdown(self, hands, community_cards):
+        """ Return the winner of each game at showdown: 1 for p0, -1 for p1, 0 for a tie. """
+        board = showdown_table.BOARD_INDEX[(community_cards[:, 0] * NUM_CARDS + community_cards[:, 1]) * NUM_CARDS + community_cards[:, 2]]
+        p0_strength = self._strengths[hands[:, 0] * showdown_table.NUM_BOARDS + board].astype(np.int32)
+        p1_strength = self._strengths[hands[:, 1] * showdown_table.NUM_BOARDS + board].astype(np.int32)
+        return np.sign(p0_strength - p1_strength).astype(np.int8)
+
+    def play(self, p0_policy, p1_policy, n, deal=None):
+        """ Play n games of simplified poker, return the result of each game and the margin of victory
+
+            p0_policy -- player 0's policy: has a function take_actions() (or take_action()) as described above
+            p1_policy -- player 1's policy
+            deal -- optional (hands (n, 2), community cards (n, 3)) to play instead of dealing new cards
+        Returns:
+            the winners: int array of shape (n,), 1 for p0, -1 for p1, 0 for a tie
+            the margins: int array of shape (n,), +ve for p0 win, -ve for p1 win
+        """
+        policies = [batch_policy(p0_policy), batch_policy(p1_policy)]
+        hands, community_cards = self.deal_cards(n) if deal is None else deal
+        states = [(hands[:, 0:1], community_cards), (hands[:, 1:2], community_cards)]
+
+        def act(player, rows, history):
+            state = (states[player][0][rows], states[player][1][rows], history)
+            opp_state = (states[1 - player][0][rows], states[1 - player][1][rows], history)
+            return np.asarray(policies[player].take_actions(state, opp_state))
+
+        # Every game follows one path of the betting tree. Each node acts on the rows that reached it, and
+        # each terminal history ([0, 0], [0, 1, 0], [0, 1, 1], [1, 0], [1, 1]) fills in the chips at stake:
+        # +-blind for a fold, and blind or blind + bet (times the showdown winner) for a showdown
+        folded = np.zeros(n, dtype=np.int8) # 1 if p1 folded, -1 if p0 folded
+        stake = np.zeros(n, dtype=np.int8)
+        everyone = np.arange(n)
+
+        p0_bets = act(0, everyone, []) == 1
+        checked = everyone[~p0_bets]
+        bet = everyone[p0_bets]
+
+        # [0, ...]: P1 responds to a check
+        p1_bets = act(1, checked, [0]) == 1
+        stake[checked[~p1_bets]] = self._blind # [0, 0]
+        raised = checked[p1_bets]
+
+        # [0, 1, ...]: P0 responds to P1's bet
+        p0_calls = act(0, raised, [0, 1]) == 1
+        folded[raised[~p0_calls]] = -1 # [0, 1, 0]
+        stake[raised[p0_calls]] = self._blind + self._bet # [0, 1, 1]
+
+        # [1, ...]: P1 responds to P0's bet
+        p1_calls = act(1, bet, [1]) == 1
+        folded[bet[~p1_calls]] = 1 # [1, 0]
+        stake[bet[p1_calls]] = self._blind + self._bet # [1, 1]
+
+        winners = folded.copy()
+        showdown = stake > 0
+        winners[showdown] = self.showdown(hands[showdown], community_cards[showdown])
+        margins = np.where(showdown, winners * stake, folded * self._blind).astype(np.int64)
+
+        if self._history_writer is not None:
+            histories = np.full((n, 3), -1, dtype=np.int8)
+            histories[:, 0] = p0_bets
+            histories[checked, 1] = p1_bets
+            histories[raised, 2] = p0_calls
+            histories[bet, 1] = p1_calls
+            self._history_writer.write_batch(hands, community_cards, histories, winners, margins)
+        return winners, margins
+
+    def play_matchup(self, p0_agent, p1_agent, num_games):
+        """ Play num_games between two agents, half with p0_agent as P0 and half with it as P1.
+        Returns:
+            p0_agent's wins, the number of ties and p0_agent's total reward
+        """
+        first = (num_games + 1) // 2
+        winners, margins = self.play(p0_agent, p1_agent, first)
+        swapped_winners, swapped_margins = self.play(p1_agent, p0_agent, num_games - first)
+        p0_wins = int(np.count_nonzero(winners == 1) + np.count_nonzero(swapped_winners == -1))
+        ties = int(np.count_nonzero(winners == 0) + np.count_nonzero(swapped_winners == 0))
+        p0_reward = int(margins.sum() - swapped_margins.sum())
+        return p0_wins, ties, p0_reward
@@ -0,0 +1,379 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from statistics import median
+import numpy as np
+
+# Benchmarks of the hot paths of the game and the agents, run with
+#     python -m bench [--output bench_results.json] [--baseline baseline.json] [--threshold 0.2] [--only deck,game]
+#
+# Each benchmark builds its inputs once and returns a function that runs `ops` operations. The function is timed
+# over repeat runs of at least min_time seconds each, and the median time per operation is reported. Results are
+# written as JSON with information about the machine:
+#     {"machine": {...}, "created": ..., "results": {name: {"seconds_per_op": ..., "ops_per_second": ..., ...}}}
+# Given a baseline (a previous results file), every benchmark that got slower by more than its threshold (a
+# fraction: 0.2 means 20% slower) is reported as a regression, and the exit code is 1.
+
+BENCHMARKS = {} # name -> function returning (run, ops)
+
+def benchmark(name):
+    """ Register a benchmark: the decorated function sets up its inputs and returns (run, ops per call of run). """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def random_deals(n, seed=0):
+    """ Return n deals of ([P0 card], [P1 card], community cards) as lists of integer cards. """
+    rng = random.Random(seed)
+    deals = []
+    for _ in range(n):
+        cards = rng.sample(range(52), 5)
+        deals.append(([cards[0]], [cards[1]], cards[2:]))
+    return deals
+
+
+@benchmark("deck.reset")
+def bench_deck_reset():
+    from deck import Deck
+    deck = Deck()
+    def run():
+        for _ in range(1000):
+            deck.reset()
+    return run, 1000
+
+@benchmark("deck.shuffle")
+def bench_deck_shuffle():
+    from deck import Deck
+    deck = Deck()
+    def run():
+        for _ in range(1000):
+            deck.shuffle()
+    return run, 1000
+
+@benchmark("deck.deal")
+def bench_deck_deal():
+    """ One game's worth of dealing: reset, shuffle, deal 1 + 1 + 3 cards. """
+    from deck import Deck
+    deck = Deck()
+    def run():
+        for _ in range(1000):
+            deck.reset()
+            deck.shuffle()
+            deck.deal(1)
+            deck.deal(1)
+            deck.deal(3)
+    return run, 1000
+
+
+def bench_evaluator(name):
+    @benchmark(f"poker_utils.{name}")
+    def setup():
+        import poker_utils
+        evaluator = getattr(poker_utils, name)
+        deals = [(hand, community) for hand, _, community in random_deals(1000)]
+        def run():
+            for hand, community in deals:
+                evaluator(hand, community)
+        return run, len(deals)
+
+for evaluator_name in ("pair_exists", "straight_exists", "flush_exists", "straight_flush_exists", "determine_best_hand"):
+    bench_evaluator(evaluator_name)
+
+
+def bench_hand_value(num_cards):
+    @benchmark(f"poker_hands.hand_value.{num_cards}_cards")
+    def setup():
+        import poker_hands
+        poker_hands.build_tables()
+        hands = np.argsort(np.random.default_rng(0).random((1000, 52)), axis=1)[:, :num_cards].tolist()
+        def run():
+            for cards in hands:
+                poker_hands.hand_value(cards)
+        return run, len(hands)
+
+    @benchmark(f"poker_hands.hand_values.{num_cards}_cards")
+    def setup_batch():
+        import poker_hands
+        poker_hands.build_tables()
+        hands = np.argsort(np.random.default_rng(0).random((100000, 52)), axis=1)[:, :num_cards]
+        def run():
+            poker_hands.hand_values(hands)
+        return run, len(hands)
+
+for hand_cards in (5, 7):
+    bench_hand_value(hand_cards)
+
+
+@benchmark("game.determine_game_result")
+def bench_determine_game_result():
+    from poker import PokerGame
+    game = PokerGame()
+    deals = random_deals(1000)
+    def run():
+        for p0_hand, p1_hand, community in deals:
+            game._hands = [p0_hand, p1_hand]
+            game._community_cards = community
+            game._history = [1, 1]
+            game.determine_game_result(verbose=False)
+    return run, len(deals)
+
+
+def builtin_agents():
+    """ Return the built-in agents by short name. CFR and DQN are not trained: only their speed matters here. """
+    from always_bet_policy import Always_Bet_Agent
+    from always_fold_policy import Always_Fold_Agent
+    from random_policy import Random_Agent
+    from expectimax import ExpectimaxAgent
+    from cfr import CFR_Agent
+    from dqn_agent import DQNAgent
+    dqn = DQNAgent(epsilon=0)
+    dqn.freeze("numpy")
+    return {"always_bet": Always_Bet_Agent(), "always_fold": Always_Fold_Agent(), "random": Random_Agent(),
+            "expectimax": ExpectimaxAgent(), "cfr": CFR_Agent(iterations=1), "dqn": dqn}
+
+AGENT_NAMES = ("always_bet", "always_fold", "random", "expectimax", "cfr", "dqn")
+_agents = None
+
+def agents():
+    global _agents
+    if _agents is None:
+        _agents = builtin_agents()
+    return _agents
+
+
+def bench_play(p0_name, p1_name):
+    @benchmark(f"game.play.{p0_name}.{p1_name}")
+    def setup():
+        from poker import PokerGame
+        game = PokerGame()
+        p0, p1 = agents()[p0_name], agents()[p1_name]
+        def run():
+            for _ in range(200):
+                game.play(p0, p1)
+        return run, 200
+
+for i, p0_name in enumerate(AGENT_NAMES):
+    for p1_name in AGENT_NAMES[i:]:
+        bench_play(p0_name, p1_name)
+
+
+@benchmark("engine.play.random.random")
+def bench_engine_play():
+    """ GameEngine with the default rules: the same games as game.play.random.random. """
+    from game_engine import GameEngine
+    engine = GameEngine()
+    agent = agents()["random"]
+    def run():
+        for _ in range(200):
+            engine.play(agent, agent)
+    return run, 200
+
+@benchmark("engine.play_batch.3_streets")
+def bench_engine_play_batch():
+    """ Games per second of a larger variant: 2 hole cards, 3 betting rounds with raises. """
+    from game_engine import GameEngine, GameRules
+    engine = GameEngine(GameRules(num_player_cards=2, street_cards=(2, 1, 1), bet_sizes=(2, 4, 4), raise_caps=(2, 1, 1)), seed=0)
+    agent = agents()["always_bet"]
+    def run():
+        engine.play_batch(agent, agent, 10000)
+    return run, 10000
+
+
+def decision_states(n=1000, seed=0):
+    """ Return n (state, opponent state) pairs of P0 at its first decision. """
+    return [((p0_hand, community, []), (p1_hand, community, [])) for p0_hand, p1_hand, community in random_deals(n, seed)]
+
+@benchmark("expectimax.take_action")
+def bench_expectimax():
+    """ Without the equity table: every decision enumerates the remaining cards. """
+    from expectimax import ExpectimaxAgent
+    agent = ExpectimaxAgent(equity_table=False)
+    states = decision_states(100)
+    def run():
+        for state, opp_state in states:
+            agent.take_action(state, opp_state)
+    return run, len(states)
+
+@benchmark("expectimax.take_action.table")
+def bench_expectimax_table():
+    from expectimax import ExpectimaxAgent
+    agent = ExpectimaxAgent()
+    states = decision_states()
+    def run():
+        for state, opp_state in states:
+            agent.take_action(state, opp_state)
+    return run, len(states)
+
+@benchmark("dqn.take_action")
+def bench_dqn_take_action():
+    from dqn_agent import DQNAgent
+    agent = DQNAgent(epsilon=0)
+    states = decision_states()
+    def run():
+        for state, opp_state in states:
+            agent.take_action(state, opp_state)
+    return run, len(states)
+
+@benchmark("dqn.take_action.frozen")
+def bench_dqn_take_action_frozen():
+    states = decision_states()
+    agent = agents()["dqn"]
+    def run():
+        for state, opp_state in states:
+            agent.take_action(state, opp_state)
+    return run, len(states)
+
+@benchmark("dqn.learn")
+def bench_dqn_learn():
+    """ One gradient step on a minibatch sampled from a full replay buffer. """
+    from dqn_agent import DQNAgent
+    from dqn_utils import STATE_SIZE
+    agent = DQNAgent(buffer_size=4096)
+    rng = np.random.default_rng(0)
+    n = agent.memory.buffer_size
+    agent.memory.add_batch(rng.random((n, STATE_SIZE), dtype=np.float32), rng.integers(0, 2, n),
+                           rng.integers(-3, 4, n).astype(np.float32), rng.random((n, STATE_SIZE), dtype=np.float32),
+                           rng.random(n) < 0.5)
+    def run():
+        for _ in range(10):
+            agent.learn(agent.memory.sample())
+    return run, 10
+
+@benchmark("cfr.train")
+def bench_cfr_train():
+    """ CFR+ iterations, including the exploitability check train() runs every 25 iterations. """
+    from cfr import CFR_Agent
+    agent = CFR_Agent(iterations=1)
+    def run():
+        agent.train(25)
+    return run, 25
+
+
+def measure(run, ops, repeat=5, min_time=0.2):
+    """ Time run() (ops operations per call) and return a dict of results, the median over repeat samples. Each
+    sample calls run() enough times to take at least min_time seconds. """
+    run() # Warm up
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        calls = max(calls * 2, int(calls * min_time / max(elapsed, 1e-9) * 1.2))
+    samples = [elapsed / (calls * ops)]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(calls):
+            run()
+        samples.append((time.perf_counter() - start) / (calls * ops))
+    seconds = median(samples)
+    return {"seconds_per_op": seconds, "ops_per_second": 1 / seconds, "min_seconds_per_op": min(samples),
+            "max_seconds_per_op": max(samples), "ops": calls * ops, "repeat": repeat}
+
+
+def machine_info():
+    info = {"platform": platform.platform(), "processor": platform.processor() or platform.machine(),
+            "cpu_count": os.cpu_count(), "python": platform.python_version(), "numpy": np.__version__}
+    if "torch" in sys.modules:
+        info["torch"] = sys.modules["torch"].__version__
+        info["torch_threads"] = sys.modules["torch"].get_num_threads()
+    try:
+        info["git_commit"] = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        info["git_commit"] = None
+    return info
+
+
+def run_benchmarks(names=None, repeat=5, min_time=0.2, verbose=False):
+    """ Run the given benchmarks (all by default) and return the results document (see the top of this file). """
+    results = {}
+    for name in names or BENCHMARKS:
+        random.seed(0)
+        np.random.seed(0)
+        run, ops = BENCHMARKS[name]()
+        results[name] = measure(run, ops, repeat, min_time)
+        if verbose:
+            print(f"{name:<40} {format_time(results[name]['seconds_per_op']):>10}/op  {results[name]['ops_per_second']:>12.1f} ops/s")
+    return {"machine": machine_info(), "created": time.time(), "results": results}
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+def compare(results, baseline, threshold=0.2, thresholds=None):
+    """ Compare two results documents. Returns a list of (name, baseline s/op, s/op, change) for every benchmark in
+    both, and the list of the names that regressed: slower by more than thresholds.get(name, threshold). """
+    thresholds = thresholds or {}
+    rows, regressions = [], []
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before, after = baseline["results"][name]["seconds_per_op"], result["seconds_per_op"]
+        change = after / before - 1
+        rows.append((name, before, after, change))
+        if change > thresholds.get(name, threshold):
+            regressions.append(name)
+    return rows, regressions
+
+
+def format_comparison(rows, regressions):
+    lines = [f"{'Benchmark':<40} {'Baseline':>10} {'Now':>10} {'Change':>8}"]
+    for name, before, after, change in rows:
+        flag = "  REGRESSION" if name in regressions else ""
+        lines.append(f"{name:<40} {format_time(before):>10} {format_time(after):>10} {change * 100:>+7.1f}%{flag}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the game and the agents")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="results JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown (fraction) before a regression")
+    parser.add_argument("--thresholds", default="", help="per benchmark thresholds, e.g. dqn.learn=0.25,cfr.train=0.2")
+    parser.add_argument("--only", default="", help="comma separated prefixes of the benchmarks to run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per sample")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return 0
+    prefixes = [prefix for prefix in args.only.split(",") if prefix]
+    names = [name for name in BENCHMARKS if not prefixes or any(name.startswith(prefix) for prefix in prefixes)]
+    if not names:
+        parser.error(f"no benchmark matches {args.only}")
+    thresholds = {name: float(value) for name, value in (item.split("=") for item in args.thresholds.split(",") if item)}
+
+    results = run_benchmarks(names, args.repeat, args.min_time, verbose=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, args.threshold, thresholds)
+        print(format_comparison(rows, regressions))
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import numpy as np
+import canonical
+import game_tree
+import showdown_table
+from batch_poker import batch_policy
+from game_tree import BoardTables, NODE_HISTORIES, NUM_NODES, NUM_ACTIONS
+
+# Exact evaluation of agents, with no sampling.
+#
+# An agent is turned into a strategy profile (see game_tree.py) by asking it for an action once per information
+# state: (decision node, hand, community cards). Agents with an action_probabilities(states) function give their
+# probabilities for a batch of states; otherwise take_actions() (or take_action(), row by row) is asked once and
+# the agent is assumed to be deterministic. Expected values, best responses and exploitability are then computed
+# over every deal and betting history by game_tree.
+#
+# With symmetric=True (the default) the agent is only asked about one representative of each canonical state,
+# which is exact for agents that don't care about suit labels (Expectimax, CFR, the fixed and random agents).
+# Use symmetric=False for agents that do (DQN): every raw (hand, board) state is asked instead.
+# Agents are given opp_state=None, since an information state doesn't determine the opponent's cards.
+
+
+def _query_states(symmetric):
+    """ Hands (n, 1) and community cards (n, 3) of every information state, in information state index order. """
+    if symmetric:
+        hands = canonical.STATE_HOLES.astype(np.int64)[:, None]
+        community_cards = canonical.CANONICAL_BOARD_CARDS.astype(np.int64)[canonical.STATE_BOARDS]
+        return hands, community_cards, np.ones(len(hands), dtype=bool)
+    boards = showdown_table.all_boards().astype(np.int64)
+    hands = np.repeat(np.arange(showdown_table.NUM_CARDS), showdown_table.NUM_BOARDS)[:, None]
+    community_cards = np.tile(boards, (showdown_table.NUM_CARDS, 1))
+    valid = (community_cards != hands).all(axis=1) # Hole card not on the board
+    return hands, community_cards, valid
+
+
+def policy_profile(agent, symmetric=True, chunk_size=1 << 16):
+    """ Return the strategy profile of an agent: (NUM_NODES, information states, 2) action probabilities. """
+    hands, community_cards, valid = _query_states(symmetric)
+    profile = np.full((NUM_NODES, len(hands), NUM_ACTIONS), 1 / NUM_ACTIONS)
+    rows = np.nonzero(valid)[0]
+    policy = agent if hasattr(agent, "action_probabilities") else batch_policy(agent)
+    for node, history in enumerate(NODE_HISTORIES):
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            states = (hands[chunk], community_cards[chunk], list(history))
+            if hasattr(policy, "action_probabilities"):
+                profile[node, chunk] = policy.action_probabilities(states)
+            else:
+                actions = np.asarray(policy.take_actions(states, None))
+                profile[node, chunk, 0] = actions == 0
+                profile[node, chunk, 1] = actions == 1
+    return profile
+
+
+class ExactEvaluator:
+    """ Exact expected values, best responses and exploitability of agents. Each agent's profile is built on first
+        use and cached, so every information state is asked about only once per agent.
+    """
+    def __init__(self, symmetric=True):
+        self.symmetric = symmetric
+        self.tables = BoardTables(canonical_boards=symmetric)
+        self._profiles = {}
+
+    def profile(self, agent):
+        if id(agent) not in self._profiles:
+            self._profiles[id(agent)] = (agent, policy_profile(agent, self.symmetric))
+        return self._profiles[id(agent)][1]
+
+    def expected_value(self, p0_agent, p1_agent):
+        """ Return p0_agent's exact expected chips per game when it plays P0 against p1_agent. """
+        profile = self.profile(p0_agent).copy()
+        for node in (1, 2): # P1's decision nodes
+            profile[node] = self.profile(p1_agent)[node]
+        return game_tree.expected_value(self.tables, profile)
+
+    def matchup_value(self, p0_agent, p1_agent):
+        """ Return p0_agent's exact expected chips per game when the agents alternate seats, as in play_matchup. """
+        return (self.expected_value(p0_agent, p1_agent) - self.expected_value(p1_agent, p0_agent)) / 2
+
+    def best_response_values(self, agent):
+        """ Return the exact chips per game of a best response playing P0 against the agent as P1, and playing P1
+        against the agent as P0.
+        """
+        return game_tree.best_response_values(self.tables, self.profile(agent))
+
+    def exploitability(self, agent):
+        """ Return the agent's exploitability in chips per game: the average of what a best response wins against
+        it in each seat (0 for an equilibrium strategy).
+        """
+        p0_best, p1_best = self.best_response_values(agent)
+        return (p0_best + p1_best) / 2
+
+
+def format_exact_table(agents, matchups, evaluator=None):
+    """ Return a table (a str) with the exact value of each matchup (P0 agent's chips per game, alternating seats)
+    and the exploitability of each agent that appears in it.
+    """
+    evaluator = evaluator or ExactEvaluator()
+    names = [str(agent) for agent in agents]
+    width = max(len(name) for name in names)
+    lines = [f"{'P0':<{width}}  {'P1':<{width}}  {'P0 reward/game':>14}"]
+    for p0, p1 in matchups:
+        lines.append(f"{names[p0]:<{width}}  {names[p1]:<{width}}  {evaluator.matchup_value(agents[p0], agents[p1]):>14.4f}")
+    lines.append("")
+    lines.append(f"{'Agent':<{width}}  {'Exploitability':>14}")
+    for i in sorted({i for matchup in matchups for i in matchup}):
+        lines.append(f"{names[i]:<{width}}  {evaluator.exploitability(agents[i]):>14.4f}")
+    return "\n".join(lines)
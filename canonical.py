@@ -0,0 +1,103 @@
+import itertools as it
+import numpy as np
+import showdown_table
+from deck import NUM_CARDS
+
+# Canonical indices of deals under suit relabeling.
+#
+# Our evaluators only ever compare suits for equality, and the order of the community cards never matters, so two
+# (hole card, community cards) deals that differ by a permutation of the suits play exactly the same. This module
+# numbers the classes of such deals:
+#     canonical boards: 0 .. NUM_CANONICAL_BOARDS - 1 (1755 of the 22100 boards)
+#     canonical states: 0 .. NUM_CANONICAL_STATES - 1 (63193 of the 1082900 valid deals)
+# States are numbered in (canonical board, hole card) order, so the states of a board are contiguous.
+#
+# A raw board is mapped to its canonical board by relabeling its suits with one of the 24 suit permutations, and
+# the hole card relabeled the same way is then looked up in a per canonical board table. Every table here is
+# indexed by board (22100 entries) or by canonical board (1755 x 52), about 250KB in total.
+
+SUIT_PERMUTATIONS = np.array(list(it.permutations(range(4))), dtype=np.int64) # (24, 4)
+NO_STATE = np.iinfo(np.uint16).max # Canonical state of a hole card that is on the board
+
+
+def _build_tables():
+    cards = np.arange(NUM_CARDS)
+    permuted_cards = (cards >> 2 << 2) | SUIT_PERMUTATIONS[:, cards & 3] # (24, 52): card relabeled by each permutation
+    boards = showdown_table.all_boards().astype(np.int64)
+
+    # Board index of every board under every permutation: (24, NUM_BOARDS)
+    pb = permuted_cards[:, boards]
+    permuted_boards = showdown_table.BOARD_INDEX[(pb[:, :, 0] * NUM_CARDS + pb[:, :, 1]) * NUM_CARDS + pb[:, :, 2]]
+
+    # The canonical representative of a board is the smallest board it can be relabeled to
+    board_permutation = permuted_boards.argmin(axis=0)
+    representatives = permuted_boards[board_permutation, np.arange(showdown_table.NUM_BOARDS)]
+    canonical_boards, board_to_canonical, board_counts = np.unique(representatives, return_inverse=True, return_counts=True)
+
+    # Hole cards on a representative board are identified up to the permutations that leave that board unchanged
+    canonical_holes = np.full((len(canonical_boards), NUM_CARDS), NUM_CARDS, dtype=np.int64)
+    for p in range(len(SUIT_PERMUTATIONS)):
+        stable = permuted_boards[p, canonical_boards] == canonical_boards
+        canonical_holes[stable] = np.minimum(canonical_holes[stable], permuted_cards[p][None, :])
+    on_board = (boards[canonical_boards][:, :, None] == cards[None, None, :]).any(axis=1)
+
+    # Number the (canonical board, canonical hole) pairs in order
+    is_state = (canonical_holes == cards[None, :]) & ~on_board
+    state_ids = np.cumsum(is_state).reshape(is_state.shape) - 1
+    hole_to_state = np.where(on_board, NO_STATE, np.take_along_axis(state_ids, canonical_holes, axis=1)).astype(np.uint16)
+    state_boards, state_holes = np.nonzero(is_state)
+
+    return (permuted_cards.astype(np.int16), board_permutation.astype(np.uint8), board_to_canonical.astype(np.uint16),
+            board_counts, boards[canonical_boards].astype(np.int16), hole_to_state, state_boards.astype(np.uint16),
+            state_holes.astype(np.int16))
+
+(PERMUTED_CARDS, # (24, 52): PERMUTED_CARDS[p, card] is card with its suit relabeled by permutation p
+ BOARD_PERMUTATION, # (NUM_BOARDS,): permutation that relabels a board to its canonical board
+ BOARD_TO_CANONICAL, # (NUM_BOARDS,): canonical board of each board
+ CANONICAL_BOARD_COUNTS, # (NUM_CANONICAL_BOARDS,): number of boards in each canonical board's class
+ CANONICAL_BOARD_CARDS, # (NUM_CANONICAL_BOARDS, 3): sorted cards of a representative board
+ HOLE_TO_STATE, # (NUM_CANONICAL_BOARDS, 52): canonical state of a relabeled hole card on each canonical board
+ STATE_BOARDS, # (NUM_CANONICAL_STATES,): canonical board of each canonical state
+ STATE_HOLES, # (NUM_CANONICAL_STATES,): representative hole card of each canonical state (on its representative board)
+) = _build_tables()
+
+NUM_CANONICAL_BOARDS = len(CANONICAL_BOARD_CARDS)
+NUM_CANONICAL_STATES = len(STATE_BOARDS)
+
+_permuted_cards = PERMUTED_CARDS.tolist()
+_board_permutation = BOARD_PERMUTATION.tolist()
+_board_to_canonical = BOARD_TO_CANONICAL.tolist()
+_hole_to_state = HOLE_TO_STATE.tolist()
+
+
+def canonical_board(community):
+    """ Return the canonical board index of a list of 3 community cards. """
+    return _board_to_canonical[showdown_table.board_index(community)]
+
+
+def canonical_index(hand, community):
+    """ Return the canonical state index of a (hand, community cards) deal. """
+    board = showdown_table.board_index(community)
+    return _hole_to_state[_board_to_canonical[board]][_permuted_cards[_board_permutation[board]][hand[0]]]
+
+
+def canonical_indices(hands, community_cards):
+    """ Batched canonical_index(): hands is an int array of shape (n,) and community cards of shape (n, 3). """
+    community_cards = np.asarray(community_cards, dtype=np.int64)
+    board = showdown_table.BOARD_INDEX[(community_cards[:, 0] * NUM_CARDS + community_cards[:, 1]) * NUM_CARDS + community_cards[:, 2]]
+    holes = PERMUTED_CARDS[BOARD_PERMUTATION[board], hands]
+    return HOLE_TO_STATE[BOARD_TO_CANONICAL[board], holes]
+
+
+def canonical_state(index):
+    """ Return a representative (hand, community cards) deal of a canonical state, as lists of integer cards. """
+    return [int(STATE_HOLES[index])], CANONICAL_BOARD_CARDS[STATE_BOARDS[index]].tolist()
+
+
+def state_counts():
+    """ Return an int array with the number of raw deals in each canonical state. """
+    boards = showdown_table.all_boards().astype(np.int64)
+    holes = np.broadcast_to(np.arange(NUM_CARDS)[:, None], (NUM_CARDS, showdown_table.NUM_BOARDS)).reshape(-1)
+    community_cards = np.tile(boards, (NUM_CARDS, 1))
+    states = canonical_indices(holes, community_cards)
+    return np.bincount(states[states != NO_STATE], minlength=NUM_CANONICAL_STATES)
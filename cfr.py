@@ -1,247 +1,251 @@
-import poker_utils
-from deck import Deck
 import random
-from poker import PokerGame
-from expectimax import ExpectimaxAgent
-from always_bet_policy import Always_Bet_Agent
-from random_policy import Random_Agent
-
+import time
+import numpy as np
+import game_tree
+from checkpoint import checkpoint_exists, save_checkpoint, load_checkpoint
+from canonical import canonical_index, canonical_indices, NUM_CANONICAL_STATES
+from game_tree import BoardTables, NUM_NODES, NUM_ACTIONS
+
+
+def action_sum(values):
+    '''Sum over the 2 actions (last axis), keeping the axis. Faster than .sum() on such a short axis'''
+    return values[..., 0:1] + values[..., 1:2]
+
+
+def regret_matching(regrets):
+    '''Strategy proportional to the positive regrets of each information set; uniform when none is positive'''
+    positive = np.maximum(regrets, 0)
+    total = action_sum(positive)
+    return np.divide(positive, total, out=np.full_like(positive, 1 / NUM_ACTIONS), where=total > 0)
+
+
+def normalize(strategy_sums):
+    '''Average strategy from summed strategies; uniform for information sets that were never reached'''
+    total = action_sum(strategy_sums)
+    return np.divide(strategy_sums, total, out=np.full_like(strategy_sums, 1 / NUM_ACTIONS), where=total > 0)
+
+
+class CFRSolver:
+    '''Counterfactual regret minimization over the full betting tree of PokerGame (see game_tree.py).
+
+    Information sets are (decision node, canonical state): the player's card and the community cards up to suit
+    relabeling, plus the betting history. Regrets and strategy sums are dense arrays of shape
+    (NUM_NODES, NUM_CANONICAL_STATES, 2), and every iteration traverses the tree for all deals at once.
+
+    plus=True runs CFR+ (regrets floored at 0, alternating updates, linearly weighted average strategy),
+    plus=False runs vanilla CFR with simultaneous updates.
+    '''
+
+    def __init__(self, plus=True):
+        self.plus = plus
+        self.iterations = 0
+        self._tables = None
+        self._showdown = None
+        shape = (NUM_NODES, NUM_CANONICAL_STATES, NUM_ACTIONS)
+        self.regrets = np.zeros(shape)
+        self.strategy_sums = np.zeros(shape)
+
+    @property
+    def tables(self):
+        if self._tables is None:
+            self._tables = BoardTables()
+            self._showdown = self._tables.showdown_matrices(slice(None))
+        return self._tables
+
+    def current_strategy(self):
+        return regret_matching(self.regrets)
+
+    def average_strategy(self):
+        return normalize(self.strategy_sums)
+
+    def iterate(self):
+        '''Run one iteration of CFR (or CFR+) over every deal'''
+        tables = self.tables
+        rows = slice(None)
+        t = self.iterations + 1
+        weight = t if self.plus else 1
+
+        profile = self.current_strategy()
+        simultaneous = [] # Vanilla CFR applies both players' regret updates after the traversal
+        for player in (0, 1):
+            strategies = tables.gather(profile, rows)
+
+            if player == 0:
+                check_check, node3, bet = game_tree.p0_values(self._showdown, strategies)
+                node3_value = action_sum(strategies[3] * node3)[..., 0]
+                root = game_tree.root_values(check_check, node3, bet, node3_value)
+                updates = [(0, root, strategies[0], 1), (3, node3, strategies[3], strategies[0][..., 0:1])]
+            else:
+                node1, node2 = game_tree.p1_values(self._showdown, strategies)
+                updates = [(1, node1, strategies[1], 1), (2, node2, strategies[2], 1)]
+
+            for node, values, strategy, reach in updates:
+                # Regret of each action: its counterfactual value minus the value of the current strategy
+                regret = tables.scatter(values - action_sum(strategy * values), rows)
+                self.strategy_sums[node] += weight * tables.scatter(reach * strategy, rows)
+                if self.plus:
+                    self.regrets[node] += regret
+                    np.maximum(self.regrets[node], 0, out=self.regrets[node])
+                    # Alternating updates: P1 responds to P0's updated strategy
+                    profile[node] = regret_matching(self.regrets[node])
+                else:
+                    simultaneous.append((node, regret))
+
+        for node, regret in simultaneous:
+            self.regrets[node] += regret
+        self.iterations = t
+
+    def exploitability(self):
+        '''Exploitability of the average strategy, in chips per game'''
+        return game_tree.exploitability(self.tables, self.average_strategy())
+
+    def solve(self, iterations, target_exploitability=None, check_every=25, verbose=False):
+        '''Run up to iterations iterations, stopping early once the average strategy's exploitability is below
+        target_exploitability (measured every check_every iterations).
+
+        Returns a list of (iterations, seconds, exploitability) measurements.
+        '''
+        start = time.perf_counter()
+        measurements = []
+        for i in range(1, iterations + 1):
+            self.iterate()
+            if i % check_every == 0 or i == iterations:
+                exploitability = self.exploitability()
+                measurements.append((self.iterations, time.perf_counter() - start, exploitability))
+                if verbose:
+                    print(f"Iteration {self.iterations}: exploitability {exploitability * 1000:.3f} mchips/game ({measurements[-1][1]:.1f}s)")
+                if target_exploitability is not None and exploitability <= target_exploitability:
+                    break
+        return measurements
 
 
 class CFR_Agent:
 
-    def __init__(self, verbose=False):
-        '''p0 refers to the CFR Agent; p1 refers to the opponent'''
-        
-        self._map_hand_type = {0: "HC", 1: "F", 2: "S", 3: "P", 4: "SF"}
-        
-        # CFR Agent stats
-        self._p0_total_regret = {"SF": [0, 0], "P": [0, 0], "S": [0, 0], "F": [0, 0], "HC": [0, 0]} # initialized to 0 for [pass, bet] in all info sets
-        self._p0_total_prob = {"SF": [0, 0], "P": [0, 0], "S": [0, 0], "F": [0, 0], "HC": [0, 0]} 
-
-        self.train(num_games=25000) # train model for num_games games
-    
+    def __init__(self, iterations=1000, target_exploitability=1e-3, plus=True, verbose=False, checkpoint=None, read_only=False):
+        '''Solves the game with CFR (see CFRSolver) and plays the average strategy, in either seat
+
+        checkpoint: directory of a checkpoint (see checkpoint.py). If it exists, the solver starts from it and only
+        trains up to iterations in total, unless the saved strategy already reached target_exploitability.
+        read_only: play the checkpoint's strategy without a solver (no training). The strategy stays a read-only
+        memory map of the checkpoint file, and pickled copies of the agent (e.g. in tournament workers) map the
+        same file instead of carrying the table, so every process shares the same pages.
+        '''
+        self._verbose = verbose
+        self._solver = None if read_only else CFRSolver(plus=plus)
+        self._strategy = None
+        self._strategy_path = None # Checkpoint the strategy is mapped from
+        self._bet_probability = None
+        self.last_exploitability = None
+        if read_only:
+            self._load_strategy(checkpoint)
+        elif checkpoint is not None and checkpoint_exists(checkpoint):
+            self.load(checkpoint)
+            done = target_exploitability is not None and self.last_exploitability is not None and self.last_exploitability <= target_exploitability
+            if not done and self._solver.iterations < iterations:
+                self.train(iterations - self._solver.iterations, target_exploitability)
+        else:
+            self.train(iterations, target_exploitability)
+
     def __str__(self):
         return f"CFR minimization Agent"
 
-    
-    def get_info_set(self, state):
-        '''Returns key (a str) that corresponds to the information set for a given state'''
+    def __getstate__(self):
+        # Pickled agents (e.g. shipped to tournament workers) only carry the strategy they play, not the solver,
+        # and only the path of the strategy when it is mapped from a checkpoint
+        state = self.__dict__.copy()
+        state["_solver"] = None
+        state["_bet_probability"] = None
+        if self._strategy_path is not None:
+            state["_strategy"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._strategy is None and self._strategy_path is not None:
+            self._load_strategy(self._strategy_path)
+        else:
+            self._set_strategy(self._strategy, self._strategy_path)
+
+    def _set_strategy(self, strategy, path=None):
+        self._strategy = strategy
+        self._strategy_path = path
+        # Flat view for take_action: the probability of betting of info set (node, index) is at node * NUM_CANONICAL_STATES + index
+        self._bet_probability = memoryview(strategy.reshape(-1))
+
+    def _load_strategy(self, path):
+        metadata, arrays = load_checkpoint(path, "cfr", arrays=["strategy"])
+        if arrays["strategy"].shape != (NUM_NODES, NUM_CANONICAL_STATES):
+            raise ValueError(f"{path}: strategy of shape {arrays['strategy'].shape}, expected {(NUM_NODES, NUM_CANONICAL_STATES)}")
+        self._set_strategy(arrays["strategy"].view(np.ndarray), path)
+        self.last_exploitability = metadata["exploitability"]
+        return metadata
 
+    def get_info_set(self, state):
+        '''Returns the information set of a state: (decision node, canonical state)'''
         card, community_cards, history = state
+        return game_tree.node_index(history), canonical_index(card, community_cards)
 
-        hand_type_idx, hand_value = poker_utils.determine_best_hand(card, community_cards)
-    
-        hand_type = self._map_hand_type[hand_type_idx]
-
-        return hand_type
-
-    
     def get_strategy(self, info_set):
-        '''Samples positive regrets; Regrets are normalized'''
-
-        # look at regrets for (pass, bet) in info_set + add the non-negative regrets to get positive_regret_sum
-        total_regret = self._p0_total_regret[info_set]
-        pass_total_regret = total_regret[0]
-        bet_total_regret = total_regret[1]
-
-        positive_regret_sum = max(0, pass_total_regret) + max(0, bet_total_regret) # use max(0, action_total_regret) to make sure I only include positive regrets
-
-        curr_strategy = [0, 0]
-
-        # get normalized probabilities
-        if positive_regret_sum > 0:
-            curr_strategy[0] = max(0, pass_total_regret) / positive_regret_sum
-            curr_strategy[1] = max(0, bet_total_regret) / positive_regret_sum
-
-        else:
-            curr_strategy = [0.5, 0.5]
-
-        return curr_strategy
-
+        '''Current strategy of the solver: positive regrets, normalized'''
+        node, index = info_set
+        return regret_matching(self._solver.regrets[node, index]).tolist()
 
     def get_average_strategy(self, info_set):
-
-        total_prob = self._p0_total_prob[info_set]
-        total = total_prob[0] + total_prob[1] 
-
-        strategy = {}
-
-        if total > 0:
-            strategy[0] = total_prob[0] / total 
-            strategy[1] = total_prob[1] / total 
-        else:
-            strategy = [0.5, 0.5]
-
-
-        return strategy
-
-    def train(self, num_games):
-        '''Trains on an expectimax agent'''
-        
-        game = PokerGame()
-
-        p0 = self
-
-        ev_10 = ExpectimaxAgent(bet_threshold=0.1, verbose=False)
-        ev_30 = ExpectimaxAgent(bet_threshold=0.3, verbose=False)
-        ev_50 = ExpectimaxAgent(bet_threshold=0.5, verbose=False)
-        ev_70 = ExpectimaxAgent(bet_threshold=0.7, verbose=False)
-        ev_90 = ExpectimaxAgent(bet_threshold=0.9, verbose=False)
-        always = Always_Bet_Agent()
-        random = Random_Agent()
-         
-        
-        p1_agents = [ev_10, ev_30, ev_50, ev_70, ev_90, always, random]
-        n = len(p1_agents)
-
-        for i in range(num_games):
-            game.reset_game()
-            game.shuffle_deck()
-            game.deal_cards()
-
-            p0_state = game.get_state(0)
-            p1_state = game.get_state(1)
-
-            
-            p1 = p1_agents[i % n]
-            
-            if i % 2 == 0:
-                winner, margin = game.play(p0, p1, verbose=False)
-            
-            else:
-                winner, margin = game.play(p1, p0, verbose=False)
-
-            
-
+        '''Average strategy, the one the agent plays: [probability of pass/fold, probability of bet/call]'''
+        node, index = info_set
+        p_bet = float(self._strategy[node, index])
+        return [1 - p_bet, p_bet]
+
+    def train(self, iterations, target_exploitability=None):
+        '''Runs more iterations of the solver and updates the strategy played by the agent'''
+        if self._solver is None:
+            raise ValueError("A read-only or copied CFR_Agent can't be trained")
+        measurements = self._solver.solve(iterations, target_exploitability, verbose=self._verbose)
+        self._set_strategy(self._solver.average_strategy()[:, :, 1].astype(np.float32)) # Probability of betting
+        if measurements:
+            self.last_exploitability = measurements[-1][2]
+        return measurements
+
+    def save(self, path):
+        '''Save the solver's regrets and strategy sums, and the strategy played, as a checkpoint'''
+        if self._solver is None:
+            raise ValueError("A read-only or copied CFR_Agent has no solver to save")
+        save_checkpoint(path, "cfr", {"regrets": self._solver.regrets, "strategy_sums": self._solver.strategy_sums,
+                                      "strategy": self._strategy},
+                        {"plus": self._solver.plus, "iterations": self._solver.iterations,
+                         "exploitability": self.last_exploitability})
+
+    def load(self, path):
+        '''Load a checkpoint saved by save(). The tables are memory-mapped: the strategy read-only, the solver's
+        tables copy-on-write, so that training can resume from them without modifying the files'''
+        metadata = self._load_strategy(path)
+        _, tables = load_checkpoint(path, "cfr", mmap_mode="c", arrays=["regrets", "strategy_sums"])
+        self._solver.plus = metadata["plus"]
+        self._solver.iterations = metadata["iterations"]
+        self._solver.regrets = tables["regrets"]
+        self._solver.strategy_sums = tables["strategy_sums"]
+
+    def exploitability(self):
+        '''Exploitability of the strategy played, in chips per game (also for read-only and copied agents, which
+        have no solver)'''
+        tables = self._solver.tables if self._solver is not None else BoardTables()
+        p_bet = self._strategy.astype(np.float64)
+        return game_tree.exploitability(tables, np.stack([1 - p_bet, p_bet], axis=2))
 
     def take_action(self, p0_state, p1_state):
         '''Called from poker.py
-            Returns action'''
-
-
-        info_set = self.get_info_set(p0_state)
-
-        strategy = self.get_average_strategy(info_set)
-
-        strategy = [0, 0] 
-        
-        if strategy[0] > strategy[1]:
-            action = 0
-            
-        elif strategy[0] < strategy[1]:
-            action = 1
-
-        else:
-            # decide randomly
-            action = random.choice([0, 1])
-        
-        
-        self.cfr(p0_state, p1_state)
-
-        return action
-        
-
-
-    def update_stats(self, info_set, strategy, strat_val, action_values):
-        
-
-        for i in range(2):
-            self._p0_total_regret[info_set][i] += (action_values[i] - strat_val)
-            self._p0_total_prob[info_set][i] += strategy[i]
-
-
-        
-        
-    def payoff(self, p0_state, p1_state, p0_action):
-
-        p0_card, community_cards, p0_history = p0_state
-        p1_card, community_cards, p1_history = p1_state
-
-        # get p0_info_set + p1_info_set
-        p0_info_set = self.get_info_set(p0_state)
-        p1_info_set = self.get_info_set(p1_state)
-
-        # if both players have the same info set, see which one is better
-        # otherwise, the player with the better info set (hand type) wins
-
-        info_sets = [p0_info_set, p1_info_set]
-
-        winner = None
-
-        if p0_info_set == p1_info_set:
-            
-            p0_type, p0_value = poker_utils.determine_best_hand(p0_card, community_cards)
-            p1_type, p1_value = poker_utils.determine_best_hand(p1_card, community_cards)
-
-            if p0_value > p1_value:
-                winner = "p0"
-            else:
-                winner = "p1"
-
-        
-        else:
-            if "SF" in info_sets:
-                if p0_info_set == "SF":
-                    winner = "p0"
-                else:
-                    winner = "p1"
-
-            elif "P" in info_sets:
-                if p0_info_set == "P":
-                    winner = "p0"
-                else:
-                    winner = "p1"
-
-            elif "S" in info_sets:
-                if p0_info_set == "S":
-                    winner = "p0"
-                else:
-                    winner = "p1"
-
-            elif "F" in info_sets:
-                if p0_info_set == "F":
-                    winner = "p0"
-                else:
-                    winner = "p1"
-
-
-        assert(winner != None)
-
-        if p0_action == 0:
-            if winner == "p0":
-                return 1
-            else:
-                return -1
-
-        else:
-            if winner == "p0":
-                return 3
-            else:
-                return -3
-
-
-
-    def cfr(self, p0_state, p1_state):
-        
-
-        p0_card, community_cards, p0_history = p0_state
-        p1_card, community_cards, p1_history = p1_state
-
-        info_set = self.get_info_set(p0_state)
-        strategy = self.get_strategy(info_set)
-
-        strat_val = 0.0
-        action_values = [0.0, 0.0]
-
-
-
-        for i in range(2):
-            action_values[i] = self.payoff(p0_state, p1_state, i)
-            strat_val += (strategy[i] * action_values[i])
-
-        
-        # update stats
-        self.update_stats(info_set, strategy, strat_val, action_values)
-
-
+            Samples an action from the average strategy'''
+        card, community_cards, history = p0_state
+        return int(random.random() < self._bet_probability[game_tree.node_index(history) * NUM_CANONICAL_STATES + canonical_index(card, community_cards)])
+
+    def take_actions(self, states, opp_states):
+        '''batched take_action(): return an array with one action per row of the batch (see batch_poker.py)'''
+        hands, community_cards, history = states
+        p_bet = self._strategy[game_tree.node_index(history), canonical_indices(hands[:, 0], community_cards)]
+        return (np.random.random(len(p_bet)) < p_bet).astype(np.int8)
+
+    def action_probabilities(self, states):
+        '''Average strategy for a batch of states: array of shape (n, 2) (see best_response.py)'''
+        hands, community_cards, history = states
+        p_bet = self._strategy[game_tree.node_index(history), canonical_indices(hands[:, 0], community_cards)]
+        return np.stack([1 - p_bet, p_bet], axis=1)
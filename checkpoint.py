@@ -0,0 +1,83 @@
+import json
+import os
+import time
+import numpy as np
+
+# Versioned on-disk checkpoints for trained agents.
+#
+# A checkpoint is a directory with one .npy file per array, other files written by the agent (DQNAgent's torch
+# state, for example) and a manifest.json:
+#     {"format_version": 1, "kind": "cfr", "created": ..., "save": n, "metadata": {...},
+#      "arrays": {name: file, ...}, "files": {name: file, ...}}
+# Every save writes its files under new names (<name>.<n>.npy for the n-th save), which nothing references until
+# the manifest is replaced: that os.replace is the single commit point, so an interrupted save leaves the previous
+# checkpoint whole and readable. The files the new manifest doesn't reference are then deleted. Arrays are loaded
+# with np.load(mmap_mode=...), so opening a checkpoint only maps the files: pages are read when first used, and with
+# mmap_mode="c" writes go to private copies of the pages, leaving the files untouched.
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+
+
+def checkpoint_exists(path):
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def _read_manifest(path):
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, kind, arrays, metadata=None, files=None):
+    """ Save a dict of arrays and a dict of JSON serializable metadata as a checkpoint of the given kind.
+    files: optional {name: (extension, write)} of other files, write(file path) writing each one. """
+    os.makedirs(path, exist_ok=True)
+    previous = _read_manifest(path) if checkpoint_exists(path) else None
+    number = previous.get("save", 0) + 1 if previous is not None else 1
+    array_files = {}
+    for name, array in arrays.items():
+        array_files[name] = f"{name}.{number}.npy"
+        np.save(os.path.join(path, array_files[name]), np.asarray(array))
+    other_files = {}
+    for name, (extension, write) in (files or {}).items():
+        other_files[name] = f"{name}.{number}{extension}"
+        write(os.path.join(path, other_files[name]))
+    manifest = {"format_version": FORMAT_VERSION, "kind": kind, "created": time.time(), "save": number,
+                "metadata": metadata or {}, "arrays": array_files, "files": other_files}
+    temporary = os.path.join(path, f"{MANIFEST}.{os.getpid()}.tmp")
+    with open(temporary, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temporary, os.path.join(path, MANIFEST))
+
+    # Garbage: the previous save's files, and files of interrupted saves (any other save number of the same names)
+    kept = set(array_files.values()) | set(other_files.values())
+    garbage = set()
+    if previous is not None:
+        garbage.update(previous["arrays"].values(), previous.get("files", {}).values())
+    for file in os.listdir(path):
+        name, _, rest = file.partition(".")
+        if (name in array_files or name in other_files) and rest.split(".")[0].isdigit():
+            garbage.add(file)
+    for file in garbage - kept:
+        try:
+            os.remove(os.path.join(path, file))
+        except OSError:
+            pass # Still open (e.g. memory-mapped on Windows) or already gone
+
+
+def load_checkpoint(path, kind, mmap_mode="r", arrays=None, files=()):
+    """ Load a checkpoint of the given kind. Returns (metadata, dict of memory-mapped arrays); arrays selects which
+    arrays to open (all of them by default). mmap_mode is passed to np.load: "r" for read-only arrays, "c" for
+    arrays that will be modified in memory, None to read them into memory. The paths of the other files named in
+    files are added to the dict (files the checkpoint doesn't have are left out).
+    """
+    manifest = _read_manifest(path)
+    if manifest["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"{path}: checkpoint format version {manifest['format_version']}, expected {FORMAT_VERSION}")
+    if manifest["kind"] != kind:
+        raise ValueError(f"{path}: {manifest['kind']} checkpoint, expected {kind}")
+    names = manifest["arrays"] if arrays is None else arrays
+    loaded = {name: np.load(os.path.join(path, manifest["arrays"][name]), mmap_mode=mmap_mode) for name in names}
+    other_files = manifest.get("files", {})
+    loaded.update({name: os.path.join(path, other_files[name]) for name in files if name in other_files})
+    return manifest["metadata"], loaded
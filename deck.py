@@ -1,69 +1,121 @@
-import itertools as it
 import random
 
+# Cards are plain integers 0..51: card = (rank - 1) << 2 | suit, with ranks 1 (Ace) to 13 (King)
+# and suits indexed 0..3 in the order below. The rank and suit of a card are read with a shift and a mask,
+# so the game, the evaluators and the agents never need to allocate card objects.
+NUM_CARDS = 52
+RANKS = range(1, 14) #Ace to King
+SUITS = ['S', 'H', 'D', 'C'] #Spades, Hearts, Diamonds, Clubs
+SUIT_INDEX = {suit: i for i, suit in enumerate(SUITS)}
+FULL_DECK = tuple(range(NUM_CARDS)) #A fresh deck, ordered by rank then suit
+
+def make_card(rank, suit):
+    """ Return the integer card of the given rank (an integer) and suit (a character). """
+    return (rank - 1) << 2 | SUIT_INDEX[suit]
+
+def card_rank(card):
+    """ Return the rank (1..13) of an integer card. """
+    return (card >> 2) + 1
+
+def card_suit(card):
+    """ Return the suit index (0..3) of an integer card. """
+    return card & 3
+
+def to_cards(cards):
+    """ Wrap a list of integer cards in Card objects, e.g. for printing. """
+    return [Card.from_index(card) for card in cards]
+
+
 class Card:
+    """ Display/compatibility wrapper around an integer card. """
+    __slots__ = ('_index',)
+
     def __init__(self, rank, suit):
         """ Creates a card of the given rank and suit.
 
             rank -- an integer
             suit -- a character
         """
-        self._rank = rank
-        self._suit = suit
-        self._hash = str(self).__hash__() #Create a hash value from the string representation of the object
-            
+        self._index = make_card(rank, suit)
 
-    def rank(self):
-        return self._rank
+    @classmethod
+    def from_index(cls, index):
+        """ Creates the card for an integer card (0..51). """
+        card = cls.__new__(cls)
+        card._index = index
+        return card
 
+    def rank(self):
+        return (self._index >> 2) + 1
 
     def suit(self):
-        return self._suit
+        return SUITS[self._index & 3]
+
+    def index(self):
+        return self._index
 
     #Check if 2 cards have same suit
     def same_suit(self, other):
-        return self._suit == other._suit
-
+        return (self._index & 3) == (other._index & 3)
 
     def __repr__(self):
-        return "" + str(self._rank) + str(self._suit)
+        return "" + str(self.rank()) + str(self.suit())
 
     #Check if 2 cards are the same with ==
     def __eq__(self, other):
-        return self._rank == other._rank and self._suit == other._suit
-
+        return self._index == other._index
 
     def __hash__(self):
-        return self._hash
+        return self._index
+
+    #Lets a Card be used wherever an integer card is expected
+    def __index__(self):
+        return self._index
+
 
 # Standard 52 card deck
 class Deck:
-    #Creates a list of Card objects (for each card in a deck)
+    """ A deck of integer cards. The top of the deck is the end of the list.
+
+        Shuffling is lazy: shuffle() only marks the deck as unshuffled, and each card is drawn into place with one
+        Fisher-Yates step when it is dealt or peeked at. Dealing the 5 cards of a game therefore costs 5 random
+        draws instead of a 52 card shuffle, while every deal is still a uniformly random permutation of the deck.
+    """
+    __slots__ = ('_cards', '_unshuffled')
+
     def __init__(self):
-        """ Creates a standard deck of 52 cards including the given number of copies
-            of each possible combination of the given ranks and the
-            given suits.
-        """
-        self._cards = []
-        self._ranks = range(1, 14) #Ace to King
-        self._suits = ['S', 'H', 'D', 'C'] #Spades, Hearts, Diamonds, Clubs
-        self._cards.extend(map(lambda c: Card(*c), it.product(self._ranks, self._suits))) #Create a cartesian product of rank & suit (becomes a tuple), pass each one of those into the map that unpacks the tuple and creates a card out of it
+        """ Creates a standard deck of 52 cards, ordered by rank then suit. """
+        self._cards = list(FULL_DECK)
+        self._unshuffled = 0 #The first _unshuffled cards (bottom of the deck) are still waiting to be shuffled
 
-    #Shuffle the list of cards      
+    #Shuffle the list of cards
     def shuffle(self):
         """ Shuffles this deck. """
-        random.shuffle(self._cards)
+        self._unshuffled = len(self._cards)
+
+    def _draw(self, n):
+        """ Finish shuffling the top n cards of this deck. """
+        cards = self._cards
+        i = self._unshuffled
+        top = len(cards) - n
+        while i > top:
+            #Swap a uniformly random card that is still unshuffled into the lowest finished position
+            i -= 1
+            j = random.randrange(i + 1)
+            cards[i], cards[j] = cards[j], cards[i]
+        self._unshuffled = i
 
     def size(self):
         """ Returns the number of cards remaining in this deck. """
         return len(self._cards)
-    
 
     def deal(self, n):
         """ Removes and returns the next n cards from this deck.
 
             n -- an integer between 0 and the size of this deck (inclusive)
         """
+        if self._unshuffled > len(self._cards) - n:
+            self._draw(n)
         dealt = self._cards[-n:] #The "Top" of the deck is the end of the list
         dealt.reverse() #Order it so that top card is first, top-nth card is last
         del self._cards[-n:] #Remove those cards from the deck
@@ -74,38 +126,29 @@ class Deck:
 
             n -- an integer between 0 and the size of this deck (inclusive)
         """
+        if self._unshuffled > len(self._cards) - n:
+            self._draw(n)
         dealt = self._cards[-n:]
         dealt.reverse()
         return dealt
 
-            
     def remove(self, cards):
         """ Removes the given cards from this deck.  If there is a card
             to remove that isn't present in this deck, then the effect is
             the same as if that card had not been included in the list to
-            remove.  If there are multiple occurrences of a given card
-            in the list to remove, then the corresponding number of occurrences
-            of that card in this deck are removed.
+            remove.
 
-            cards -- an iterable over Cards
+            cards -- an iterable over integer cards
         """
-        #Keep track of how many time each card occurs in the cards to remove list
-        counts = dict()
-        for card in cards:
-            if card not in counts:
-                counts[card] = 0
-            counts[card] += 1
-
-        #Remove the cards from the deck and return the modified deck
-        remaining = []
-        for card in self._cards:
-            if card in counts and counts[card] > 0:
-                counts[card] -= 1
-            else:
-                remaining.append(card)
+        #A deck never holds the same card twice, so a set is enough to know what to remove
+        removed = set(cards)
+        unshuffled = self._unshuffled
+        remaining = [card for card in self._cards[:unshuffled] if card not in removed]
+        self._unshuffled = len(remaining)
+        remaining.extend(card for card in self._cards[unshuffled:] if card not in removed)
         self._cards = remaining
 
     # Reset the deck back to original state
     def reset(self):
-        self._cards = []
-        self._cards.extend(map(lambda c: Card(*c), it.product(self._ranks, self._suits))) #Create a cartesian product of rank & suit (becomes a tuple), pass each one of those into the map that unpacks the tuple and creates a card out of it
+        self._cards[:] = FULL_DECK
+        self._unshuffled = 0
@@ -1,23 +1,27 @@
 import torch
-from dqn_utils import DQNNetwork, ReplayBuffer, encode_hand
+from dqn_utils import DQNNetwork, InferenceNetwork, ReplayBuffer, StateEncoder, STATE_SIZE, MAX_BETTING_HISTORY
 import torch.optim as optim
 import torch.nn as nn
 import numpy as np  
 import random
-from deck import Card
-from poker_utils import determine_best_hand
+import os
+from checkpoint import save_checkpoint, load_checkpoint
+from deck import to_cards
 
 class DQNAgent:
-    def __init__(self, state_size=213, action_size=2, epsilon=1, alpha=1e-4, gamma=0.99, tau=.005, buffer_size=10000, batch_size=64, verbose=False):
+    def __init__(self, state_size=STATE_SIZE, action_size=2, epsilon=1, alpha=1e-4, gamma=0.99, tau=.005, buffer_size=10000, batch_size=64, prioritized_replay=False, verbose=False):
         self.state_size = state_size
         self.action_size = action_size
+        # Constructor arguments, saved in checkpoints
+        self.config = dict(state_size=state_size, action_size=action_size, epsilon=epsilon, alpha=alpha, gamma=gamma, tau=tau,
+                           buffer_size=buffer_size, batch_size=batch_size, prioritized_replay=prioritized_replay)
         self.gamma = gamma
         self.epsilon = epsilon 
         self.epsilon_start = epsilon
         self.epsilon_decay = 0.999
         self.epsilon_min = 0.05
         self.alpha = alpha
-        self.max_betting_history = 3
+        self.max_betting_history = MAX_BETTING_HISTORY
         self.tau = tau
         self.steps = 0
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -29,7 +33,10 @@ class DQNAgent:
         self.target_network.eval()  # Target network will not be trained
 
         self.optimizer = optim.AdamW(self.network.parameters(), lr= self.alpha, amsgrad=True)
-        self.memory = ReplayBuffer(buffer_size, batch_size)
+        self.memory = ReplayBuffer(buffer_size, batch_size, state_size, prioritized=prioritized_replay, device=self.device)
+        self.encoder = StateEncoder()
+        self.inference_backend = None # Set by freeze()
+        self._inference = None
 
     def step(self, state, action, reward, next_state, done):
         self.memory.add(state, action, reward, next_state, done)
@@ -53,42 +60,58 @@ class DQNAgent:
 
     def get_state(self, state):
         player_hand, community_cards, betting_history = state
-            # Determine the best hand
-        best_hand_type, best_hand_value = determine_best_hand(player_hand, community_cards)
-        
-        if isinstance(best_hand_value, (list, tuple)):
-            best_hand_value = max(best_hand_value)  # Example: choose the highest value
-
-        
-        player_hand_vector = encode_hand(player_hand)
-        community_cards_vector = encode_hand(community_cards)
-
-        # Include the type and value of the best hand in the state vector
-        best_hand_vector = np.array([best_hand_type, best_hand_value])  # Convert to float if necessary
-
-        # Betting history
-        betting_history_vector = np.pad(betting_history, 
-                                (0, self.max_betting_history - len(betting_history)), 
-                                'constant', 
-                                constant_values=-1)
-
-
-        # Concatenate all parts to form the state vector
-        state_vector = np.concatenate([player_hand_vector, community_cards_vector, best_hand_vector, betting_history_vector])
+        state_vector = self.encoder.encode_one(player_hand, community_cards, betting_history).copy()
         if self.verbose:
-            print(f"Hand: {player_hand}, {best_hand_value}\nCommunity: {community_cards}\nBetting History: {betting_history}")
+            print(f"Hand: {to_cards(player_hand)}, {state_vector[209]:.0f}\nCommunity: {to_cards(community_cards)}\nBetting History: {betting_history}")
         return state_vector
+
+    def encode_states(self, states):
+        """ Batched get_state(): states is (hands (n, 1), community cards (n, 3), betting history or histories), see
+        StateEncoder. Returns a view of the encoder's buffer, overwritten by the next call. """
+        hands, community_cards, betting_history = states
+        return self.encoder.encode(hands, community_cards, betting_history)
     
     def update_epsilon(self):
         self.epsilon = self.epsilon_min + (self.epsilon_start - self.epsilon_min) * np.exp(-1 * self.steps / self.epsilon_decay)
 
     
+    def freeze(self, backend="torchscript"):
+        """ Act with a frozen copy of the network (see InferenceNetwork). backend is "torchscript", "compile" or
+        "numpy". A learning step invalidates the copy, and the next take_action builds a new one with the same
+        backend (each rebuild costs a trace or compile with the torch backends). """
+        self.inference_backend = backend
+        self._inference = InferenceNetwork(self.network, backend)
+
+    def _frozen(self):
+        # The frozen copy isn't pickled: agents sent to other processes build theirs again
+        if self._inference is None and self.inference_backend is not None:
+            self._inference = InferenceNetwork(self.network, self.inference_backend)
+        return self._inference
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_inference"] = None
+        return state
+
     def take_action(self, state_tuple, opp_state):
+        inference = self._frozen()
+        if inference is not None:
+            # Encoded in place in the encoder's buffer, with no tensor or copy made per decision
+            self.update_epsilon()
+            self.steps += 1
+            state_vector = self.get_state(state_tuple) if self.verbose else self.encoder.encode_one(*state_tuple)
+            if random.random() > self.epsilon:
+                action = int(inference(state_vector[None]).argmax())
+            else:
+                action = random.randrange(self.action_size)
+            if self.verbose: print(f"Action: {action}")
+            return action
+
         # Process the state tuple to get a flat, numeric vector
         state_vector = self.get_state(state_tuple)
         
         # Convert the state vector to a PyTorch tensor
-        state_tensor = torch.from_numpy(state_vector.astype(np.float32)).unsqueeze(0).to(self.device)
+        state_tensor = torch.from_numpy(state_vector).unsqueeze(0).to(self.device)
         self.network.eval()
         self.update_epsilon()
         with torch.no_grad():
@@ -100,24 +123,54 @@ class DQNAgent:
         if self.verbose: print(f"Action: {action}")
         # self.update_epsilon()
         return action
+
+    def q_values(self, states):
+        """ Q-values of a batch of states (see encode_states), as a numpy array of shape (n, action_size) """
+        inference = self._frozen()
+        if inference is not None:
+            return inference(self.encode_states(states))
+        state_tensor = torch.from_numpy(self.encode_states(states)).to(self.device)
+        self.network.eval()
+        with torch.no_grad():
+            action_values = self.network(state_tensor)
+        self.network.train()
+        return action_values.cpu().numpy()
+
+    def take_actions(self, states, opp_states):
+        """ batched take_action(): return an array with one action per row of the batch (see batch_poker.py) """
+        greedy = self.q_values(states).argmax(axis=1)
+        self.steps += len(greedy)
+        self.update_epsilon()
+        explore = np.random.random(len(greedy)) <= self.epsilon
+        return np.where(explore, np.random.randint(0, self.action_size, size=len(greedy)), greedy).astype(np.int8)
+
+    def action_probabilities(self, states):
+        """ Probabilities of each action for a batch of states under the current epsilon-greedy policy (see best_response.py) """
+        greedy = self.q_values(states).argmax(axis=1)
+        probabilities = np.full((len(greedy), self.action_size), self.epsilon / self.action_size)
+        probabilities[np.arange(len(greedy)), greedy] += 1 - self.epsilon
+        return probabilities
         
     def learn(self, experiences):
-        states, actions, rewards, next_states, dones = zip(*experiences)
-        states = torch.from_numpy(np.vstack(states)).float().to(self.device)
-        actions = torch.from_numpy(np.vstack(actions)).long().to(self.device)
-        rewards = torch.from_numpy(np.vstack(rewards)).float().to(self.device)
-        next_states = torch.from_numpy(np.vstack(next_states)).float().to(self.device)
-        dones = torch.from_numpy(np.vstack(dones).astype(np.uint8)).float().to(self.device)
+        """ experiences is a Batch of tensors sampled from self.memory (see ReplayBuffer) """
+        states, actions, rewards, next_states, dones, weights, indices = experiences
 
         Q_targets_next = self.target_network(next_states).detach().max(1)[0].unsqueeze(1)
         Q_targets = rewards + (self.gamma * Q_targets_next * (1 - dones))
 
         Q_expected = self.network(states).gather(1, actions)
 
-        loss = nn.MSELoss()(Q_expected, Q_targets)
+        if weights is None:
+            loss = nn.MSELoss()(Q_expected, Q_targets)
+        else:
+            # Prioritized replay: importance sampling weighted loss, and new priorities from the TD errors
+            td_errors = Q_targets - Q_expected
+            loss = (weights * td_errors.pow(2)).mean()
+            self.memory.update_priorities(indices, td_errors.detach().cpu().numpy()[:, 0])
         self.optimizer.zero_grad()
         loss.backward()
         self.optimizer.step()
+        self._inference = None # The frozen copy is out of date: rebuilt with the same backend on the next take_action
 
         self.epsilon = max(self.epsilon_min, self.epsilon_decay * self.epsilon)
 
@@ -129,6 +182,39 @@ class DQNAgent:
             target_param.data.copy_(self.tau*local_param.data + (1.0-self.tau)*target_param.data)
 
 
+    def save(self, path, replay=False):
+        """ Save the networks, the optimizer and the exploration schedule as a checkpoint (see checkpoint.py), and the
+        replay memory too if replay is True. """
+        arrays = self.memory.arrays() if replay else {}
+        metadata = dict(config=self.config, epsilon=self.epsilon, steps=self.steps, replay=replay,
+                        replay_cursor=self.memory._cursor, replay_size=len(self.memory), max_priority=float(self.memory._max_priority))
+        state = {"network": self.network.state_dict(), "target_network": self.target_network.state_dict(),
+                 "optimizer": self.optimizer.state_dict()}
+        # The torch state is one of the checkpoint's files, so it is committed with the manifest like the arrays
+        save_checkpoint(path, "dqn", arrays, metadata, files={"dqn": (".pt", lambda file: torch.save(state, file))})
+
+    def load(self, path, replay=True):
+        """ Load a checkpoint saved by save(). The replay memory, if saved and replay is True, is memory-mapped
+        copy-on-write, so training can resume without modifying the files. """
+        metadata, arrays = load_checkpoint(path, "dqn", mmap_mode="c", arrays=[] if not replay else None, files=["dqn"])
+        state = torch.load(arrays.pop("dqn", os.path.join(path, "dqn.pt")), map_location=self.device) # dqn.pt: older checkpoints
+        self.network.load_state_dict(state["network"])
+        self.target_network.load_state_dict(state["target_network"])
+        self.optimizer.load_state_dict(state["optimizer"])
+        self.epsilon = metadata["epsilon"]
+        self.steps = metadata["steps"]
+        if replay and metadata["replay"]:
+            self.memory.restore(arrays, metadata["replay_cursor"], metadata["replay_size"], metadata["max_priority"])
+        self._inference = None
+
+    @classmethod
+    def from_checkpoint(cls, path, replay=True, verbose=False):
+        """ Return a DQNAgent with the constructor arguments and state of a checkpoint. """
+        metadata, _ = load_checkpoint(path, "dqn", arrays=[])
+        agent = cls(**metadata["config"], verbose=verbose)
+        agent.load(path, replay)
+        return agent
+
     def __str__(self):
         return "DQN Agent"
     
\ No newline at end of file
@@ -0,0 +1,133 @@
+import random
+import time
+from collections import namedtuple
+import numpy as np
+import torch
+import torch.nn as nn
+import canonical
+import game_tree
+import showdown_table
+from dqn_utils import DQNNetwork, StateEncoder
+
+# Compact stand-ins for a trained DQNAgent, for fast evaluation on CPUs.
+#
+# QuantizedDQNPolicy: the agent's network with its Linear layers dynamically quantized to int8.
+# TabularDQNPolicy: the agent's greedy action for each (decision node, canonical state), distilled into an int8
+# table of NUM_NODES x NUM_CANONICAL_STATES entries (about 250KB) and read with one index per decision.
+#
+# Both play the greedy action of the distilled Q-values (plus epsilon-greedy exploration if epsilon > 0), and both
+# have take_action() and take_actions(), so they can replace the agent in PokerGame.play or batch_poker.py.
+# compare_policies() measures how often a compact policy agrees with the agent and how much faster it decides.
+
+
+class QuantizedDQNPolicy:
+    def __init__(self, agent, epsilon=0.0):
+        network = DQNNetwork(agent.state_size, agent.action_size)
+        network.load_state_dict(agent.network.state_dict())
+        network.eval()
+        self.network = torch.ao.quantization.quantize_dynamic(network, {nn.Linear}, dtype=torch.qint8)
+        self.epsilon = epsilon
+        self.encoder = StateEncoder()
+
+    def __str__(self):
+        return "DQN Agent (int8)"
+
+    def q_values(self, states):
+        """ Q-values of a batch of states (see DQNAgent.encode_states), shape (n, 2) """
+        hands, community_cards, history = states
+        with torch.inference_mode():
+            return self.network(torch.from_numpy(self.encoder.encode(hands, community_cards, history))).numpy()
+
+    def take_action(self, state, opp_state):
+        if self.epsilon and random.random() < self.epsilon:
+            return random.randrange(2)
+        with torch.inference_mode():
+            action_values = self.network(torch.from_numpy(self.encoder.encode_one(*state)[None]))
+        return int(action_values.argmax())
+
+    def take_actions(self, states, opp_states):
+        actions = self.q_values(states).argmax(axis=1).astype(np.int8)
+        if self.epsilon:
+            explore = np.random.random(len(actions)) < self.epsilon
+            actions[explore] = np.random.randint(0, 2, size=int(explore.sum()))
+        return actions
+
+
+class TabularDQNPolicy:
+    """ Greedy actions of a DQNAgent per (decision node, canonical state).
+
+    The DQN input depends on suit labels, so its greedy action can differ between the deals of a canonical state.
+    With relabelings=1 the table takes the action of the canonical representative; with more, it takes the argmax
+    of the Q-values averaged over that many random suit relabelings of the representative.
+    """
+    def __init__(self, agent, relabelings=1, batch_size=1 << 14, seed=0, epsilon=0.0):
+        rng = np.random.default_rng(seed)
+        hands = canonical.STATE_HOLES.astype(np.int64)
+        community_cards = canonical.CANONICAL_BOARD_CARDS.astype(np.int64)[canonical.STATE_BOARDS]
+        q_values = np.zeros((game_tree.NUM_NODES, len(hands), agent.action_size))
+        for r in range(relabelings):
+            # The first pass uses the representative itself, the others a random permutation of the suits per state
+            permutations = np.zeros(len(hands), dtype=np.int64) if r == 0 else rng.integers(0, len(canonical.SUIT_PERMUTATIONS), len(hands))
+            relabeled_hands = canonical.PERMUTED_CARDS[permutations, hands].astype(np.int64)[:, None]
+            relabeled_community = canonical.PERMUTED_CARDS[permutations[:, None], community_cards].astype(np.int64)
+            for node, history in enumerate(game_tree.NODE_HISTORIES):
+                for start in range(0, len(hands), batch_size):
+                    rows = slice(start, start + batch_size)
+                    q_values[node, rows] += agent.q_values((relabeled_hands[rows], relabeled_community[rows], history))
+        self.actions = q_values.argmax(axis=2).astype(np.int8)
+        self._actions = self.actions.tolist()
+        self.epsilon = epsilon
+
+    def __str__(self):
+        return "DQN Agent (tabular)"
+
+    def take_action(self, state, opp_state):
+        if self.epsilon and random.random() < self.epsilon:
+            return random.randrange(2)
+        hand, community_cards, history = state
+        return self._actions[game_tree.node_index(history)][canonical.canonical_index(hand, community_cards)]
+
+    def take_actions(self, states, opp_states):
+        hands, community_cards, history = states
+        actions = self.actions[game_tree.node_index(history), canonical.canonical_indices(hands[:, 0], community_cards)]
+        if self.epsilon:
+            actions = actions.copy()
+            explore = np.random.random(len(actions)) < self.epsilon
+            actions[explore] = np.random.randint(0, 2, size=int(explore.sum()))
+        return actions
+
+
+Comparison = namedtuple("Comparison", ["agreement", "agent_us", "policy_us", "speedup"])
+
+def compare_policies(agent, policy, num_states=100000, num_timed=5000, seed=0):
+    """ Compare a compact policy with the DQNAgent it was made from, on random (decision node, deal) states.
+
+    agreement is the fraction of num_states states where the policy's action is the agent's greedy action.
+    agent_us and policy_us are the average time of one take_action() call, on num_timed states (the agent with
+    its own exploration and inference settings), and speedup is their ratio. The agent's steps and epsilon are left
+    as they were.
+    """
+    rng = np.random.default_rng(seed)
+    cards = np.argsort(rng.random((num_states, showdown_table.NUM_CARDS)), axis=1)[:, :4]
+    hands, community_cards = cards[:, :1], cards[:, 1:]
+    nodes = rng.integers(0, game_tree.NUM_NODES, num_states)
+
+    agree = 0
+    for node, history in enumerate(game_tree.NODE_HISTORIES):
+        rows = nodes == node
+        states = (hands[rows], community_cards[rows], history)
+        greedy = agent.q_values(states).argmax(axis=1)
+        agree += int((np.asarray(policy.take_actions(states, None)) == greedy).sum())
+
+    timed = [(hands[i].tolist(), community_cards[i].tolist(), list(game_tree.NODE_HISTORIES[nodes[i]])) for i in range(min(num_timed, num_states))]
+    times = []
+    steps, epsilon = agent.steps, agent.epsilon # take_action() counts steps and decays epsilon: put them back after
+    try:
+        for player in (agent, policy):
+            start = time.perf_counter()
+            for state in timed:
+                player.take_action(state, None)
+            times.append((time.perf_counter() - start) / len(timed) * 1e6)
+    finally:
+        agent.steps, agent.epsilon = steps, epsilon
+    return Comparison(agree / num_states, times[0], times[1], times[0] / times[1])
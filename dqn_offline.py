@@ -0,0 +1,152 @@
+import queue
+import threading
+import time
+import numpy as np
+import torch
+from dqn_utils import Batch, StateEncoder
+from hand_history import read_chunks
+
+# Train a DQNAgent offline, from games recorded with hand_history.py.
+#
+# Each recorded game gives one transition per decision of the player in a seat (like VectorPokerEnv in
+# dqn_train.py): the state when it acts, its action, and either its state at its next decision (reward 0) or the
+# final state of the game (its chips, done). A background thread reads the file, shuffles the transitions of
+# shuffle_size games at a time, encodes them and queues ready-made minibatches, so learning never waits on the disk.
+
+
+def game_transitions(records, seat):
+    """ Return the transitions of the player in seat (0 or 1) in an array of game records, as
+    (hands (n, 1), community cards (n, 3), histories (n, 3), actions, rewards, next histories (n, 3), dones).
+    """
+    histories = records["history"].astype(np.int64)
+    lengths = (histories >= 0).sum(axis=1)
+    columns = np.arange(3)
+    parts = []
+    # P0 acts at positions 0 and 2 of the history, P1 at position 1
+    for position in range(seat, 3, 2):
+        rows = np.nonzero(lengths > position)[0]
+        done = lengths[rows] <= position + 2 # No later decision for this player
+        state = np.where(columns < position, histories[rows], -1)
+        next_state = np.where(done[:, None] | (columns < position + 2), histories[rows], -1)
+        margin = records["margin"][rows].astype(np.float32)
+        reward = np.where(done, margin if seat == 0 else -margin, 0)
+        parts.append((rows, state, histories[rows, position], reward, next_state, done))
+    rows, states, actions, rewards, next_states, dones = (np.concatenate(arrays) for arrays in zip(*parts))
+    hands = records["hands"][rows, seat].astype(np.int64)[:, None]
+    community_cards = records["community"][rows].astype(np.int64)
+    return hands, community_cards, states, actions, rewards, next_states, dones
+
+
+def _put(batches, item, stop):
+    """ Put an item in the queue, waiting for room until stop is set. Returns False if stopped first. """
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+class OfflineLoader:
+    """ Iterate over minibatches (dqn_utils.Batch) of the transitions of recorded games, for DQNAgent.learn.
+
+    The file is read and encoded by a background thread that keeps up to prefetch minibatches ready.
+    seats: the seats whose decisions are learned from.
+    """
+    def __init__(self, path, batch_size=64, seats=(0, 1), shuffle_size=1 << 16, prefetch=64, seed=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.seats = seats
+        self.shuffle_size = shuffle_size
+        self.prefetch = prefetch
+        self._rng = np.random.default_rng(seed)
+
+    def _games(self):
+        """ Yield shuffled arrays of about shuffle_size game records. """
+        pending, count = [], 0
+        for records in read_chunks(self.path):
+            pending.append(records)
+            count += len(records)
+            if count >= self.shuffle_size:
+                yield self._rng.permutation(np.concatenate(pending))
+                pending, count = [], 0
+        if pending:
+            yield self._rng.permutation(np.concatenate(pending))
+
+    def _produce(self, batches, stop):
+        encoder = StateEncoder()
+        try:
+            for records in self._games():
+                transitions = [game_transitions(records, seat) for seat in self.seats]
+                hands, community_cards, states, actions, rewards, next_states, dones = (np.concatenate(arrays) for arrays in zip(*transitions))
+                order = self._rng.permutation(len(actions))
+                state_vectors = encoder.encode(hands[order], community_cards[order], states[order]).copy()
+                next_vectors = encoder.encode(hands[order], community_cards[order], next_states[order]).copy()
+                actions = actions[order][:, None]
+                rewards = rewards[order].astype(np.float32)[:, None]
+                dones = dones[order].astype(np.float32)[:, None]
+                for start in range(0, len(order) - self.batch_size + 1, self.batch_size):
+                    rows = slice(start, start + self.batch_size)
+                    batch = Batch(torch.from_numpy(state_vectors[rows]), torch.from_numpy(actions[rows]),
+                                  torch.from_numpy(rewards[rows]), torch.from_numpy(next_vectors[rows]),
+                                  torch.from_numpy(dones[rows]), None, None)
+                    if not _put(batches, batch, stop):
+                        return
+        except Exception as error:
+            if not _put(batches, error, stop):
+                return
+        _put(batches, None, stop)
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(batches, stop), daemon=True)
+        producer.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            producer.join()
+
+
+def train_offline(agent, path, epochs=1, seats=(0, 1), shuffle_size=1 << 16, max_steps=None, report_every=5.0, seed=None, verbose=False):
+    """ Train a DQNAgent on the games recorded in a hand history file, epochs passes over the file (at most max_steps
+    gradient steps in total), with agent.memory.batch_size transitions per gradient step.
+    Returns a list of (gradient steps, transitions, seconds, gradient steps/s, seconds spent waiting for data)
+    measurements, one every report_every seconds and one at the end.
+    """
+    loader = OfflineLoader(path, agent.memory.batch_size, seats, shuffle_size, seed=seed)
+    device = agent.device
+    steps = waiting = 0
+    start = last_report = time.perf_counter()
+    measurements = []
+
+    def report():
+        seconds = time.perf_counter() - start
+        measurements.append((steps, steps * loader.batch_size, seconds, steps / seconds, waiting))
+        if verbose:
+            print(f"{steps} gradient steps ({steps / seconds:.0f}/s), {steps * loader.batch_size} transitions, {waiting:.1f}s waiting for data")
+
+    for epoch in range(epochs):
+        batches = iter(loader)
+        while max_steps is None or steps < max_steps:
+            before = time.perf_counter()
+            batch = next(batches, None)
+            waiting += time.perf_counter() - before
+            if batch is None:
+                break
+            agent.learn(Batch(*(tensor.to(device) if tensor is not None else None for tensor in batch)))
+            steps += 1
+            if time.perf_counter() - last_report >= report_every:
+                last_report = time.perf_counter()
+                report()
+        batches.close()
+    report()
+    return measurements
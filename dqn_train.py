@@ -0,0 +1,150 @@
+import time
+import numpy as np
+from batch_poker import BatchPokerGame, batch_policy
+from game_tree import NODE_PLAYERS, NUM_ACTIONS, BLIND, BET
+
+# Train a DQNAgent against a fixed opponent in many games at once.
+#
+# VectorPokerEnv keeps num_envs games of PokerGame in arrays and advances all of them in lockstep. Each env is a
+# game from the point of view of the learning agent, which sits in seat 0 or 1 (alternating from game to game):
+# the opponent's actions are played inside the env, so every step is one decision of the agent in every env.
+#
+# Betting tree transitions, indexed by node * 2 + action (see game_tree.py for the nodes):
+#     NEXT_NODE: the node reached, or -1 for a terminal history
+#     FOLD_PAYOFF: P0's chips when the action is a fold (0 otherwise)
+#     SHOWDOWN_STAKE: chips at stake when the action leads to a showdown (0 otherwise)
+NEXT_NODE = np.array([1, 2, -1, 3, -1, -1, -1, -1])
+FOLD_PAYOFF = np.array([0, 0, 0, 0, BLIND, 0, -BLIND, 0])
+SHOWDOWN_STAKE = np.array([0, 0, BLIND, 0, 0, BLIND + BET, 0, BLIND + BET])
+_node_players = np.array(NODE_PLAYERS)
+
+
+class VectorPokerEnv:
+    """ num_envs games against opponent (an agent with take_actions() or take_action()), played in lockstep.
+
+    States are batched like batch_poker.py, with one betting history per row: (hands (n, 1), community cards (n, 3),
+    histories (n, 3) padded with -1), which is what DQNAgent.encode_states takes.
+    """
+    def __init__(self, opponent, num_envs=64, seed=None):
+        self.opponent = batch_policy(opponent)
+        self.num_envs = num_envs
+        self._game = BatchPokerGame(seed)
+        self.hands = np.zeros((num_envs, 2), dtype=np.int64)
+        self.community_cards = np.zeros((num_envs, 3), dtype=np.int64)
+        self.histories = np.full((num_envs, 3), -1, dtype=np.int64)
+        self.lengths = np.zeros(num_envs, dtype=np.int64)
+        self.nodes = np.zeros(num_envs, dtype=np.int64)
+        self.seats = np.arange(num_envs) % 2 # Seat of the learning agent
+        self.games = 0
+        self._reset(np.arange(num_envs))
+
+    def observe(self, rows=slice(None)):
+        """ Return the learning agent's states in the given envs. """
+        seats = self.seats[rows]
+        return (np.take_along_axis(self.hands[rows], seats[:, None], axis=1), self.community_cards[rows], self.histories[rows])
+
+    def step(self, actions):
+        """ Apply the learning agent's actions in every env, then let the opponent act until it is the agent's turn
+        again or the game is over. Finished games are replaced by new ones.
+        Returns:
+            next states: the agent's states after the step (the final state for finished games)
+            rewards: the agent's chips, nonzero only for finished games
+            dones: bool array, True for finished games
+            states: the agent's states to act on in the next step (new games for finished ones)
+        """
+        everyone = np.arange(self.num_envs)
+        rewards = self._apply(everyone, actions)
+        rewards += self._play_opponent()
+        dones = self.nodes < 0
+        next_states = tuple(array.copy() for array in self.observe())
+        finished = np.nonzero(dones)[0]
+        self._reset(finished)
+        return next_states, rewards, dones, self.observe()
+
+    def _apply(self, rows, actions):
+        """ Apply actions in the given envs, return the learning agent's chips for the games they end. """
+        transitions = self.nodes[rows] * NUM_ACTIONS + actions
+        self.histories[rows, self.lengths[rows]] = actions
+        self.lengths[rows] += 1
+        self.nodes[rows] = NEXT_NODE[transitions]
+
+        p0_chips = FOLD_PAYOFF[transitions].copy()
+        showdown = np.nonzero(SHOWDOWN_STAKE[transitions])[0]
+        if len(showdown):
+            showdown_rows = rows[showdown]
+            winners = self._game.showdown(self.hands[showdown_rows], self.community_cards[showdown_rows])
+            p0_chips[showdown] = winners * SHOWDOWN_STAKE[transitions[showdown]]
+        return np.where(self.seats[rows] == 0, p0_chips, -p0_chips)
+
+    def _play_opponent(self):
+        """ Let the opponent act wherever it is its turn, return the learning agent's chips for the games that end. """
+        rewards = np.zeros(self.num_envs, dtype=np.int64)
+        while True:
+            waiting = np.nonzero((self.nodes >= 0) & (_node_players[self.nodes] != self.seats))[0]
+            if not len(waiting):
+                return rewards
+            # The opponent is asked once per node, since take_actions() takes one history per call
+            for node in np.unique(self.nodes[waiting]):
+                rows = waiting[self.nodes[waiting] == node]
+                seats = 1 - self.seats[rows]
+                history = self.histories[rows[0], :self.lengths[rows[0]]].tolist()
+                state = (np.take_along_axis(self.hands[rows], seats[:, None], axis=1), self.community_cards[rows], history)
+                opp_state = (np.take_along_axis(self.hands[rows], 1 - seats[:, None], axis=1), self.community_cards[rows], history)
+                actions = np.asarray(self.opponent.take_actions(state, opp_state), dtype=np.int64)
+                rewards[rows] += self._apply(rows, actions)
+
+    def _reset(self, rows):
+        """ Deal new games in the given envs, switching the agent's seat, and play the opponent's first action. """
+        if not len(rows):
+            return
+        self.hands[rows], self.community_cards[rows] = self._game.deal_cards(len(rows))
+        self.histories[rows] = -1
+        self.lengths[rows] = 0
+        self.nodes[rows] = 0
+        self.seats[rows] = (self.seats[rows] + (self.games > 0)) % 2
+        self.games += len(rows)
+        self._play_opponent()
+
+
+def train_dqn(agent, opponent, num_steps, num_envs=64, replay_ratio=0.125, report_every=5.0, seed=None, verbose=False):
+    """ Train a DQNAgent against opponent for num_steps lockstep steps of num_envs envs.
+
+    Every step picks the agent's actions in all envs with one batched forward pass, adds the num_envs transitions
+    to the agent's replay memory in one call, and runs replay_ratio gradient steps (agent.learn) per transition.
+    Returns a list of (env steps, gradient steps, seconds, env steps/s, gradient steps/s, average reward per
+    finished game) measurements, one every report_every seconds and one at the end.
+    """
+    env = VectorPokerEnv(opponent, num_envs, seed)
+    memory = agent.memory
+    states = env.observe()
+    env_steps = gradient_steps = 0
+    credit = 0.0
+    total_reward = games = 0
+    start = last_report = time.perf_counter()
+    measurements = []
+    for step in range(1, num_steps + 1):
+        actions = np.asarray(agent.take_actions(states, None), dtype=np.int64)
+        state_vectors = agent.encode_states(states).copy()
+        next_states, rewards, dones, states = env.step(actions)
+        memory.add_batch(state_vectors, actions, rewards, agent.encode_states(next_states), dones)
+        env_steps += num_envs
+        total_reward += int(rewards.sum())
+        games += int(dones.sum())
+
+        if len(memory) > memory.batch_size:
+            credit += replay_ratio * num_envs
+            while credit >= 1:
+                agent.learn(memory.sample())
+                gradient_steps += 1
+                credit -= 1
+
+        now = time.perf_counter()
+        if now - last_report >= report_every or step == num_steps:
+            last_report = now
+            seconds = now - start
+            measurements.append((env_steps, gradient_steps, seconds, env_steps / seconds, gradient_steps / seconds,
+                                 total_reward / max(games, 1)))
+            if verbose:
+                print(f"{env_steps} env steps ({env_steps / seconds:.0f}/s), {gradient_steps} gradient steps ({gradient_steps / seconds:.0f}/s), "
+                      f"{games} games, avg reward/game {total_reward / max(games, 1):.3f}, epsilon {agent.epsilon:.3f}")
+    return measurements
@@ -1,7 +1,10 @@
-import torch.nn as nn
 import random
-from collections import namedtuple, deque
+import torch
+import torch.nn as nn
+from collections import namedtuple
 import numpy as np
+import showdown_table
+from poker_utils import determine_best_hand
 
 class DQNNetwork(nn.Module):
     def __init__(self, state_size=213, action_size=2):
@@ -17,36 +20,285 @@ class DQNNetwork(nn.Module):
         x = self.relu2(self.fc2(x))
         return self.fc3(x)
 
+class NumpyMLP(object):
+    """ Forward pass of a DQNNetwork in NumPy, on float32 copies of its weights. """
+    def __init__(self, network):
+        self.layers = [(layer.weight.detach().cpu().numpy().T.copy(), layer.bias.detach().cpu().numpy().copy())
+                       for layer in (network.fc1, network.fc2, network.fc3)]
+
+    def __call__(self, x):
+        (weight, bias), hidden = self.layers[0], self.layers[1:]
+        if len(x) == 1:
+            # A state vector has at most 9 nonzero entries (4 one-hot cards, best hand, history), so only those
+            # rows of the first layer's weights are needed
+            nonzero = np.flatnonzero(x[0])
+            x = x[:, nonzero] @ weight[nonzero]
+        else:
+            x = x @ weight
+        x += bias
+        for weight, bias in hidden:
+            np.maximum(x, 0, out=x)
+            x = x @ weight
+            x += bias
+        return x
+
+class InferenceNetwork(object):
+    """ Frozen CPU copy of a DQNNetwork for acting, taking and returning float32 NumPy arrays of shape (n, ...).
+
+    backend is "torchscript" (scripted and frozen with torch.jit), "compile" (torch.compile) or "numpy" (NumpyMLP).
+    The copy doesn't follow later training of the network: build a new one after learning.
+    """
+    def __init__(self, network, backend="torchscript"):
+        self.backend = backend
+        if backend == "numpy":
+            self._forward = NumpyMLP(network)
+            return
+        model = DQNNetwork(network.fc1.in_features, network.fc3.out_features)
+        model.load_state_dict(network.state_dict())
+        model.eval()
+        if backend == "torchscript":
+            model = torch.jit.freeze(torch.jit.script(model))
+        elif backend == "compile":
+            model = torch.compile(model)
+        else:
+            raise ValueError(f"Unknown inference backend: {backend}")
+        self._model = model
+        self._forward = self._torch_forward
+
+    def _torch_forward(self, x):
+        with torch.inference_mode():
+            return self._model(torch.from_numpy(x)).numpy()
+
+    def __call__(self, states):
+        return self._forward(states)
+
 Experience = namedtuple("Experience", field_names=["state", "action", "reward", "next_state", "done"])
 
+# A sampled batch: tensors of shape (batch_size, ...), plus importance sampling weights (None unless prioritized)
+# and the buffer indices of the experiences (for update_priorities)
+Batch = namedtuple("Batch", field_names=Experience._fields + ("weights", "indices"))
+
+class SumTree(object):
+    """ Binary tree over capacity leaves where each node holds the sum of its children, so that leaves can be
+    sampled in proportion to their value. Updates and searches are vectorized over arrays of leaves. """
+    def __init__(self, capacity):
+        self.depth = max(1, (capacity - 1).bit_length())
+        self.num_leaves = 1 << self.depth
+        self.nodes = np.zeros(2 * self.num_leaves) # Node i has children 2i and 2i + 1, the root is node 1
+
+    def total(self):
+        return self.nodes[1]
+
+    def update(self, leaves, values):
+        nodes = np.asarray(leaves) + self.num_leaves
+        self.nodes[nodes] = values
+        for _ in range(self.depth):
+            nodes = np.unique(nodes >> 1)
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+
+    def find(self, values):
+        """ Return the leaf of each value in [0, total): the first leaf where the running sum exceeds it. """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = self.nodes[2 * nodes]
+            right = values >= left
+            values -= np.where(right, left, 0)
+            nodes = 2 * nodes + right
+        return nodes - self.num_leaves
+
+
 class ReplayBuffer(object):
-    def __init__(self, buffer_size, batch_size):
-        self.memory = deque([], maxlen=buffer_size)
+    """ Replay memory in preallocated arrays, written as a ring buffer.
+
+    sample() draws batch_size indices at once and returns a Batch of tensors gathered straight from the storage.
+    With prioritized=True experiences are drawn in proportion to priority ** alpha (new experiences get the highest
+    priority seen so far), with importance sampling weights (N * P(i)) ** -beta normalized by their max in the batch;
+    call update_priorities(batch.indices, td_errors) after learning from a batch.
+    """
+    def __init__(self, buffer_size, batch_size, state_size=213, prioritized=False, alpha=0.6, beta=0.4, device="cpu"):
+        self.buffer_size = buffer_size
         self.batch_size = batch_size
+        self.device = torch.device(device)
+        self.states = np.zeros((buffer_size, state_size), dtype=np.float32)
+        self.actions = np.zeros((buffer_size, 1), dtype=np.int64)
+        self.rewards = np.zeros((buffer_size, 1), dtype=np.float32)
+        self.next_states = np.zeros((buffer_size, state_size), dtype=np.float32)
+        self.dones = np.zeros((buffer_size, 1), dtype=np.float32)
+        # Tensors sharing memory with the arrays above
+        self._tensors = [torch.from_numpy(array) for array in (self.states, self.actions, self.rewards, self.next_states, self.dones)]
+        self._cursor = 0
+        self._size = 0
 
-    def add(self, *args):
-        e = Experience(*args)
-        self.memory.append(e)
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+        self._priorities = SumTree(buffer_size) if prioritized else None
+        self._max_priority = 1.0
+
+    def add(self, state, action, reward, next_state, done):
+        i = self._cursor
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self._advance(np.array([i]))
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        """ Add n experiences at once: arrays with n rows (the newest ones are kept if n > buffer_size). """
+        n = len(actions)
+        indices = (self._cursor + np.arange(n)) % self.buffer_size
+        self.states[indices] = states
+        self.actions[indices, 0] = actions
+        self.rewards[indices, 0] = rewards
+        self.next_states[indices] = next_states
+        self.dones[indices, 0] = dones
+        self._advance(indices)
+
+    def _advance(self, indices):
+        if self._priorities is not None:
+            self._priorities.update(indices, self._max_priority ** self.alpha)
+        self._cursor = (self._cursor + len(indices)) % self.buffer_size
+        self._size = min(self._size + len(indices), self.buffer_size)
 
     def sample(self):
-        return random.sample(self.memory, k=self.batch_size)
+        if self._priorities is None:
+            # Without replacement, like random.sample on the old deque (and O(batch size), unlike np.random.choice)
+            indices = np.array(random.sample(range(self._size), self.batch_size))
+            weights = None
+        else:
+            # One draw in each of batch_size equal segments of the total priority
+            total = self._priorities.total()
+            values = (np.arange(self.batch_size) + np.random.random(self.batch_size)) * (total / self.batch_size)
+            indices = np.minimum(self._priorities.find(values), self._size - 1)
+            probabilities = self._priorities.nodes[indices + self._priorities.num_leaves] / total
+            weights = (self._size * probabilities) ** -self.beta
+            weights = torch.from_numpy((weights / weights.max()).astype(np.float32)[:, None]).to(self.device)
+        index_tensor = torch.from_numpy(indices)
+        tensors = [tensor.index_select(0, index_tensor).to(self.device) for tensor in self._tensors]
+        return Batch(*tensors, weights, indices)
+
+    def update_priorities(self, indices, td_errors, epsilon=1e-6):
+        priorities = np.abs(td_errors) + epsilon
+        self._max_priority = max(self._max_priority, priorities.max())
+        self._priorities.update(indices, priorities ** self.alpha)
+
+    def arrays(self):
+        """ Return the storage (and the sum tree, if prioritized) as a dict of arrays, for checkpoints. """
+        arrays = {"states": self.states, "actions": self.actions, "rewards": self.rewards,
+                  "next_states": self.next_states, "dones": self.dones}
+        if self._priorities is not None:
+            arrays["priorities"] = self._priorities.nodes
+        return arrays
+
+    def restore(self, arrays, cursor, size, max_priority=1.0):
+        """ Use arrays saved from arrays() (for example memory-mapped copy-on-write) as the storage. """
+        self.states, self.actions, self.rewards = arrays["states"], arrays["actions"], arrays["rewards"]
+        self.next_states, self.dones = arrays["next_states"], arrays["dones"]
+        self._tensors = [torch.from_numpy(array) for array in (self.states, self.actions, self.rewards, self.next_states, self.dones)]
+        self._cursor = cursor
+        self._size = size
+        self._max_priority = max_priority
+        if self._priorities is not None:
+            self._priorities.nodes = arrays["priorities"]
 
     def __len__(self):
-        return len(self.memory)
+        return self._size
+
+# One-hot position of each integer card: suits ordered 'C', 'D', 'H', 'S', then rank starting at 1
+CARD_TO_INDEX = [(3 - (card & 3)) * 13 + (card >> 2) for card in range(52)]
 
 def card_to_index(card):
-    """ Convert a card to a unique index between 0 and 51. """
-    suit_order = {'C': 0, 'D': 13, 'H': 26, 'S': 39}  # Assuming suits are 'C', 'D', 'H', 'S'
-    return suit_order[card.suit()] + card.rank() - 1  # Assuming rank starts at 1
+    """ Convert an integer card to a unique index between 0 and 51. """
+    return CARD_TO_INDEX[card]
 
 def encode_card(card):
-    """ Convert a card object to a one-hot encoded vector. """
+    """ Convert an integer card to a one-hot encoded vector. """
     index = card_to_index(card)
     encoded = np.zeros(52)
     encoded[index] = 1
     return encoded
 
 def encode_hand(hand):
-    """ Encode a hand of cards (list of Card objects) into a one-hot encoded vector. """
+    """ Encode a hand of cards (list of integer cards) into a one-hot encoded vector. """
     encoded_hand = [encode_card(card) for card in hand]
-    return np.concatenate(encoded_hand)
\ No newline at end of file
+    return np.concatenate(encoded_hand)
+
+# State vector of DQNAgent: one-hot hand (52), one-hot community cards (3 x 52), best hand (type, value),
+# betting history padded with -1 (3)
+MAX_BETTING_HISTORY = 3
+STATE_SIZE = 52 + 3 * 52 + 2 + MAX_BETTING_HISTORY
+_card_to_index = np.array(CARD_TO_INDEX)
+_best_hand_features = None
+
+def best_hand_features():
+    """ Return a float32 array of shape (NUM_STATES, 2) with the (type, value) of determine_best_hand for every
+    deal, indexed like the strength table. The value of a flush is its top card, as in DQNAgent.get_state. """
+    global _best_hand_features
+    if _best_hand_features is None:
+        strengths = np.frombuffer(showdown_table.get_strength_table(), dtype=np.uint16)
+        types = strengths >> 8
+        values = strengths & 0xFF
+        values = np.where(types == 1, values // 14, values) # Flush values are stored as top * 14 + second
+        _best_hand_features = np.stack([types, values], axis=1).astype(np.float32)
+    return _best_hand_features
+
+class StateEncoder(object):
+    """ Encode batches of states into DQNAgent state vectors, in a preallocated float32 buffer.
+
+    hands is an int array of shape (n, 1), community cards of shape (n, 3). histories is either one betting
+    history (a list) shared by every row, or an int array of shape (n, length) with one history per row, padded
+    with -1. With best_hand_table=True the best hand features are read from best_hand_features(), otherwise
+    determine_best_hand is called for each row.
+    """
+    def __init__(self, batch_size=1, best_hand_table=True):
+        self._buffer = np.zeros((batch_size, STATE_SIZE), dtype=np.float32)
+        self._table = best_hand_features() if best_hand_table else None
+        self._community_offsets = 52 + 52 * np.arange(3)
+
+    def encode(self, hands, community_cards, histories):
+        """ Return the state vectors, shape (n, STATE_SIZE). The array is a view of the buffer: it is overwritten by
+        the next call, so copy it to keep it. """
+        n = len(hands)
+        if n > len(self._buffer):
+            self._buffer = np.zeros((n, STATE_SIZE), dtype=np.float32)
+        out = self._buffer[:n]
+        out[:, :208] = 0
+        rows = np.arange(n)[:, None]
+        out[rows, _card_to_index[hands]] = 1
+        out[rows, self._community_offsets + _card_to_index[community_cards]] = 1
+
+        if self._table is not None:
+            community_cards = np.asarray(community_cards, dtype=np.int64)
+            boards = showdown_table.BOARD_INDEX[(community_cards[:, 0] * 52 + community_cards[:, 1]) * 52 + community_cards[:, 2]]
+            out[:, 208:210] = self._table[hands[:, 0] * showdown_table.NUM_BOARDS + boards]
+        else:
+            for i, (hand, community) in enumerate(zip(hands.tolist(), community_cards.tolist())):
+                best_hand_type, best_hand_value = determine_best_hand(hand, community)
+                if isinstance(best_hand_value, (list, tuple)):
+                    best_hand_value = max(best_hand_value)
+                out[i, 208:210] = best_hand_type, best_hand_value
+
+        histories = np.asarray(histories)
+        length = histories.shape[-1]
+        out[:, 210:210 + length] = histories
+        out[:, 210 + length:] = -1
+        return out
+
+    def encode_one(self, hand, community, history):
+        """ encode() for a single state given as lists, without the overhead of array indexing. Returns a view of
+        the buffer's first row. """
+        out = self._buffer[0]
+        out[:208] = 0
+        out[CARD_TO_INDEX[hand[0]]] = 1
+        for k, card in enumerate(community):
+            out[52 + 52 * k + CARD_TO_INDEX[card]] = 1
+        if self._table is not None:
+            out[208:210] = self._table[showdown_table.state_index(hand, community)]
+        else:
+            best_hand_type, best_hand_value = determine_best_hand(hand, community)
+            out[208:210] = best_hand_type, max(best_hand_value) if isinstance(best_hand_value, (list, tuple)) else best_hand_value
+        out[210:] = -1
+        out[210:210 + len(history)] = history
+        return out
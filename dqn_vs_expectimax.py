@@ -5,17 +5,22 @@ from always_bet_policy import Always_Bet_Agent
 from always_fold_policy import Always_Fold_Agent
 import numpy as np
 from dqn_agent import DQNAgent
+from dqn_train import train_dqn
+from checkpoint import checkpoint_exists
+import os
 
 # Simulate the game with your policy agent
 if __name__ == "__main__":
     num_training_games = 10000
+    num_envs = 64 #Training games played in lockstep
     num_games = 25000 #How many games to simulate
     game = PokerGame() #Initialize the game model
 
     # Agent must have a take_action() function from: state (hand, community card, betting history) -> action in range [0, 1]
 
     #Initialize your agents
-    p0_agent = DQNAgent()
+    checkpoint = os.path.join("checkpoints", "dqn") #Training resumes from here, and is saved here
+    p0_agent = DQNAgent.from_checkpoint(checkpoint) if checkpoint_exists(checkpoint) else DQNAgent()
     p1_agent = Random_Agent()
     #P0 is the first agent, P1 is the second agent. We will exchange which agent bets first in the simulations
 
@@ -24,29 +29,9 @@ if __name__ == "__main__":
     ties = 0
     
     
-    """for i in range(num_training_games):
-        game.reset_game()
-        game.shuffle_deck()
-        game.deal_cards()
-        done = False
-        while not done:
-            # Get the state for player 0
-            raw_state_p0 = game.get_state(0)  # This is a tuple
-
-            # Transform this state into the DQN agent's expected format
-            transformed_state_p0 = p0_agent.get_state(raw_state_p0)
-
-            # DQN agent takes an action based on the transformed state
-            action_p0 = p0_agent.take_action(raw_state_p0)
-
-            # Apply the action to the game and get the result
-            next_raw_state_p0, reward_p0, done = game.apply_action(0, action_p0)
-
-            # Transform the next state into the DQN agent's expected format
-            next_transformed_state_p0 = p0_agent.get_state(next_raw_state_p0)
-
-            # Update the DQN agent
-            p0_agent.step(transformed_state_p0, action_p0, reward_p0, next_transformed_state_p0, done)"""
+    # Train P0 against P1 in num_envs games at once (see dqn_train.py), about 1 game per step and env
+    train_dqn(p0_agent, p1_agent, num_steps=num_training_games // num_envs, num_envs=num_envs, verbose=True)
+    p0_agent.save(checkpoint, replay=True)
 
 
     #Simulate game
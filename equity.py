@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import showdown_table
+from showdown_table import NUM_CARDS, NUM_BOARDS, NUM_STATES, NUM_COMMUNITY_CARDS, BOARD_INDEX
+
+# Precomputed equity of every (hole card, community cards) deal against a random opponent card.
+#
+# The table holds, for every deal (indexed like the strength table: hole * NUM_BOARDS + board), how many of the
+# 48 cards left would win against, tie with and lose to the hole card at showdown, counted exactly from the strength
+# table: EQUITY_TABLE[deal] = (wins, ties, losses), as uint8, 3.4 MB in total. Deals where the hole card is on the
+# board are (0, 0, 0).
+#
+# The table is built once (boards are split in chunks across processes) and saved as equity_table_v<version>.npy
+# next to this file. It is then opened as a read-only memory map, so every process shares the same pages, and a
+# lookup is one index computation into a flat memoryview. Processes that miss the file at the same time each build
+# it (in-process when they are worker processes themselves) and publish it with an atomic rename of a temporary
+# file of their own, so readers only ever see a whole file.
+
+EQUITY_VERSION = 1
+DEFAULT_EQUITY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"equity_table_v{EQUITY_VERSION}.npy")
+WIN, TIE, LOSE = 0, 1, 2 # Columns of the table, from the hole card's point of view
+NUM_OPPONENT_CARDS = NUM_CARDS - NUM_COMMUNITY_CARDS - 1 # 48
+
+
+def _equity_chunk(boards):
+    """ Return the (wins, ties, losses) counts of every hole card on a range of boards: shape (52, len(boards), 3). """
+    strengths = np.frombuffer(showdown_table.get_strength_table(), dtype=np.uint16).reshape(NUM_CARDS, NUM_BOARDS)
+    s = strengths[:, boards].T.astype(np.int32) # (boards, 52)
+    hole = s[:, :, None]
+    opponent = s[:, None, :]
+    valid = opponent > 0 # Community cards have strength 0
+    counts = np.stack([((opponent < hole) & valid).sum(axis=2),
+                       (opponent == hole).sum(axis=2) - 1, # The hole card ties with itself
+                       (opponent > hole).sum(axis=2)], axis=2)
+    counts[s == 0] = 0 # The hole card is on the board
+    return counts.transpose(1, 0, 2).astype(np.uint8)
+
+
+def build_equity_table(num_workers=None, chunk_size=1105):
+    """ Compute the equity table, splitting the boards in chunks of chunk_size across num_workers processes
+    (by default os.cpu_count(), or 1 inside a worker process, so a pool of workers doesn't start a pool each; 1
+    builds in this process). Returns an array of shape (NUM_STATES, 3). """
+    chunks = [slice(start, min(start + chunk_size, NUM_BOARDS)) for start in range(0, NUM_BOARDS, chunk_size)]
+    table = np.empty((NUM_CARDS, NUM_BOARDS, 3), dtype=np.uint8)
+    if num_workers is None:
+        num_workers = 1 if multiprocessing.parent_process() is not None else os.cpu_count()
+    if num_workers <= 1:
+        parts = map(_equity_chunk, chunks)
+        for boards, part in zip(chunks, parts):
+            table[:, boards] = part
+    else:
+        with ProcessPoolExecutor(num_workers) as pool:
+            for boards, part in zip(chunks, pool.map(_equity_chunk, chunks)):
+                table[:, boards] = part
+    return table.reshape(NUM_STATES, 3)
+
+
+def load_equity_table(path=DEFAULT_EQUITY_PATH, num_workers=None):
+    """ Open the equity table at path as a read-only memory map, building it (and saving it to path) if the file
+    doesn't exist or doesn't match. Pass path=None to build the table in memory without touching the disk.
+    """
+    if path is not None and os.path.exists(path):
+        try:
+            table = np.load(path, mmap_mode="r")
+            if table.shape == (NUM_STATES, 3) and table.dtype == np.uint8:
+                return table
+        except (OSError, ValueError):
+            pass # Unreadable or truncated: rebuild it
+    table = build_equity_table(num_workers)
+    if path is not None:
+        temporary = f"{path}.{os.getpid()}.tmp.npy" # Unique per process: concurrent builds don't share it
+        try:
+            np.save(temporary, table)
+            os.replace(temporary, path)
+            return np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            # Read-only location: just keep the in-memory table
+    return table
+
+
+_table = None
+_counts = None
+
+def get_equity_table():
+    """ Return the equity table (shape (NUM_STATES, 3)), opening or building it on first use. """
+    global _table, _counts
+    if _table is None:
+        _table = load_equity_table()
+        _counts = memoryview(np.ascontiguousarray(_table).reshape(-1))
+    return _table
+
+
+def equity_counts(hand, community):
+    """ Return (wins, ties, losses) of a hand (list of 1 card) with the given community cards (list of 3 cards),
+    over the opponent cards left. """
+    if _counts is None:
+        get_equity_table()
+    i = 3 * showdown_table.state_index(hand, community)
+    return _counts[i], _counts[i + 1], _counts[i + 2]
+
+
+def equity(hand, community):
+    """ Return the all-in equity of a hand: P(win) + P(tie) / 2 against a random opponent card. """
+    wins, ties, losses = equity_counts(hand, community)
+    return (wins + ties / 2) / NUM_OPPONENT_CARDS
+
+
+def batch_equity_counts(hands, community_cards):
+    """ Batched equity_counts(): hands is an int array of shape (n,), community cards of shape (n, 3).
+    Returns an int array of shape (n, 3). """
+    community_cards = np.asarray(community_cards, dtype=np.int64)
+    boards = BOARD_INDEX[(community_cards[:, 0] * NUM_CARDS + community_cards[:, 1]) * NUM_CARDS + community_cards[:, 2]]
+    return get_equity_table()[np.asarray(hands, dtype=np.int64) * NUM_BOARDS + boards].astype(np.int64)
+
+
+def showdown_equity(hands, community_cards):
+    """ Return the showdown equity of each hand against a uniformly random opponent card: P(win) - P(lose) over the
+    48 cards left. hands is an int array of shape (n,), community cards of shape (n, 3). Its expectation over
+    random deals is 0, which makes it a control variate for evaluating agents (see tournament.py).
+    """
+    counts = batch_equity_counts(hands, community_cards)
+    return (counts[:, WIN] - counts[:, LOSE]) / NUM_OPPONENT_CARDS
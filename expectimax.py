@@ -1,11 +1,19 @@
+import numpy as np
 import poker_utils
-from deck import Deck
+import showdown_table
+import equity
+from deck import Deck, Card, NUM_CARDS
+
+def high_card(hand, community):
+    """ Rank of the hand's card (the value of a high card hand) """
+    return (hand[0] >> 2) + 1
 
 class ExpectimaxAgent():
-    def __init__(self, bet_threshold=0.3, verbose=False):
+    def __init__(self, bet_threshold=0.3, verbose=False, equity_table=True):
         self._remaining_deck = Deck()
+        self._equity_table = equity_table # Look win probabilities up in the equity table (equity.py), False to compute every decision from scratch
         #Define functions that check each of the hand types
-        self._possible_hands = [lambda x, _: x[0].rank(), poker_utils.flush_exists, poker_utils.straight_exists, poker_utils.pair_exists, poker_utils.straight_flush_exists]
+        self._possible_hands = [high_card, poker_utils.flush_exists, poker_utils.straight_exists, poker_utils.pair_exists, poker_utils.straight_flush_exists]
         self._verbose = verbose
         self._bet_threshold = bet_threshold
 
@@ -20,6 +28,18 @@ class ExpectimaxAgent():
         state: (player_hand, community_cards, history)
         """
         hand, community_cards, history = state
+        if self._verbose or not self._equity_table:
+            win_prob = self.win_prob(hand, community_cards)
+        else:
+            win_prob = self.table_win_prob(hand, community_cards)
+
+        #Using heuristics for an expectimax agent. If our expected win probability is above our bet threshold, bet. Otherwise fold
+        return int(win_prob > self._bet_threshold)
+
+    def win_prob(self, hand, community_cards):
+        """
+        return the probability that hand beats the card of an opponent drawn from the rest of the deck
+        """
         hand_type, hand_value = poker_utils.determine_best_hand(hand, community_cards)
         if self._verbose:
             print(f"Best hand type: {hand_type}, Hand value: {hand_value}")
@@ -40,12 +60,12 @@ class ExpectimaxAgent():
                     if same_hand_value == max(hand_value, same_hand_value):
                         lose_count += 1
                         if self._verbose:
-                            print(f"{card} beats your hand in category {hand_type}")
+                            print(f"{Card.from_index(card)} beats your hand in category {hand_type}")
                         continue
                 else:
                     if same_hand_value > hand_value:
                         if self._verbose:
-                            print(f"{card} beats your hand in category {hand_type}")
+                            print(f"{Card.from_index(card)} beats your hand in category {hand_type}")
                         lose_count += 1
                         continue
 
@@ -54,7 +74,7 @@ class ExpectimaxAgent():
                 for i in range(hand_type + 1, len(self._possible_hands)):
                     if self._possible_hands[i]([card], community_cards):
                         if self._verbose:
-                            print(f"{card} beats your hand in category {i}")
+                            print(f"{Card.from_index(card)} beats your hand in category {i}")
                         lose_count += 1
                         break
         
@@ -64,7 +84,29 @@ class ExpectimaxAgent():
         win_prob = 1 - lose_count / self._remaining_deck.size()
         if self._verbose:
             print(f"Expected win prob: {win_prob: .2f}")
+        return win_prob
 
+    def table_win_prob(self, hand, community_cards):
+        """
+        win_prob() from the equity table, in O(1): like win_prob(), count an opponent flush of the same value as a loss
+        """
+        wins, ties, losses = equity.equity_counts(hand, community_cards)
+        if showdown_table.hand_strength(hand, community_cards) >> 8 == 1:
+            losses += ties
+        return 1 - losses / equity.NUM_OPPONENT_CARDS
 
-        #Using heuristics for an expectimax agent. If our expected win probability is above our bet threshold, bet. Otherwise fold
-        return int(win_prob > self._bet_threshold)
\ No newline at end of file
+    def take_actions(self, states, opp_states):
+        """
+        batched take_action(): return an array with one action per row of the batch (see batch_poker.py)
+
+        Computes the same win probability as take_action() from the equity table (see table_win_prob()).
+        """
+        hands, community_cards, history = states
+        hands = hands[:, 0]
+        counts = equity.batch_equity_counts(hands, community_cards)
+        board = showdown_table.BOARD_INDEX[(community_cards[:, 0] * NUM_CARDS + community_cards[:, 1]) * NUM_CARDS + community_cards[:, 2]]
+        strengths = np.frombuffer(showdown_table.get_strength_table(), dtype=np.uint16)
+        flush = strengths[hands * showdown_table.NUM_BOARDS + board] >> 8 == 1
+        losses = counts[:, equity.LOSE] + flush * counts[:, equity.TIE]
+        win_prob = 1 - losses / equity.NUM_OPPONENT_CARDS
+        return (win_prob > self._bet_threshold).astype(np.int8)
@@ -0,0 +1,311 @@
+from collections import namedtuple, deque
+import numpy as np
+import hand_evaluator
+import poker_hands
+import showdown_table
+from batch_poker import batch_policy, deal_batch
+from deck import Deck, NUM_CARDS, to_cards
+
+# A table-driven engine for variants of our simplified poker.
+#
+# GameRules describe a variant:
+#     num_player_cards -- hole cards per player
+#     street_cards -- community cards revealed before each betting round, e.g. (3,) for PokerGame, (2, 1, 1) for
+#                     3 betting rounds
+#     blind -- chips each player puts in the pot before the deal
+#     bet_sizes -- size of a bet (and of a raise) in each betting round
+#     raise_caps -- raises allowed after the first bet of each betting round
+#     hand_size -- cards in a hand at showdown: 2 for our simplified hands (hand_evaluator.py), 5 for standard poker
+#                  hands, the best 5 of a player's cards and the community cards (poker_hands.py, up to 7 cards)
+# The default rules are PokerGame's: GameEngine().play() plays exactly the same games as PokerGame().play() from the
+# same random state, and GameEngine().play_batch() the same as BatchPokerGame(seed).play().
+#
+# Actions are 0 (check, or fold facing a bet), 1 (bet, or call facing a bet) and 2 (raise, only facing a bet while
+# the round's raise cap isn't reached). P0 acts first in every betting round. A round ends when both players
+# check or when a bet is called, and the game ends with a fold or after the last round, at showdown.
+#
+# BettingTree compiles the rules into flat arrays over the nodes of the betting tree, decision nodes first in
+# breadth first order (for the default rules, nodes 0-3 are game_tree.py's), then the terminal nodes:
+#     players[node] -- player to act, -1 at terminal nodes
+#     streets[node] -- betting round
+#     children[node, action] -- node reached by an action, -1 if the action isn't allowed
+#     showdowns[node] -- whether the node ends the game with a showdown
+#     fold_winners[node] -- winner when the node ends the game with a fold: 1 for P0, -1 for P1 (0 otherwise)
+#     fold_payoffs[node] -- P0's chips when the node ends the game with a fold (0 otherwise; with blind 0, a player
+#                           folding before putting any chips in loses the game but no chips)
+#     showdown_stakes[node] -- chips each player has in the pot when the node is a showdown (0 otherwise)
+# so playing a game is a walk through children, and its result is read from the arrays at the terminal node.
+
+GameRules = namedtuple("GameRules", ["num_player_cards", "street_cards", "blind", "bet_sizes", "raise_caps", "hand_size"],
+                       defaults=[1, (3,), 1, (2,), (0,), hand_evaluator.HAND_SIZE])
+DEFAULT_RULES = GameRules()
+
+CHECK_FOLD, BET_CALL, RAISE = 0, 1, 2
+
+
+def validate_rules(rules):
+    """ Raise ValueError if a GameRules can't be played. """
+    streets = len(rules.street_cards)
+    if streets == 0 or len(rules.bet_sizes) != streets or len(rules.raise_caps) != streets:
+        raise ValueError("street_cards, bet_sizes and raise_caps need one entry per betting round")
+    if rules.num_player_cards < 1 or 2 * rules.num_player_cards + sum(rules.street_cards) > NUM_CARDS:
+        raise ValueError(f"can't deal {rules.num_player_cards} cards per player and {sum(rules.street_cards)} community cards")
+    if rules.hand_size not in (hand_evaluator.HAND_SIZE, 5):
+        raise ValueError(f"hands of {rules.hand_size} cards aren't supported (only {hand_evaluator.HAND_SIZE} or 5)")
+    if rules.hand_size == hand_evaluator.HAND_SIZE and rules.num_player_cards > hand_evaluator.MAX_HOLE_CARDS:
+        raise ValueError(f"at most {hand_evaluator.MAX_HOLE_CARDS} cards per player")
+    if rules.hand_size == 5 and not poker_hands.MIN_CARDS <= rules.num_player_cards + sum(rules.street_cards) <= poker_hands.MAX_CARDS:
+        raise ValueError(f"5 card hands are made of {poker_hands.MIN_CARDS} to {poker_hands.MAX_CARDS} cards per player")
+    if min(rules.street_cards) < 0 or min(rules.raise_caps) < 0 or min(rules.bet_sizes) <= 0 or rules.blind < 0:
+        raise ValueError("card counts and raise caps must be >= 0, bet sizes > 0")
+
+
+# State of a betting round while building the tree
+_Node = namedtuple("_Node", ["history", "street", "player", "contributions", "facing_bet", "raises", "actions_in_round"])
+
+
+class BettingTree:
+    """ The betting tree of a GameRules, compiled into flat arrays (see the top of this file). """
+    def __init__(self, rules=DEFAULT_RULES):
+        validate_rules(rules)
+        self.rules = rules
+        self.num_actions = 3 if max(rules.raise_caps) > 0 else 2
+
+        # Breadth first expansion: decision nodes keep the order they are reached in, terminal nodes go last
+        decisions, terminals, edges = [], [], []
+        queue = deque([_Node((), 0, 0, (rules.blind, rules.blind), False, 0, 0)])
+        while queue:
+            node = queue.popleft()
+            decisions.append(node)
+            for action, child in self._expand(node):
+                edges.append((len(decisions) - 1, action, child))
+                if isinstance(child, _Node):
+                    queue.append(child)
+                else:
+                    terminals.append(child)
+
+        self.num_decision_nodes = len(decisions)
+        self.num_nodes = len(decisions) + len(terminals)
+        self.players = np.full(self.num_nodes, -1, dtype=np.int8)
+        self.streets = np.zeros(self.num_nodes, dtype=np.int8)
+        self.children = np.full((self.num_nodes, self.num_actions), -1, dtype=np.int32)
+        self.showdowns = np.zeros(self.num_nodes, dtype=bool)
+        self.fold_winners = np.zeros(self.num_nodes, dtype=np.int8)
+        self.fold_payoffs = np.zeros(self.num_nodes, dtype=np.int32)
+        self.showdown_stakes = np.zeros(self.num_nodes, dtype=np.int32)
+        self.histories = [node.history for node in decisions] + [terminal[0] for terminal in terminals]
+        self._node_index = {history: i for i, history in enumerate(self.histories)}
+
+        for i, node in enumerate(decisions):
+            self.players[i] = node.player
+            self.streets[i] = node.street
+        for i, (history, street, showdown, fold_winner, fold_payoff, showdown_stake) in enumerate(terminals, start=len(decisions)):
+            self.streets[i] = street
+            self.showdowns[i] = showdown
+            self.fold_winners[i] = fold_winner
+            self.fold_payoffs[i] = fold_payoff
+            self.showdown_stakes[i] = showdown_stake
+        for parent, action, child in edges:
+            self.children[parent, action] = self._node_index[child[0]]
+        self.terminal = self.players < 0
+        # Decision nodes in depth first order (children in action order), the order BatchPokerGame asks its agents in
+        self.preorder = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            self.preorder.append(node)
+            stack.extend(child for child in self.children[node, ::-1].tolist() if child >= 0 and not self.terminal[child])
+        # Lists, for walking the tree one game at a time
+        self._players = self.players.tolist()
+        self._streets = self.streets.tolist()
+        self._children = self.children.tolist()
+        self._showdowns = self.showdowns.tolist()
+        self._fold_winners = self.fold_winners.tolist()
+        self._fold_payoffs = self.fold_payoffs.tolist()
+        self._showdown_stakes = self.showdown_stakes.tolist()
+
+    def _expand(self, node):
+        """ Yield (action, child) for every allowed action of a decision node: the child is a _Node, or a terminal
+        (history, street, showdown, fold winner, fold payoff, showdown stake) tuple. """
+        rules = self.rules
+        player, other = node.player, 1 - node.player
+        bet = rules.bet_sizes[node.street]
+        contributions = list(node.contributions)
+
+        def end_of_round(history, contributions):
+            if node.street + 1 < len(rules.street_cards):
+                return _Node(history, node.street + 1, 0, tuple(contributions), False, 0, 0)
+            return (history, node.street, True, 0, 0, contributions[0]) # Showdown, both players have the same in the pot
+
+        def next_turn(history, contributions, facing_bet, raises):
+            return _Node(history, node.street, other, tuple(contributions), facing_bet, raises, node.actions_in_round + 1)
+
+        if not node.facing_bet:
+            # Check: the round ends if the other player checked already
+            history = node.history + (CHECK_FOLD,)
+            yield CHECK_FOLD, end_of_round(history, contributions) if node.actions_in_round else next_turn(history, contributions, False, 0)
+            # Bet
+            raised = list(contributions)
+            raised[player] += bet
+            yield BET_CALL, next_turn(node.history + (BET_CALL,), raised, True, 0)
+            return
+
+        # Fold: the other player wins what this player put in the pot
+        fold_payoff = -contributions[0] if player == 0 else contributions[1]
+        yield CHECK_FOLD, (node.history + (CHECK_FOLD,), node.street, False, 1 if player else -1, fold_payoff, 0)
+        # Call
+        called = list(contributions)
+        called[player] = called[other]
+        yield BET_CALL, end_of_round(node.history + (BET_CALL,), called)
+        # Raise
+        if node.raises < rules.raise_caps[node.street]:
+            raised = list(contributions)
+            raised[player] = raised[other] + bet
+            yield RAISE, next_turn(node.history + (RAISE,), raised, True, node.raises + 1)
+
+    def node_index(self, history):
+        """ Return the node reached by a betting history (a list of actions). """
+        return self._node_index[tuple(history)]
+
+
+class GameEngine:
+    """ Play games of any GameRules (see the top of this file), one at a time (play(), like PokerGame) or in batches
+    (play_batch(), like BatchPokerGame). Agents see the same states as in PokerGame: (hole cards, community cards
+    revealed so far, betting history).
+    """
+    def __init__(self, rules=DEFAULT_RULES, seed=None):
+        self.rules = rules
+        self.tree = BettingTree(rules)
+        self._deck = Deck()
+        self._rng = np.random.default_rng(seed) # For play_batch
+        self._num_community_cards = sum(rules.street_cards)
+        self._visible = np.cumsum(rules.street_cards).tolist() # Community cards revealed in each betting round
+        # The default cards are scored with the showdown strength table, anything else with hand_evaluator (or
+        # poker_hands for 5 card hands)
+        self._strength_table = (rules.hand_size == hand_evaluator.HAND_SIZE and rules.num_player_cards == 1
+                                and self._num_community_cards == showdown_table.NUM_COMMUNITY_CARDS)
+        self._strengths = showdown_table.get_strength_table() if self._strength_table else None
+
+    def deal_cards(self):
+        """ Shuffle the deck and deal the players' cards then the community cards, like PokerGame. Returns
+        ([P0 cards, P1 cards], community cards). """
+        self._deck.reset()
+        self._deck.shuffle()
+        hands = [self._deck.deal(self.rules.num_player_cards), self._deck.deal(self.rules.num_player_cards)]
+        return hands, self._deck.deal(self._num_community_cards)
+
+    def strength(self, hand, community_cards):
+        """ Strength of a hand (list of cards) with all the community cards: higher wins at showdown. """
+        if self._strength_table:
+            return self._strengths[hand[0] * showdown_table.NUM_BOARDS + showdown_table.board_index(community_cards)]
+        if self.rules.hand_size == 5:
+            return poker_hands.hand_value(hand + community_cards)
+        return hand_evaluator.hand_strength(hand, community_cards)
+
+    def play(self, p0_policy, p1_policy, verbose=False, deal=None):
+        """ Play 1 game and return the result of the game (1 for p0, -1 for p1, 0 for a tie) and P0's chips won.
+
+            deal -- optional ([P0 cards, P1 cards], community cards) to play instead of dealing from the shuffled deck
+        """
+        hands, community_cards = self.deal_cards() if deal is None else ([list(deal[0][0]), list(deal[0][1])], list(deal[1]))
+        if verbose:
+            print(f"P0 Hand: {to_cards(hands[0])}")
+            print(f"P1 Hand: {to_cards(hands[1])}")
+            print(f"Community Cards: {to_cards(community_cards)}\n")
+
+        tree = self.tree
+        players, children, streets = tree._players, tree._children, tree._streets
+        visible = self._visible
+        policies = [p0_policy, p1_policy]
+        history = []
+        node = 0
+        street = -1
+        board = community_cards
+        p = players[0]
+        while p >= 0:
+            if streets[node] != street:
+                street = streets[node]
+                board = community_cards if visible[street] == len(community_cards) else community_cards[:visible[street]]
+            action = policies[p].take_action((hands[p], board, history), (hands[1 - p], board, history))
+            if verbose:
+                print(f"Player {p} chooses: {action}")
+            history.append(action)
+            child = children[node][action] if 0 <= action < tree.num_actions else -1
+            if child < 0:
+                raise ValueError(f"action {action} isn't allowed after history {history[:-1]}")
+            node = child
+            p = players[node]
+
+        if tree._showdowns[node]:
+            stake = tree._showdown_stakes[node]
+            p0_strength = self.strength(hands[0], community_cards)
+            p1_strength = self.strength(hands[1], community_cards)
+            winner = (p0_strength > p1_strength) - (p0_strength < p1_strength)
+            margin = winner * stake
+        else:
+            margin = tree._fold_payoffs[node]
+            winner = tree._fold_winners[node]
+        if verbose:
+            print(f"Betting ended. History: {history}\n")
+            print(f"P0 won {margin} chips\n\n" if winner == 1 else f"P1 won {-margin} chips\n\n" if winner == -1 else "Tie\n")
+        return winner, margin
+
+    def deal_batch(self, n):
+        """ Deal n games from independently shuffled decks, like BatchPokerGame.deal_cards. Returns
+        (hands (n, 2 * num_player_cards): P0's cards then P1's, community cards (n, number of community cards)). """
+        dealt = deal_batch(self._rng, n, 2 * self.rules.num_player_cards + self._num_community_cards)
+        return dealt[:, :2 * self.rules.num_player_cards], dealt[:, 2 * self.rules.num_player_cards:]
+
+    def strengths(self, hands, community_cards):
+        """ Batched strength(): hands (n, cards per player), community cards (n, number of community cards). """
+        if self._strength_table:
+            board = showdown_table.BOARD_INDEX[(community_cards[:, 0] * NUM_CARDS + community_cards[:, 1]) * NUM_CARDS + community_cards[:, 2]]
+            return np.frombuffer(self._strengths, dtype=np.uint16)[hands[:, 0] * showdown_table.NUM_BOARDS + board].astype(np.int64)
+        if self.rules.hand_size == 5:
+            return poker_hands.hand_values(np.concatenate([hands, community_cards], axis=1))
+        return hand_evaluator.hand_strengths(hands, community_cards)
+
+    def play_batch(self, p0_policy, p1_policy, n, deal=None):
+        """ Play n games, with batched agents (see batch_poker.py): each decision node asks its player once for
+        every game that reached it. Returns the winners and P0's chips won, int arrays of shape (n,).
+
+            deal -- optional (hands (n, 2 * num_player_cards), community cards) to play instead of dealing new cards
+        """
+        tree = self.tree
+        k = self.rules.num_player_cards
+        policies = [batch_policy(p0_policy), batch_policy(p1_policy)]
+        hands, community_cards = self.deal_batch(n) if deal is None else deal
+        player_hands = [hands[:, :k], hands[:, k:2 * k]]
+
+        rows_at = [None] * tree.num_nodes
+        rows_at[0] = np.arange(n)
+        for node in tree.preorder:
+            rows = rows_at[node]
+            if rows is None or not len(rows):
+                continue
+            p = tree.players[node]
+            board = community_cards[rows, :self._visible[tree.streets[node]]]
+            history = list(tree.histories[node])
+            state = (player_hands[p][rows], board, history)
+            opp_state = (player_hands[1 - p][rows], board, history)
+            actions = np.asarray(policies[p].take_actions(state, opp_state))
+            for action in np.unique(actions):
+                child = tree.children[node, action] if 0 <= action < tree.num_actions else -1
+                if child < 0:
+                    raise ValueError(f"action {action} isn't allowed after history {history}")
+                rows_at[child] = rows[actions == action]
+
+        margins = np.zeros(n, dtype=np.int64)
+        winners = np.zeros(n, dtype=np.int64)
+        for node in range(tree.num_decision_nodes, tree.num_nodes):
+            rows = rows_at[node]
+            if rows is None or not len(rows):
+                continue
+            if tree.showdowns[node]:
+                winners[rows] = np.sign(self.strengths(player_hands[0][rows], community_cards[rows]) -
+                                        self.strengths(player_hands[1][rows], community_cards[rows]))
+                margins[rows] = winners[rows] * tree.showdown_stakes[node]
+            else:
+                margins[rows] = tree.fold_payoffs[node]
+                winners[rows] = tree.fold_winners[node]
+        return winners, margins
@@ -0,0 +1,181 @@
+import numpy as np
+import canonical
+import showdown_table
+from deck import NUM_CARDS
+
+# The betting tree of PokerGame, evaluated for every deal at once.
+#
+# There are 4 decision nodes, each identified by the betting history that leads to it:
+#     node 0: P0 acts first          (history [])
+#     node 1: P1 responds to a check (history [0])
+#     node 2: P1 responds to a bet   (history [1])
+#     node 3: P0 responds to a bet   (history [0, 1])
+# A strategy profile is a float array of shape (NUM_NODES, number of information states, 2): the probability of
+# each action (0 = check/fold, 1 = bet/call) at each node, for each information state of the player acting there.
+#
+# Deals are grouped by board. For a board, the 49 remaining cards are the possible hole cards of both players, and
+# the showdown matrix W[i, j] = sign(strength of i - strength of j) gives P0's result when P0 holds card i and P1
+# holds card j (0 on the diagonal, where the deal is impossible). Every counterfactual value of the tree is then a
+# matrix product of W (or of the all-ones matrix without diagonal, for folds) with the opponent's reach vector.
+
+NODE_HISTORIES = ([], [0], [1], [0, 1])
+NODE_PLAYERS = (0, 1, 1, 0)
+NUM_NODES = len(NODE_HISTORIES)
+NUM_ACTIONS = 2
+_node_index = {tuple(history): node for node, history in enumerate(NODE_HISTORIES)}
+
+BLIND = 1
+BET = 2
+
+NUM_HOLES = NUM_CARDS - showdown_table.NUM_COMMUNITY_CARDS # Cards left for the players once the board is dealt
+NUM_DEALS = showdown_table.NUM_BOARDS * NUM_HOLES * (NUM_HOLES - 1) # Equally likely (board, P0 card, P1 card) deals
+
+
+def node_index(history):
+    """ Return the decision node reached by a betting history. """
+    return _node_index[tuple(history)]
+
+
+class BoardTables:
+    """ Per board arrays for evaluating a strategy profile on every deal.
+
+        canonical=True uses one representative of each of the 1755 canonical boards, weighted by the size of its class,
+        with canonical state indices as information states (exact for strategies that only depend on the canonical
+        state). canonical=False uses all 22100 boards, with raw showdown_table state indices (hole * NUM_BOARDS + board)
+        as information states.
+    """
+    def __init__(self, canonical_boards=True):
+        if canonical_boards:
+            boards = canonical.CANONICAL_BOARD_CARDS.astype(np.int64)
+            self.weights = canonical.CANONICAL_BOARD_COUNTS.astype(np.float64)
+            self.num_info_states = canonical.NUM_CANONICAL_STATES
+        else:
+            boards = showdown_table.all_boards().astype(np.int64)
+            self.weights = np.ones(len(boards))
+            self.num_info_states = showdown_table.NUM_STATES
+        self.boards = boards
+
+        # Hole cards left on each board, in increasing order: (number of boards, NUM_HOLES)
+        free = np.ones((len(boards), NUM_CARDS), dtype=bool)
+        free[np.arange(len(boards))[:, None], boards] = False
+        self.holes = np.nonzero(free)[1].reshape(len(boards), NUM_HOLES)
+
+        board_ids = showdown_table.BOARD_INDEX[(boards[:, 0] * NUM_CARDS + boards[:, 1]) * NUM_CARDS + boards[:, 2]]
+        if canonical_boards:
+            self.info_states = canonical.HOLE_TO_STATE[np.arange(len(boards))[:, None], self.holes].astype(np.int64)
+        else:
+            self.info_states = self.holes * showdown_table.NUM_BOARDS + board_ids[:, None]
+
+        strengths = np.frombuffer(showdown_table.get_strength_table(), dtype=np.uint16)
+        self.strengths = strengths[self.holes * showdown_table.NUM_BOARDS + board_ids[:, None]].astype(np.int32)
+
+    def __len__(self):
+        return len(self.boards)
+
+    def showdown_matrices(self, rows):
+        """ Return the showdown matrices of the boards in rows (a slice), as float32: (boards, NUM_HOLES, NUM_HOLES). """
+        strengths = self.strengths[rows]
+        return np.sign(strengths[:, :, None] - strengths[:, None, :]).astype(np.float32)
+
+    def chunks(self, chunk_size):
+        """ Yield (slice of boards, showdown matrices), chunk_size boards at a time. """
+        for start in range(0, len(self), chunk_size):
+            rows = slice(start, min(start + chunk_size, len(self)))
+            yield rows, self.showdown_matrices(rows)
+
+    def gather(self, profile, rows):
+        """ Return the strategies of the hands on the boards in rows: (NUM_NODES, boards, NUM_HOLES, 2). """
+        return profile[:, self.info_states[rows]]
+
+    def scatter(self, values, rows, num_info_states=None):
+        """ Sum per hand values of shape (boards, NUM_HOLES, 2), weighted by board, into an array per information state. """
+        num_info_states = num_info_states or self.num_info_states
+        weighted = values * self.weights[rows][:, None, None]
+        info_states = self.info_states[rows].ravel()
+        return np.stack([np.bincount(info_states, weighted[:, :, a].ravel(), minlength=num_info_states)
+                         for a in range(NUM_ACTIONS)], axis=1)
+
+
+def _matmul(showdown, vectors):
+    """ Multiply each board's showdown matrix with a stack of per hand vectors: returns (boards, NUM_HOLES, vectors). """
+    stacked = np.stack(vectors, axis=2).astype(np.float32)
+    return (showdown @ stacked).astype(np.float64)
+
+def _fold(vector):
+    # Sum of the vector over every other hand: the all-ones matrix without diagonal times the vector
+    return vector.sum(axis=1, keepdims=True) - vector
+
+
+def p0_values(showdown, strategies):
+    """ Counterfactual values for P0, weighted by P1's reach (each hand summed over P1's possible cards).
+    Returns:
+        check_check: value of reaching the [0, 0] showdown, (boards, NUM_HOLES)
+        node3: values of folding and calling at node 3, (boards, NUM_HOLES, 2)
+        bet: value of betting at node 0, (boards, NUM_HOLES)
+    """
+    p1_check, p1_bet = strategies[1][..., 0], strategies[1][..., 1]
+    p1_fold, p1_call = strategies[2][..., 0], strategies[2][..., 1]
+    check_check, check_bet, bet_call = np.moveaxis(_matmul(showdown, [p1_check, p1_bet, p1_call]), 2, 0)
+    node3 = np.stack([-BLIND * _fold(p1_bet), (BLIND + BET) * check_bet], axis=2)
+    bet = BLIND * _fold(p1_fold) + (BLIND + BET) * bet_call
+    return BLIND * check_check, node3, bet
+
+def p1_values(showdown, strategies):
+    """ Counterfactual values for P1 (from P1's point of view), weighted by P0's reach.
+    Returns:
+        node1: values of checking and betting at node 1, (boards, NUM_HOLES, 2)
+        node2: values of folding and calling at node 2, (boards, NUM_HOLES, 2)
+    """
+    p0_check, p0_bet = strategies[0][..., 0], strategies[0][..., 1]
+    p0_fold = p0_check * strategies[3][..., 0]
+    p0_call = p0_check * strategies[3][..., 1]
+    # W is antisymmetric, so P1's value of a showdown is W @ (P0's reach) as well
+    check_check, bet_call, call = np.moveaxis(_matmul(showdown, [p0_check, p0_call, p0_bet]), 2, 0)
+    node1 = np.stack([BLIND * check_check, BLIND * _fold(p0_fold) + (BLIND + BET) * bet_call], axis=2)
+    node2 = np.stack([-BLIND * _fold(p0_bet), (BLIND + BET) * call], axis=2)
+    return node1, node2
+
+def root_values(check_check, node3, bet, node3_value):
+    """ Stack P0's values of checking and betting at node 0, given P0's value at node 3 (boards, NUM_HOLES). """
+    return np.stack([check_check + node3_value, bet], axis=2)
+
+
+def expected_value(tables, profile, chunk_size=2048):
+    """ Return P0's exact expected chips per game when both players follow the strategy profile. """
+    total = 0.0
+    for rows, showdown in tables.chunks(chunk_size):
+        strategies = tables.gather(profile, rows)
+        check_check, node3, bet = p0_values(showdown, strategies)
+        root = root_values(check_check, node3, bet, (strategies[3] * node3).sum(axis=2))
+        total += ((strategies[0] * root).sum(axis=(1, 2)) * tables.weights[rows]).sum()
+    return total / NUM_DEALS
+
+
+def best_response_values(tables, profile, chunk_size=2048):
+    """ Return the exact expected chips per game of P0 best responding to P1's strategy in the profile, and of P1
+    best responding to P0's strategy. Best responses are chosen per information state of tables.
+    """
+    p0_root = np.zeros((tables.num_info_states, NUM_ACTIONS))
+    p0_node3 = np.zeros((tables.num_info_states, NUM_ACTIONS))
+    p1_node1 = np.zeros((tables.num_info_states, NUM_ACTIONS))
+    p1_node2 = np.zeros((tables.num_info_states, NUM_ACTIONS))
+    # Best responses act per information state, so sum the action values of every deal in the information state first
+    for rows, showdown in tables.chunks(chunk_size):
+        strategies = tables.gather(profile, rows)
+        check_check, node3, bet = p0_values(showdown, strategies)
+        p0_node3 += tables.scatter(node3, rows)
+        p0_root += tables.scatter(np.stack([check_check, bet], axis=2), rows)
+        node1, node2 = p1_values(showdown, strategies)
+        p1_node1 += tables.scatter(node1, rows)
+        p1_node2 += tables.scatter(node2, rows)
+    p0_total = np.maximum(p0_root[:, 0] + p0_node3.max(axis=1), p0_root[:, 1]).sum()
+    p1_total = p1_node1.max(axis=1).sum() + p1_node2.max(axis=1).sum()
+    return p0_total / NUM_DEALS, p1_total / NUM_DEALS
+
+
+def exploitability(tables, profile, chunk_size=2048):
+    """ Return the exploitability of a strategy profile in chips per game: the average of what each player gains by
+    best responding to the other. 0 exactly at a Nash equilibrium.
+    """
+    p0_best, p1_best = best_response_values(tables, profile, chunk_size)
+    return (p0_best + p1_best) / 2
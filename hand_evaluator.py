@@ -0,0 +1,78 @@
+import numpy as np
+from deck import NUM_CARDS
+
+# Hand strengths for any number of hole cards and community cards.
+#
+# A hand of our simplified poker is 2 cards: a hole card and one other card (a community card, or another hole card
+# when players have more than one). Its type and value are those of poker_utils.determine_best_hand:
+#     4 straight flush, 3 pair, 2 straight, 1 flush (value high * 14 + low), 0 high card
+# and a strength packs them into one integer, type << TYPE_SHIFT | value, so hands compare with < / > / ==. The
+# strength of a deal is the best strength of its 2 card hands, and without any combination the high card: the
+# ranks of the hole cards, highest first, as base 14 digits (the rank of the hole card, with 1 hole card).
+#
+# With 1 hole card and 3 community cards, strengths compare exactly like the showdown strength table.
+
+HAND_SIZE = 2
+TYPE_SHIFT = 16
+HIGH_CARD, FLUSH, STRAIGHT, PAIR, STRAIGHT_FLUSH = range(5)
+MAX_HOLE_CARDS = 4 # High card values (base 14 digits of the hole ranks) must stay below 1 << TYPE_SHIFT
+
+
+def _build_pair_strengths():
+    """ Strength of the 2 card hand (a, b) for every pair of cards: shape (52, 52), 0 on the diagonal and for pairs
+    of cards that make no combination. """
+    ranks = np.arange(NUM_CARDS) // 4 + 1
+    suits = np.arange(NUM_CARDS) % 4
+    r, rx = ranks[:, None], ranks[None, :]
+    same_suit = suits[:, None] == suits[None, :]
+    straight = np.where(rx == r + 1, rx, np.where(rx == r - 1, r, 0))
+    strength = np.select(
+        [same_suit & (straight > 0), rx == r, straight > 0, same_suit],
+        [STRAIGHT_FLUSH << TYPE_SHIFT | straight, PAIR << TYPE_SHIFT | r, STRAIGHT << TYPE_SHIFT | straight,
+         FLUSH << TYPE_SHIFT | (np.maximum(r, rx) * 14 + np.minimum(r, rx))],
+        default=0,
+    ).astype(np.int64)
+    np.fill_diagonal(strength, 0)
+    return strength
+
+PAIR_STRENGTH = _build_pair_strengths()
+_pair_rows = PAIR_STRENGTH.tolist() # Lists index faster than arrays one element at a time
+
+
+def high_card(hole):
+    """ Strength of a high card hand: the ranks of the hole cards, highest first, as base 14 digits. """
+    value = 0
+    for rank in sorted(((card >> 2) + 1 for card in hole), reverse=True):
+        value = value * 14 + rank
+    return value
+
+
+def hand_strength(hole, community):
+    """ Return the strength of a deal: hole and community are lists of integer cards. """
+    best = 0
+    for i, card in enumerate(hole):
+        row = _pair_rows[card]
+        for other in community:
+            if row[other] > best:
+                best = row[other]
+        for other in hole[i + 1:]:
+            if row[other] > best:
+                best = row[other]
+    return best if best else high_card(hole)
+
+
+def hand_strengths(holes, community_cards):
+    """ Batched hand_strength(): holes is an int array of shape (n, hole cards), community cards of shape
+    (n, community cards). Returns an int64 array of shape (n,). """
+    holes = np.asarray(holes, dtype=np.int64)
+    cards = np.concatenate([holes, np.asarray(community_cards, dtype=np.int64)], axis=1)
+    best = PAIR_STRENGTH[holes[:, :, None], cards[:, None, :]].max(axis=(1, 2)) if len(holes) else np.zeros(0, dtype=np.int64)
+    ranks = -np.sort(-(holes >> 2) - 1, axis=1) # Highest first
+    high = np.zeros(len(holes), dtype=np.int64)
+    for column in range(holes.shape[1]):
+        high = high * 14 + ranks[:, column]
+    return np.where(best > 0, best, high)
+
+
+def hand_type(strength):
+    return strength >> TYPE_SHIFT
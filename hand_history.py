@@ -0,0 +1,155 @@
+import json
+import os
+import struct
+import zlib
+import numpy as np
+
+# Binary hand histories: one fixed-width record per game, streamed to an append-only file.
+#
+# File layout:
+#     header: MAGIC, then a little-endian uint32 length and a JSON object {"version": ..., "dtype": ...}
+#     chunks: a little-endian (compressed flag, number of records, payload bytes) uint32 triple, then the payload:
+#             the records of RECORD_DTYPE, raw or zlib-compressed
+# A file can be reopened to append more chunks; its header must match. Readers stop at a truncated last chunk, so
+# a file stays readable up to its last complete chunk if a writer is interrupted.
+
+MAGIC = b"HANDHIST"
+VERSION = 1
+RECORD_DTYPE = np.dtype([
+    ("seed", "<u8"), # Seed of the run that dealt the game
+    ("game", "<u4"), # Index of the game in its run
+    ("hands", "u1", (2,)), # Integer cards (see deck.py) of P0 and P1
+    ("community", "u1", (3,)),
+    ("history", "i1", (3,)), # Betting history, padded with -1
+    ("winner", "i1"), # 1 for P0, -1 for P1, 0 for a tie
+    ("margin", "i1"), # Chips won by P0 (negative if P1 won)
+])
+_chunk_header = struct.Struct("<III")
+_record = struct.Struct("<QI5B3b2b") # RECORD_DTYPE, packed by write()
+assert _record.size == RECORD_DTYPE.itemsize
+
+
+def _file_header():
+    header = json.dumps({"version": VERSION, "dtype": RECORD_DTYPE.descr}).encode()
+    return MAGIC + struct.pack("<I", len(header)) + header
+
+
+class HandHistoryWriter:
+    """ Append games to a hand history file, chunk_size records per chunk (zlib-compressed if compress).
+
+    Records are packed into a preallocated buffer and written when it is full, on flush() and on close(), so
+    writing one game is a single struct.pack_into(). Use as a context manager, or call close().
+    """
+    def __init__(self, path, seed=0, compress=False, chunk_size=4096):
+        self.seed = seed
+        self.games = 0
+        self._compress = compress
+        self._chunk_size = chunk_size
+        self._buffer = bytearray(chunk_size * RECORD_DTYPE.itemsize)
+        self._count = 0
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            with open(path, "rb") as f:
+                if _read_header(f) != _file_header():
+                    raise ValueError(f"{path}: hand history header doesn't match version {VERSION}")
+        self._file = open(path, "ab")
+        if not exists:
+            self._file.write(_file_header())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, hands, community_cards, history, winner, margin):
+        """ Record one game: hands is [P0 hand, P1 hand] (lists of 1 card), the rest as in PokerGame. """
+        _record.pack_into(self._buffer, self._count * _record.size, self.seed, self.games, hands[0][0], hands[1][0],
+                          *community_cards, *(list(history) + [-1, -1, -1])[:3], winner, margin)
+        self.games += 1
+        self._count += 1
+        if self._count == self._chunk_size:
+            self.flush()
+
+    def write_batch(self, hands, community_cards, histories, winners, margins):
+        """ Record n games at once: hands (n, 2), community cards (n, 3), histories (n, 3) padded with -1,
+        winners and margins (n,). """
+        records = np.zeros(len(winners), dtype=RECORD_DTYPE)
+        records["seed"] = self.seed
+        records["game"] = self.games + np.arange(len(winners))
+        records["hands"] = hands
+        records["community"] = community_cards
+        records["history"] = histories
+        records["winner"] = winners
+        records["margin"] = margins
+        self.games += len(winners)
+        self.flush()
+        self._write_chunk(records)
+
+    def flush(self):
+        if self._count:
+            self._write_chunk(np.frombuffer(self._buffer, dtype=RECORD_DTYPE, count=self._count))
+            self._count = 0
+        self._file.flush()
+
+    def _write_chunk(self, records):
+        payload = records.tobytes()
+        if self._compress:
+            payload = zlib.compress(payload)
+        self._file.write(_chunk_header.pack(int(self._compress), len(records), len(payload)))
+        self._file.write(payload)
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+def _read_header(f):
+    start = f.read(len(MAGIC) + 4)
+    if start[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{f.name}: not a hand history file")
+    length, = struct.unpack("<I", start[len(MAGIC):])
+    return start + f.read(length)
+
+
+def read_chunks(path):
+    """ Yield the records of a hand history file one chunk at a time, as structured arrays of RECORD_DTYPE. """
+    with open(path, "rb") as f:
+        header = _read_header(f)
+        version = json.loads(header[len(MAGIC) + 4:])["version"]
+        if version != VERSION:
+            raise ValueError(f"{path}: hand history version {version}, expected {VERSION}")
+        while True:
+            chunk_header = f.read(_chunk_header.size)
+            if len(chunk_header) < _chunk_header.size:
+                return
+            compressed, count, size = _chunk_header.unpack(chunk_header)
+            payload = f.read(size)
+            if len(payload) < size:
+                return
+            if compressed:
+                payload = zlib.decompress(payload)
+            yield np.frombuffer(payload, dtype=RECORD_DTYPE, count=count)
+
+
+def read_games(path):
+    """ Yield every game of a hand history file as a record (a numpy.void: record["hands"], record["margin"], ...). """
+    for records in read_chunks(path):
+        yield from records
+
+
+def load_hand_histories(path):
+    """ Return every game of a hand history file as one structured array of RECORD_DTYPE. """
+    chunks = list(read_chunks(path))
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=RECORD_DTYPE)
+
+
+def record_games(path, p0_agent, p1_agent, num_games, seed=0, compress=True, batch_size=1 << 16):
+    """ Play num_games between two agents with batch_poker.BatchPokerGame (p0_agent always P0) and append them to a
+    hand history file, for offline training or analysis. """
+    from batch_poker import BatchPokerGame
+    with HandHistoryWriter(path, seed=seed, compress=compress) as writer:
+        game = BatchPokerGame(seed, history_writer=writer)
+        for start in range(0, num_games, batch_size):
+            game.play(p0_agent, p1_agent, min(batch_size, num_games - start))
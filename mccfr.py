@@ -0,0 +1,242 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import game_tree
+from batch_poker import BatchPokerGame
+from canonical import canonical_indices, NUM_CANONICAL_STATES
+from cfr import regret_matching, normalize
+from game_tree import BoardTables, NUM_NODES, NUM_ACTIONS, BLIND, BET
+
+# Monte Carlo CFR over the same information sets as CFRSolver: (decision node, canonical state).
+#
+# Instead of traversing every deal, each iteration samples one deal and, for each player in turn (the traverser),
+#     external sampling: explores every action of the traverser and samples the opponent's actions
+#     outcome sampling: samples a single path, exploring the traverser's actions with probability epsilon
+# and updates the traverser's regrets at the nodes it visited. Only the deals sampled need to be evaluated, so the
+# cost of an iteration doesn't grow with the number of possible deals.
+#
+# Iterations run in rounds across a process pool. Regrets and strategy sums live in shared memory: during a round
+# every worker reads them (without locks: nothing writes to them until the round is over), runs its share of the
+# iterations against that snapshot and writes its updates into its own shared memory slot. At the end of the
+# round the slots are summed into the tables in one batched reduction.
+
+TABLE_SHAPE = (NUM_NODES, NUM_CANONICAL_STATES, NUM_ACTIONS)
+
+
+def _scatter(table, node, info_states, values, mask=None):
+    """ Add per deal values of shape (n, 2) to table[node] at the given information states. """
+    if mask is not None:
+        info_states, values = info_states[mask], values[mask]
+    for a in range(NUM_ACTIONS):
+        table[node, :, a] += np.bincount(info_states, values[:, a], minlength=NUM_CANONICAL_STATES)
+
+def _sample(strategy, rng):
+    """ Sample an action (0 or 1) per row of a (n, 2) strategy. """
+    return (rng.random(len(strategy)) < strategy[:, 1]).astype(np.int64)
+
+def _one_hot(actions):
+    return np.stack([actions == 0, actions == 1], axis=1).astype(np.float64)
+
+def _dot(strategy, values):
+    return (strategy * values).sum(axis=1, keepdims=True)
+
+
+def external_sampling(regrets, num_deals, seed, regret_updates, strategy_updates):
+    """ Run num_deals external sampling iterations against a snapshot of the regrets, adding the updates to
+    regret_updates and strategy_updates.
+    """
+    game = BatchPokerGame(seed)
+    rng = np.random.default_rng(seed)
+    hands, community_cards = game.deal_cards(num_deals)
+    w = game.showdown(hands, community_cards)[:, None].astype(np.float64) # P0's showdown result
+    c0 = canonical_indices(hands[:, 0], community_cards).astype(np.int64)
+    c1 = canonical_indices(hands[:, 1], community_cards).astype(np.int64)
+    s0, s3 = regret_matching(regrets[0, c0]), regret_matching(regrets[3, c0])
+    s1, s2 = regret_matching(regrets[1, c1]), regret_matching(regrets[2, c1])
+
+    # P0 traverses: sample P1's response to a check and to a bet
+    p1_bets = _sample(s1, rng) == 1
+    p1_calls = _sample(s2, rng) == 1
+    node3 = np.hstack([np.full_like(w, -BLIND), (BLIND + BET) * w])
+    check = np.where(p1_bets[:, None], _dot(s3, node3), BLIND * w)
+    bet = np.where(p1_calls[:, None], (BLIND + BET) * w, BLIND)
+    root = np.hstack([check, bet])
+    _scatter(regret_updates, 0, c0, root - _dot(s0, root))
+    _scatter(regret_updates, 3, c0, node3 - _dot(s3, node3), p1_bets)
+    _scatter(strategy_updates, 1, c1, s1)
+    _scatter(strategy_updates, 2, c1, s2)
+
+    # P1 traverses: sample P0's first action and its response to a bet
+    p0_bets = _sample(s0, rng) == 1
+    p0_calls = _sample(s3, rng) == 1
+    node1 = np.hstack([-BLIND * w, np.where(p0_calls[:, None], -(BLIND + BET) * w, BLIND)])
+    node2 = np.hstack([np.full_like(w, -BLIND), -(BLIND + BET) * w])
+    _scatter(regret_updates, 1, c1, node1 - _dot(s1, node1), ~p0_bets)
+    _scatter(regret_updates, 2, c1, node2 - _dot(s2, node2), p0_bets)
+    _scatter(strategy_updates, 0, c0, s0)
+    _scatter(strategy_updates, 3, c0, s3, ~p0_bets)
+
+
+def outcome_sampling(regrets, num_deals, seed, regret_updates, strategy_updates, epsilon=0.6):
+    """ Run num_deals outcome sampling iterations against a snapshot of the regrets, adding the updates to
+    regret_updates and strategy_updates. The traverser samples each action with probability
+    epsilon / 2 + (1 - epsilon) * (its strategy), the opponent follows its strategy.
+    """
+    game = BatchPokerGame(seed)
+    rng = np.random.default_rng(seed)
+    hands, community_cards = game.deal_cards(num_deals)
+    w = game.showdown(hands, community_cards).astype(np.float64)
+    c0 = canonical_indices(hands[:, 0], community_cards).astype(np.int64)
+    c1 = canonical_indices(hands[:, 1], community_cards).astype(np.int64)
+    s0, s3 = regret_matching(regrets[0, c0]), regret_matching(regrets[3, c0])
+    s1, s2 = regret_matching(regrets[1, c1]), regret_matching(regrets[2, c1])
+    explore = lambda strategy: epsilon / NUM_ACTIONS + (1 - epsilon) * strategy
+    rows = np.arange(num_deals)
+
+    def payoff(p0_bets, p1_bets, p0_calls):
+        """ P0's chips at the end of each sampled path. """
+        showdown = np.where(p0_bets | p1_bets, BLIND + BET, BLIND) * w
+        check_path = np.where(p1_bets, np.where(p0_calls, showdown, -BLIND), showdown)
+        bet_path = np.where(p1_bets, showdown, BLIND) # After a bet, p1_bets means P1 calls
+        return np.where(p0_bets, bet_path, check_path)
+
+    # P0 traverses
+    q0, q3 = explore(s0), explore(s3)
+    a0 = _sample(q0, rng)
+    a3 = _sample(q3, rng)
+    p1_response = np.where(a0 == 1, _sample(s2, rng), _sample(s1, rng))
+    reaches_node3 = (a0 == 0) & (p1_response == 1)
+    u = payoff(a0 == 1, p1_response == 1, a3 == 1)
+    q = q0[rows, a0] * np.where(reaches_node3, q3[rows, a3], 1) # Probability of sampling the traverser's actions
+    value3 = (u / q)[:, None] * _one_hot(a3)
+    value0 = (u * np.where(reaches_node3, s3[rows, a3], 1) / q)[:, None] * _one_hot(a0)
+    _scatter(regret_updates, 0, c0, value0 - _dot(s0, value0))
+    _scatter(regret_updates, 3, c0, value3 - _dot(s3, value3), reaches_node3)
+    _scatter(strategy_updates, 1, c1, s1, a0 == 0)
+    _scatter(strategy_updates, 2, c1, s2, a0 == 1)
+
+    # P1 traverses
+    q1, q2 = explore(s1), explore(s2)
+    b0 = _sample(s0, rng)
+    b1 = np.where(b0 == 1, _sample(q2, rng), _sample(q1, rng))
+    b3 = _sample(s3, rng)
+    u = -payoff(b0 == 1, b1 == 1, b3 == 1)
+    q = np.where(b0 == 1, q2[rows, b1], q1[rows, b1])
+    value = (u / q)[:, None] * _one_hot(b1)
+    _scatter(regret_updates, 1, c1, value - _dot(s1, value), b0 == 0)
+    _scatter(regret_updates, 2, c1, value - _dot(s2, value), b0 == 1)
+    _scatter(strategy_updates, 0, c0, s0)
+    _scatter(strategy_updates, 3, c0, s3, (b0 == 0) & (b1 == 1))
+
+
+SAMPLERS = {"external": external_sampling, "outcome": outcome_sampling}
+
+
+_shared = {} # Shared memory blocks attached in this process, by name
+
+def _attach(name, count=1):
+    """ Return the array(s) of TABLE_SHAPE stored in a shared memory block, attaching to it on first use. """
+    if name not in _shared:
+        _shared[name] = shared_memory.SharedMemory(name=name)
+    return np.ndarray((count,) + TABLE_SHAPE, dtype=np.float64, buffer=_shared[name].buf)
+
+def _run_slot(task):
+    """ Run one worker's share of a round, writing its updates into its slot of the update buffers. """
+    mode, tables_name, updates_name, num_workers, slot, num_deals, seed = task
+    regrets = _attach(tables_name, 2)[0]
+    updates = _attach(updates_name, 2 * num_workers)
+    regret_updates, strategy_updates = updates[2 * slot], updates[2 * slot + 1]
+    regret_updates[:] = 0
+    strategy_updates[:] = 0
+    SAMPLERS[mode](regrets, num_deals, seed, regret_updates, strategy_updates)
+    return num_deals
+
+
+class MCCFRSolver:
+    """ Monte Carlo CFR (external or outcome sampling) with iterations spread over num_workers processes.
+        Use it as a context manager, or call close(), to free the shared memory.
+    """
+    def __init__(self, mode="external", num_workers=1, deals_per_round=20000, seed=0):
+        assert mode in SAMPLERS
+        self.mode = mode
+        self.num_workers = num_workers
+        self.deals_per_round = deals_per_round
+        self.seed = seed
+        self.iterations = 0
+        self.rounds = 0
+        self._tables = None
+
+        size = int(np.prod(TABLE_SHAPE)) * 8
+        self._tables_block = shared_memory.SharedMemory(create=True, size=2 * size)
+        self._updates_block = shared_memory.SharedMemory(create=True, size=2 * num_workers * size)
+        tables = np.ndarray((2,) + TABLE_SHAPE, dtype=np.float64, buffer=self._tables_block.buf)
+        tables[:] = 0
+        self.regrets, self.strategy_sums = tables[0], tables[1]
+        self._updates = np.ndarray((2 * num_workers,) + TABLE_SHAPE, dtype=np.float64, buffer=self._updates_block.buf)
+        self._pool = ProcessPoolExecutor(num_workers) if num_workers > 1 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._tables_block is not None:
+            self.regrets = self.strategy_sums = self._updates = None
+            for block in (self._tables_block, self._updates_block):
+                if block.name in _shared:
+                    _shared.pop(block.name).close()
+                block.close()
+                block.unlink()
+            self._tables_block = self._updates_block = None
+
+    def average_strategy(self):
+        return normalize(self.strategy_sums)
+
+    def exploitability(self):
+        """ Exact exploitability of the average strategy, in chips per game """
+        if self._tables is None:
+            self._tables = BoardTables()
+        return game_tree.exploitability(self._tables, self.average_strategy())
+
+    def run_round(self):
+        """ Run deals_per_round iterations split across the workers, then merge their updates. """
+        share = -(-self.deals_per_round // self.num_workers)
+        tasks = [(self.mode, self._tables_block.name, self._updates_block.name, self.num_workers, slot, share,
+                  int(np.random.SeedSequence([self.seed, self.rounds, slot]).generate_state(1)[0]))
+                 for slot in range(self.num_workers)]
+        if self._pool is None:
+            done = sum(map(_run_slot, tasks))
+        else:
+            done = sum(self._pool.map(_run_slot, tasks))
+        # Batched reduction of every worker's slot into the shared tables
+        self.regrets += self._updates[0::2].sum(axis=0)
+        self.strategy_sums += self._updates[1::2].sum(axis=0)
+        self.iterations += done
+        self.rounds += 1
+
+    def solve(self, seconds=None, iterations=None, report_every=5, verbose=False):
+        """ Run rounds until the time (seconds) or iteration budget is spent, measuring the exploitability of the
+        average strategy every report_every rounds.
+
+        Returns a list of (iterations, seconds, iterations per second, exploitability) measurements; the time spent
+        measuring exploitability is not counted.
+        """
+        measurements = []
+        elapsed = 0.0
+        while (seconds is None or elapsed < seconds) and (iterations is None or self.iterations < iterations):
+            start = time.perf_counter()
+            self.run_round()
+            elapsed += time.perf_counter() - start
+            if self.rounds % report_every == 0:
+                exploitability = self.exploitability()
+                measurements.append((self.iterations, elapsed, self.iterations / elapsed, exploitability))
+                if verbose:
+                    print(f"{self.mode} sampling, {self.num_workers} workers: {self.iterations} iterations in {elapsed:.1f}s "
+                          f"({self.iterations / elapsed:.0f}/s), exploitability {exploitability * 1000:.3f} mchips/game")
+        return measurements
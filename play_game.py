@@ -1,6 +1,5 @@
 # Simplified poker by: Max Velasco, Francisco Almeida, and Madhav Lavakare
 
-from poker import PokerGame
 from random_policy import Random_Agent
 from expectimax import ExpectimaxAgent
 from always_bet_policy import Always_Bet_Agent
@@ -8,45 +7,32 @@ from always_fold_policy import Always_Fold_Agent
 from dqn_agent import DQNAgent
 from cfr import CFR_Agent
 import numpy as np
+import os
+import time
+from tournament import play_chunk, run_tournament, format_table, estimate, ConfidenceWidth
+from best_response import ExactEvaluator, format_exact_table
+from checkpoint import checkpoint_exists
+from profiling import Profiler
 
 
-def play_matchup(p0_agent, p1_agent):
-
-    p0_wins = 0
-    p0_reward = 0
-    ties = 0
-
-    # p1_reward = 0
-
-    #Simulate game
-    for i in range(num_games):
-        #NOTE: since there is an advantage to being P1, when evaluating 2 agents, we should alternate between which policy is P0 and P1 (equal number)
-        # To simulate the agents swapping positions
-        if i % 2 == 0:
-            winner, margin = game.play(p0_agent, p1_agent, verbose=False) #Set Verbose to True if you want to see how the game plays out
-            if winner == 1:
-                p0_wins += 1 #Since p0 was put as p0 in the simulation
-            elif winner == 0:
-                ties += 1
-            p0_reward += margin
-            # p1_reward -= margin
-        else:
-            winner, margin = game.play(p1_agent, p0_agent, verbose=False)
-            if winner == -1:
-                p0_wins += 1 #Since p0 was put as p1 in the simulation
-            elif winner == 0:
-                ties += 1
-            p0_reward -= margin
-            # p1_reward += margin
-    
-    print(f"{p0_agent} vs {p1_agent}\n{num_games} games.\nP0 avg reward/game: {(p0_reward/num_games):.2f}\nP0 win: {(p0_wins/num_games) * 100:.2f}%. Tie: {(ties/num_games) * 100:.2f}%. P1 win: {((num_games-ties-p0_wins)/num_games) * 100:.2f}%\n")
+def play_matchup(p0_agent, p1_agent, num_games=25000, seed=0, duplicate=True, control_variate=True):
+    """ Play num_games between two agents (alternating who is P0 and P1) and print the results with 95% confidence
+        intervals. duplicate plays each deal twice with the seats swapped, control_variate corrects the results with
+        the exact showdown equity of the deals (see tournament.py).
+    """
+    result = play_chunk(p0_agent, p1_agent, 0, num_games, seed, duplicate=duplicate)
+    e = estimate(result, control_variate)
+    print(f"{p0_agent} vs {p1_agent}\n{num_games} games.\nP0 avg reward/game: {e.reward.mean:.2f} +- {e.reward.half_width:.3f}\nP0 win: {e.wins.mean * 100:.2f}% +- {e.wins.half_width * 100:.2f}. Tie: {e.ties.mean * 100:.2f}% +- {e.ties.half_width * 100:.2f}. P1 win: {(1 - e.wins.mean - e.ties.mean) * 100:.2f}%\n")
 
 
 
 # Simulate the game with your policy agent
 if __name__ == "__main__":
-    num_games = 25000 #How many games to simulate
-    game = PokerGame() #Initialize the game model
+    num_games = 25000 #Maximum games per matchup: the stopping rule below ends each matchup once it is decided
+    stopping = ConfidenceWidth(half_width=0.02) #Stop each matchup once its reward/game is known to +- 0.02 (or SPRT(delta=0.05))
+    num_workers = os.cpu_count() #Matchups (and chunks of games inside each matchup) are spread across processes
+    profile = False #Time the phases of the games (dealing, each agent's decisions, showdown, see profiling.py)
+    exact = False #Compute exact expected values and exploitability (best_response.py) instead of simulating games
 
     # Agent must have a take_action() function from: state (hand, community card, betting history) -> action in range [0, 1]
     always_bet_agent = Always_Bet_Agent()
@@ -58,19 +44,34 @@ if __name__ == "__main__":
     ev_80 = ExpectimaxAgent(bet_threshold=0.8, verbose=False)
     ev_90 = ExpectimaxAgent(bet_threshold=0.9, verbose=False)
 
-    dqn = DQNAgent()
-    cfr = CFR_Agent()
+    # Trained agents are loaded from their checkpoints when they exist (see checkpoint.py)
+    dqn_checkpoint = os.path.join("checkpoints", "dqn") #Saved by dqn_vs_expectimax.py
+    cfr_checkpoint = os.path.join("checkpoints", "cfr")
+    dqn = DQNAgent.from_checkpoint(dqn_checkpoint, replay=False) if checkpoint_exists(dqn_checkpoint) else DQNAgent()
+    dqn.freeze("numpy") #Fast CPU inference path for evaluation (see DQNAgent.freeze)
+    if not checkpoint_exists(cfr_checkpoint):
+        CFR_Agent().save(cfr_checkpoint)
+    cfr = CFR_Agent(checkpoint=cfr_checkpoint, read_only=True) #Tournament workers all map the same strategy file
     
     agents = [always_bet_agent, always_fold_agent, random, dqn, cfr, ev_30, ev_50, ev_70, ev_80, ev_90]
 
 
-    print("DQN vs. all agents")
-    for p1 in agents:
-
-        play_matchup(dqn, p1)
-
-
-    print("\nCFR vs. all agents")    
-    for p1 in agents:
-
-        play_matchup(cfr, p1)
\ No newline at end of file
+    dqn_index = agents.index(dqn)
+    cfr_index = agents.index(cfr)
+    matchups = [(dqn_index, p1) for p1 in range(len(agents))] + [(cfr_index, p1) for p1 in range(len(agents))]
+
+    if exact:
+        # DQN depends on suit labels, so every raw information state is evaluated
+        print(format_exact_table(agents, matchups, ExactEvaluator(symmetric=False)))
+    else:
+        # The same seed gives the same results for any number of workers
+        start = time.perf_counter()
+        results = run_tournament(agents, matchups, num_games=num_games, chunk_size=250, num_workers=num_workers, seed=0,
+                                 duplicate=True, stopping=stopping, profile=profile)
+        print(format_table(agents, matchups, results))
+        if profile:
+            profiler = sum((result.profile for result in results), Profiler())
+            print(profiler.report())
+            profiler.save_json("profile.json")
+            profiler.save_folded("profile.folded") #For flamegraph.pl or speedscope
+        print(f"{sum(result.games for result in results)} games ({len(matchups) * num_games} without early stopping) in {time.perf_counter() - start:.1f}s")
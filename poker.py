@@ -1,19 +1,39 @@
-from deck import Deck, Card
+import time
+from deck import Deck, card_rank, to_cards
+import hand_evaluator
+import poker_hands
 import poker_utils
+import showdown_table
 
 # Keep track of our game according to our rules
 class PokerGame:
     # Initialize the deck to be standard 52-card deck
-    def __init__(self):
+    def __init__(self, history_writer=None, profiler=None, num_player_cards=1, num_community_cards=3, hand_size=hand_evaluator.HAND_SIZE):
+        """ num_player_cards, num_community_cards and hand_size configure larger hands: hand_size is 2 for our
+        simplified hands (hand_evaluator.py) or 5 for standard poker hands, the best 5 of a player's cards and the
+        community cards (poker_hands.py). The defaults are our game.
+        """
+        if hand_size not in (hand_evaluator.HAND_SIZE, 5):
+            raise ValueError(f"hands of {hand_size} cards aren't supported (only {hand_evaluator.HAND_SIZE} or 5)")
+        if hand_size == 5 and not poker_hands.MIN_CARDS <= num_player_cards + num_community_cards <= poker_hands.MAX_CARDS:
+            raise ValueError(f"5 card hands are made of {poker_hands.MIN_CARDS} to {poker_hands.MAX_CARDS} cards per player")
+        default_cards = num_player_cards == 1 and num_community_cards == showdown_table.NUM_COMMUNITY_CARDS
+        if history_writer is not None and not (default_cards and hand_size == hand_evaluator.HAND_SIZE):
+            raise ValueError("hand histories only record games of the default configuration")
         self._deck = Deck()
         self._actions = [0, 1] #0 is fold or pass, 1 is check or bet
-        self._num_community_cards = 3
-        self._num_player_cards = 1
-        self._hands = [[], []] #hands[0] is player 1's hand, hands[1] is player 2's hand. Each hand is a list of Card objects
-        self._community_cards = [] # List of Card objects that are the community cards
+        self._num_community_cards = num_community_cards
+        self._num_player_cards = num_player_cards
+        self._hand_size = hand_size
+        self._hands = [[], []] #hands[0] is player 1's hand, hands[1] is player 2's hand. Each hand is a list of integer cards (see deck.py)
+        self._community_cards = [] # List of integer cards that are the community cards
         self._history = [] #List of actions each player takes (0 or 1), always starts from P0's action.
         self._blind = 1
         self._bet = 2
+        #Precomputed hand strength of every (hand, community cards) deal, for the default configuration
+        self._strengths = showdown_table.get_strength_table() if default_cards and hand_size == hand_evaluator.HAND_SIZE else None
+        self._history_writer = history_writer #Records every game played, if set (see hand_history.py)
+        self.profiler = profiler #Times the phases of every game played, if set (see profiling.py)
 
     # Reset the game so we can start again
     def reset_game(self):
@@ -66,6 +86,38 @@ class PokerGame:
         #Otherwise, evaluate the better hand.
         #If both players checked, pot = 2 x blind, so reward = blind. If both players bet, pot = 2 x (blind + bet), reward = blind + bet
         reward = self._blind if self._history == [0, 0] else self._blind + self._bet
+
+        if self._strengths is None:
+            # Larger hands: standard 5 card hands, or our 2 card hands from more cards
+            if self._hand_size == 5:
+                p0_strength = poker_hands.hand_value(self._hands[0] + self._community_cards)
+                p1_strength = poker_hands.hand_value(self._hands[1] + self._community_cards)
+                if verbose:
+                    print(f"P0 hand: {poker_hands.describe(p0_strength)}")
+                    print(f"P1 hand: {poker_hands.describe(p1_strength)}")
+            else:
+                p0_strength = hand_evaluator.hand_strength(self._hands[0], self._community_cards)
+                p1_strength = hand_evaluator.hand_strength(self._hands[1], self._community_cards)
+        elif verbose:
+            return self.compare_hands(reward, verbose)
+        else:
+            # Both hands share the community cards, so the showdown is two table reads and a compare
+            board = showdown_table.board_index(self._community_cards)
+            p0_strength = self._strengths[self._hands[0][0] * showdown_table.NUM_BOARDS + board]
+            p1_strength = self._strengths[self._hands[1][0] * showdown_table.NUM_BOARDS + board]
+        if p0_strength > p1_strength:
+            return 1, reward
+        elif p1_strength > p0_strength:
+            return -1, -reward
+        return 0, 0
+
+    def compare_hands(self, reward, verbose):
+        """ Compare the players' hands category by category (printing each step if verbose). Gives the same result
+        as the strength table lookup in determine_game_result.
+        Returns:
+            the winner: 1 for p0, -1 for p1
+            the amount of chips won: +ve for p0 win, -ve for p1 win
+        """
         # Note, since a complete hand is only 2 cards in total, and since in Poker only the highest hand plays,
         # then if in any category, both players have the same (non-zero) pair, straight, etc. then it must be a tie 
         # (there is no "kicker")
@@ -142,11 +194,11 @@ class PokerGame:
         
         #No pair, straight, or flush. Compare cards
         if verbose:
-            print(f"P0 high card: {self._hands[0][0].rank()}")
-            print(f"P1 high card: {self._hands[1][0].rank()}")
-        if self._hands[0][0].rank() > self._hands[1][0].rank():
+            print(f"P0 high card: {card_rank(self._hands[0][0])}")
+            print(f"P1 high card: {card_rank(self._hands[1][0])}")
+        if self._hands[0][0] >> 2 > self._hands[1][0] >> 2:
             return 1, reward
-        elif self._hands[1][0].rank() > self._hands[0][0].rank():
+        elif self._hands[1][0] >> 2 > self._hands[0][0] >> 2:
             return -1, -reward
         
         # Tie
@@ -183,26 +235,42 @@ class PokerGame:
 
 
 
-    def play(self, p0_policy, p1_policy, verbose=False):
+    def play(self, p0_policy, p1_policy, verbose=False, deal=None):
         """ Play 1 game of simplified poker, return the result of the game and the margin of victory
 
             p0_policy -- player 0's policy: has a function take_action() that takes in a state and returns action
             p1_policy -- player 1's policy
+            deal -- optional ([P0 hand, P1 hand], community cards) to play instead of dealing from the shuffled deck
         """
+        profiler = self.profiler
+        if profiler is not None:
+            start = last = time.perf_counter_ns()
+
         # First reset the game states
         self.reset_game()
-
-        # Shuffle the deck of cards
-        self.shuffle_deck()
-
-        # Deal the player cards and the community cards
-        self.deal_cards()
+        if profiler is not None:
+            last = profiler.lap("play;reset", last)
+
+        if deal is None:
+            # Shuffle the deck of cards
+            self.shuffle_deck()
+            if profiler is not None:
+                last = profiler.lap("play;shuffle", last)
+
+            # Deal the player cards and the community cards
+            self.deal_cards()
+        else:
+            hands, community_cards = deal
+            self._hands = [list(hands[0]), list(hands[1])]
+            self._community_cards = list(community_cards)
+        if profiler is not None:
+            last = profiler.lap("play;deal", last)
 
         # Print out results
         if verbose:
-            print(f"P0 Hand: {self._hands[0]}")
-            print(f"P1 Hand: {self._hands[1]}")
-            print(f"Community Cards: {self._community_cards}\n")
+            print(f"P0 Hand: {to_cards(self._hands[0])}")
+            print(f"P1 Hand: {to_cards(self._hands[1])}")
+            print(f"Community Cards: {to_cards(self._community_cards)}\n")
 
         policies = [p0_policy, p1_policy]
         p = 0 #Always start from player 1
@@ -211,7 +279,12 @@ class PokerGame:
 
             opp = int(not p)
 
-            action = policies[p].take_action(self.get_state(p), self.get_state(opp))
+            if profiler is not None:
+                last = time.perf_counter_ns()
+                action = policies[p].take_action(self.get_state(p), self.get_state(opp))
+                last = profiler.lap(profiler.agent_phase(policies[p]), last)
+            else:
+                action = policies[p].take_action(self.get_state(p), self.get_state(opp))
             if verbose:
                 print(f"Player {p} chooses: {action}")
             self._history.append(action)
@@ -220,7 +293,11 @@ class PokerGame:
         if verbose:
             print(f"Betting ended. History: {self._history}\n")
         
+        if profiler is not None:
+            last = time.perf_counter_ns()
         winner, margin = self.determine_game_result(verbose=verbose)
+        if profiler is not None:
+            last = profiler.lap("play;determine_game_result", last)
         if verbose:
             if winner == 1:
                 print(f"P0 won {margin} chips\n\n")
@@ -230,5 +307,12 @@ class PokerGame:
 
             else:
                 print("Tie\n")
-        
+
+        if self._history_writer is not None:
+            self._history_writer.write(self._hands, self._community_cards, self._history, winner, margin)
+            if profiler is not None:
+                profiler.lap("play;history_writer", last)
+
+        if profiler is not None:
+            profiler.lap("play", start)
         return winner, margin
@@ -0,0 +1,215 @@
+from itertools import combinations, combinations_with_replacement
+from math import comb
+import numpy as np
+from deck import NUM_CARDS
+
+# Standard poker hand rankings for hands of 2 to 7 cards: the best 5 card hand that can be made from the cards.
+#
+# Unlike our simplified game (poker_utils.py, hand_evaluator.py), aces are high (and low in the 5-high straight),
+# and there are all the usual hand types and kickers. A hand's value packs its type and tiebreak ranks:
+#     type << 20 | r0 << 16 | r1 << 12 | r2 << 8 | r3 << 4 | r4
+# with ranks 0 (deuce) .. 12 (ace), so hands compare with < / > / ==. Hands of fewer than 5 cards can only be
+# high card, pair, two pair, three of a kind or four of a kind.
+#
+# Values come from two lookup tables:
+#     rank multisets: the sorted ranks r_0 <= .. <= r_{k-1} of k cards are perfectly hashed to their colexicographic
+#     rank sum(C(r_i + i, i + 1)) (the rank of the k-combination (r_i + i)), which indexes RANK_TABLES[k]: the value of
+#     the best hand ignoring suits
+#     flushes: the 13 bit mask of the ranks of the flush suit indexes FLUSH_TABLE: the value of the best flush or
+#     straight flush (0 for masks of less than 5 ranks)
+# and the value of a hand is the max of the two. At most one suit can have 5 of 7 cards: it is found from the sum of
+# per-card suit counters (3 bits per suit), and only the few hands that have one build a rank mask. The tables are
+# built on first use (a couple of seconds), and reference_value() evaluates hands by brute force over their 5 card
+# subsets to cross-check them (see cross_check()).
+
+HIGH_CARD, PAIR, TWO_PAIR, THREE_OF_A_KIND, STRAIGHT, FLUSH, FULL_HOUSE, FOUR_OF_A_KIND, STRAIGHT_FLUSH = range(9)
+HAND_TYPES = ("High card", "Pair", "Two pair", "Three of a kind", "Straight", "Flush", "Full house", "Four of a kind", "Straight flush")
+NUM_RANKS = 13
+MIN_CARDS, MAX_CARDS = 2, 7
+TYPE_SHIFT = 20
+
+# Rank (0 = deuce .. 12 = ace) and suit of each integer card of deck.py (where aces are rank 1)
+CARD_RANKS = [((card >> 2) - 1) % NUM_RANKS for card in range(NUM_CARDS)]
+CARD_SUITS = [card & 3 for card in range(NUM_CARDS)]
+_card_ranks = np.array(CARD_RANKS, dtype=np.int8) # Small rows sort faster
+_card_suits = np.array(CARD_SUITS, dtype=np.int64)
+CARD_BITS = [1 << rank for rank in CARD_RANKS]
+SUIT_COUNTERS = [1 << 3 * suit for suit in CARD_SUITS]
+_card_bits = np.array(CARD_BITS, dtype=np.int64)
+_suit_counters = np.array(SUIT_COUNTERS, dtype=np.int64)
+# COLEX[i][r] = C(r + i, i + 1): the contribution of the i-th smallest rank to the perfect hash
+COLEX = [[comb(r + i, i + 1) for r in range(NUM_RANKS)] for i in range(MAX_CARDS)]
+_colex = np.array(COLEX, dtype=np.int64)
+
+
+def pack(hand_type, ranks):
+    """ Return the value of a hand type with its tiebreak ranks (most significant first). """
+    value = hand_type
+    for i in range(5):
+        value = value << 4 | (ranks[i] if i < len(ranks) else 0)
+    return value
+
+
+def hand_type(value):
+    return value >> TYPE_SHIFT
+
+
+def _straight_high(ranks):
+    """ Highest card of the best straight in a set of ranks, or -1. The 5-high straight (wheel) counts the ace low. """
+    for high in range(NUM_RANKS - 1, 3, -1):
+        if all(high - i in ranks for i in range(5)):
+            return high
+    if {NUM_RANKS - 1, 0, 1, 2, 3} <= ranks:
+        return 3
+    return -1
+
+
+def _multiset_value(ranks):
+    """ Value of the best hand of cards with the given ranks (a sorted list), ignoring suits. """
+    counts = [0] * NUM_RANKS
+    for rank in ranks:
+        counts[rank] += 1
+    # Groups of equal ranks, biggest first, then highest first
+    groups = sorted(((count, rank) for rank, count in enumerate(counts) if count), reverse=True)
+    straight = _straight_high(set(ranks))
+    first_count, first_rank = groups[0]
+    others = sorted((rank for count, rank in groups[1:]), reverse=True)
+    if first_count == 4:
+        return pack(FOUR_OF_A_KIND, [first_rank] + others[:1])
+    if first_count == 3:
+        pairs = [rank for count, rank in groups[1:] if count >= 2]
+        if pairs:
+            return pack(FULL_HOUSE, [first_rank, max(pairs)])
+    if straight >= 0:
+        return pack(STRAIGHT, [straight])
+    if first_count == 3:
+        return pack(THREE_OF_A_KIND, [first_rank] + others[:2])
+    if first_count == 2:
+        pairs = [rank for count, rank in groups if count == 2]
+        if len(pairs) >= 2:
+            kickers = sorted((rank for count, rank in groups if rank not in pairs[:2]), reverse=True)
+            return pack(TWO_PAIR, pairs[:2] + kickers[:1])
+        return pack(PAIR, [first_rank] + others[:3])
+    return pack(HIGH_CARD, sorted(ranks, reverse=True)[:5])
+
+
+def _flush_value(mask):
+    """ Value of the best flush (or straight flush) made of the ranks in a 13 bit mask, 0 if less than 5 ranks. """
+    ranks = [rank for rank in range(NUM_RANKS) if mask >> rank & 1]
+    if len(ranks) < 5:
+        return 0
+    straight = _straight_high(set(ranks))
+    if straight >= 0:
+        return pack(STRAIGHT_FLUSH, [straight])
+    return pack(FLUSH, sorted(ranks, reverse=True)[:5])
+
+
+RANK_TABLES = None # RANK_TABLES[k]: value of every perfect hash of k ranks (0 for impossible multisets, e.g. 5 aces)
+FLUSH_TABLE = None
+FLUSH_SUITS = None # Suit with at least 5 cards of every sum of suit counters, or -1
+_rank_tables = None # As lists, for scalar lookups
+_flush_table = None
+_flush_suits = None
+
+def build_tables():
+    """ Build RANK_TABLES and FLUSH_TABLE (done on first use). """
+    global RANK_TABLES, FLUSH_TABLE, FLUSH_SUITS, _rank_tables, _flush_table, _flush_suits
+    tables = [None] * (MAX_CARDS + 1)
+    for k in range(MIN_CARDS, MAX_CARDS + 1):
+        table = np.zeros(comb(NUM_RANKS + k - 1, k), dtype=np.int64)
+        for ranks in combinations_with_replacement(range(NUM_RANKS), k):
+            if all(ranks[i] != ranks[i + 4] for i in range(k - 4)): # At most 4 cards of a rank
+                table[sum(COLEX[i][rank] for i, rank in enumerate(ranks))] = _multiset_value(list(ranks))
+        tables[k] = table
+    RANK_TABLES = tables
+    FLUSH_TABLE = np.array([_flush_value(mask) for mask in range(1 << NUM_RANKS)], dtype=np.int64)
+    counts = np.arange(1 << 12)[:, None] >> 3 * np.arange(4) & 7
+    FLUSH_SUITS = np.where(counts.max(axis=1) >= 5, counts.argmax(axis=1), -1)
+    _rank_tables = [table.tolist() if table is not None else None for table in tables]
+    _flush_table = FLUSH_TABLE.tolist()
+    _flush_suits = FLUSH_SUITS.tolist()
+
+
+def hand_value(cards):
+    """ Return the value of the best hand made of 2 to 7 cards (a list of integer cards). """
+    if _rank_tables is None:
+        build_tables()
+    ranks = sorted([CARD_RANKS[card] for card in cards])
+    value = _rank_tables[len(ranks)][sum(map(list.__getitem__, COLEX, ranks))]
+    if len(ranks) >= 5:
+        suit = _flush_suits[sum([SUIT_COUNTERS[card] for card in cards])]
+        if suit >= 0:
+            flush = _flush_table[sum([CARD_BITS[card] for card in cards if CARD_SUITS[card] == suit])]
+            if flush > value:
+                value = flush
+    return value
+
+
+def hand_values(cards, chunk_size=1 << 18):
+    """ Batched hand_value(): cards is an int array of shape (n, k), 2 <= k <= 7. Returns an int64 array of shape (n,). """
+    if RANK_TABLES is None:
+        build_tables()
+    cards = np.asarray(cards, dtype=np.intp)
+    n, k = cards.shape
+    values = np.empty(n, dtype=np.int64)
+    for start in range(0, n, chunk_size):
+        chunk = cards[start:start + chunk_size]
+        ranks = np.sort(_card_ranks[chunk], axis=1)
+        index = _colex[0][ranks[:, 0]]
+        for i in range(1, k):
+            index += _colex[i][ranks[:, i]]
+        value = RANK_TABLES[k][index]
+        if k >= 5:
+            suits = FLUSH_SUITS[_suit_counters[chunk].sum(axis=1)]
+            rows = np.flatnonzero(suits >= 0)
+            flush = chunk[rows]
+            masks = np.where(_card_suits[flush] == suits[rows, None], _card_bits[flush], 0).sum(axis=1)
+            value[rows] = np.maximum(value[rows], FLUSH_TABLE[masks])
+        values[start:start + chunk_size] = value
+    return values
+
+
+def _reference_five(cards):
+    """ Value of a hand of at most 5 cards, from its cards directly. """
+    ranks = sorted((CARD_RANKS[card] for card in cards), reverse=True)
+    groups = sorted(((ranks.count(rank), rank) for rank in set(ranks)), reverse=True)
+    shape = [count for count, rank in groups]
+    tiebreak = [rank for count, rank in groups]
+    if len(cards) == 5:
+        flush = len({CARD_SUITS[card] for card in cards}) == 1
+        straight = shape == [1] * 5 and (ranks[0] - ranks[4] == 4 or ranks == [12, 3, 2, 1, 0])
+        high = 3 if ranks == [12, 3, 2, 1, 0] else ranks[0]
+        if straight and flush:
+            return pack(STRAIGHT_FLUSH, [high])
+        if flush:
+            return pack(FLUSH, ranks)
+        if straight:
+            return pack(STRAIGHT, [high])
+    hand_type = {(4,): FOUR_OF_A_KIND, (3, 2): FULL_HOUSE, (3,): THREE_OF_A_KIND, (2, 2): TWO_PAIR, (2,): PAIR}
+    return pack(hand_type.get(tuple(count for count in shape if count > 1), HIGH_CARD), tiebreak)
+
+
+def reference_value(cards):
+    """ hand_value() by brute force: the best of every 5 card subset of the cards, evaluated one by one. """
+    if len(cards) <= 5:
+        return _reference_five(cards)
+    return max(_reference_five(five) for five in combinations(cards, 5))
+
+
+def cross_check(num_hands=20000, seed=0):
+    """ Compare hand_value() and hand_values() with reference_value() on random hands of every size. Returns the
+    number of mismatches. """
+    rng = np.random.default_rng(seed)
+    mismatches = 0
+    for k in range(MIN_CARDS, MAX_CARDS + 1):
+        hands = np.argsort(rng.random((num_hands, NUM_CARDS)), axis=1)[:, :k]
+        batched = hand_values(hands)
+        for cards, value in zip(hands.tolist(), batched.tolist()):
+            reference = reference_value(cards)
+            mismatches += (value != reference) + (hand_value(cards) != reference)
+    return mismatches
+
+
+def describe(value):
+    """ Name of the type of a hand value, e.g. "Full house". """
+    return HAND_TYPES[hand_type(value)]
@@ -1,26 +1,28 @@
 from collections import defaultdict
+import poker_hands
+
+# Hands and community cards are lists of integer cards (see deck.py): rank - 1 = card >> 2, suit = card & 3
 
 def pair_exists(hand, community):
     """
-    Given a hand (list of Cards) and the community cards (list of Cards), determine whether a pair exists. 
+    Given a hand (list of cards) and the community cards (list of cards), determine whether a pair exists.
     If yes, return the rank of the highest pair, if no, return 0
     """
     # Check for pair with hand card + 1 community card
-    player_rank = hand[0].rank()
+    player_rank = hand[0] >> 2
     for card in community:
-        rank = card.rank()
-        if rank == player_rank:
-            return rank
+        if card >> 2 == player_rank:
+            return player_rank + 1
     return 0
 
 def straight_exists(hand, community):
     """
-    Given a hand (list of Cards) and the community cards (list of Cards), determine whether a straight exists. 
+    Given a hand (list of cards) and the community cards (list of cards), determine whether a straight exists.
     If yes, return the rank of the highest straight (top card), if no, return 0
     """
     # Find best straight for 1 player card + 1 community card
-    player_rank = hand[0].rank()
-    community_ranks = {card.rank() for card in community}
+    player_rank = (hand[0] >> 2) + 1
+    community_ranks = {(card >> 2) + 1 for card in community}
     if player_rank + 1 in community_ranks:
         return player_rank + 1
     elif player_rank - 1 in community_ranks:
@@ -30,63 +32,70 @@ def straight_exists(hand, community):
 
 def flush_exists(hand, community):
     """
-    Given a hand (list of Cards) and the community cards (list of Cards), determine whether a flush exists. 
+    Given a hand (list of cards) and the community cards (list of cards), determine whether a flush exists.
     If yes, return the (sorted in descending order) ranks of the best flush (top card, then second top card), if no, return None
     """
-    player_suit = hand[0].suit()
-    flush = None
+    player_suit = hand[0] & 3
     max_flush = 0
     for card in community:
-        if card.suit() == player_suit:
-            if card.rank() > max_flush:
-                flush = [hand[0].rank(), card.rank()]
-                max_flush = card.rank()
-    if not flush:
+        if card & 3 == player_suit:
+            rank = (card >> 2) + 1
+            if rank > max_flush:
+                max_flush = rank
+    if not max_flush:
         return None
-    return sorted(flush, reverse=True)
+    return sorted([(hand[0] >> 2) + 1, max_flush], reverse=True)
 
 def straight_flush_exists(hand, community):
     """
-    Given a hand (list of Cards) and the community cards (list of Cards), determine whether a straight flush exists. 
+    Given a hand (list of cards) and the community cards (list of cards), determine whether a straight flush exists.
     If yes, return the (sorted in descending order) ranks of the best flush (top card, then second top card), if no, return None
     """
     # Find best straight flush for 1 player card + 1 community card
-    player_card_rank = hand[0].rank()
-    player_card_suit = hand[0].suit()
+    # Cards of the same suit and adjacent ranks are exactly 4 apart
+    player_card = hand[0]
+    player_card_rank = (player_card >> 2) + 1
     max_straight_flush = 0
     for card in community:
-        if card.rank() == player_card_rank + 1 and card.suit() == player_card_suit:
-            if card.rank() > max_straight_flush:
-                max_straight_flush = card.rank()
-        elif card.rank() == player_card_rank - 1 and card.suit() == player_card_suit:
+        if card == player_card + 4:
+            if player_card_rank + 1 > max_straight_flush:
+                max_straight_flush = player_card_rank + 1
+        elif card == player_card - 4:
             if player_card_rank > max_straight_flush:
                 max_straight_flush = player_card_rank
     return max_straight_flush
 
-def determine_best_hand(hand, community):
+def determine_best_hand(hand, community, hand_size=2):
     """
-    Given a hand (list of Cards) and the community cards (list of Cards), 
+    Given a hand (list of cards) and the community cards (list of cards),
     determine the best hand using 1 card from the hand + 1 card from community cards
-    
+
     Return the type of hand and the value of the hand.
     Type: 0 = High card, 1 = flush, 2 = straight, 3 = pair, 4 = straight flush
     Value: the value used to compare 2 hands of the same kind
+
+    With hand_size=5, the best standard 5 card hand of all the cards instead: the type is one of
+    poker_hands.HAND_TYPES and the value is poker_hands.hand_value (which compares hands of any type)
     """
+    if hand_size == 5:
+        value = poker_hands.hand_value(hand + community)
+        return poker_hands.hand_type(value), value
+
     straight_flush = straight_flush_exists(hand, community)
     if straight_flush != 0:
         return 4, straight_flush
-    
+
     pair = pair_exists(hand, community)
     if pair != 0:
         return 3, pair
-    
+
     straight = straight_exists(hand, community)
     if straight != 0:
         return 2, straight
-    
+
     flush = flush_exists(hand, community)
     if flush:
         return 1, flush
-    
+
     else:
-        return 0, hand[0].rank()
\ No newline at end of file
+        return 0, (hand[0] >> 2) + 1
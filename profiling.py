@@ -0,0 +1,212 @@
+import json
+import time
+
+# Opt-in per-phase timing of games.
+#
+# A Profiler aggregates durations (time.perf_counter_ns) by phase. Phases are paths of frames separated by ";",
+# e.g. "play;take_action;Random Agent", so the report can be printed as a table (report()), saved as JSON
+# (save_json()) or saved in the folded stack format of flame graph tools (save_folded(), e.g. for flamegraph.pl or
+# speedscope). Each phase keeps its count, total, min, max and a histogram of durations (see bucket()).
+#
+# PokerGame(profiler=...) times reset, shuffle, deal, each take_action call (by agent) and determine_game_result of
+# every game. Games without a profiler only pay for a few `is not None` checks. ProfiledAgent times the decisions
+# of any agent, e.g. in BatchPokerGame, under the same "play;take_action;<agent name>" phases, so profiles of
+# scalar and batched games have the same phase tree and can be merged and compared.
+
+NUM_BUCKETS = 4 * 64 # 4 buckets per power of 2 (see bucket()), so percentiles are within about 12%
+
+
+def bucket(ns):
+    """ Histogram bucket of a duration: the exact value below 4 ns, otherwise 4 * bit length + the 2 bits after the
+    leading 1. """
+    bits = ns.bit_length()
+    return ns if bits < 3 else 4 * bits + (ns >> (bits - 3) & 3)
+
+
+def bucket_bounds(b):
+    """ Return the [low, high) range of durations of bucket b. """
+    if b < 12:
+        return b, b + 1
+    bits, sub = divmod(b, 4)
+    return (4 + sub) << (bits - 3), (5 + sub) << (bits - 3)
+
+
+class PhaseStats:
+    """ Count, total, min, max and histogram of the durations (in ns) of one phase. """
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.buckets = [0] * NUM_BUCKETS
+
+    def add(self, ns):
+        self.count += 1
+        self.total += ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+        if ns > self.max:
+            self.max = ns
+        self.buckets[bucket(ns)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """ Approximate q-th percentile (0..100) in ns: the geometric middle of the bucket it falls in. """
+        rank = q / 100 * self.count
+        seen = 0
+        for b, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                low, high = bucket_bounds(b)
+                return min(max((low * high) ** 0.5, self.min), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count, "total_ns": self.total, "min_ns": self.min, "max_ns": self.max,
+                "mean_ns": self.mean(), "p50_ns": self.percentile(50), "p99_ns": self.percentile(99),
+                "buckets": {str(b): count for b, count in enumerate(self.buckets) if count}}
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls()
+        stats.count, stats.total, stats.min, stats.max = d["count"], d["total_ns"], d["min_ns"], d["max_ns"]
+        for b, count in d["buckets"].items():
+            stats.buckets[int(b)] = count
+        return stats
+
+
+class Profiler:
+    """ Durations aggregated by phase (see the top of this file). Profilers add up with +. """
+    def __init__(self):
+        self.phases = {}
+        self._agent_phases = {} # (id(agent), prefix) -> (agent, "<prefix>;<agent name>")
+
+    def add(self, phase, ns):
+        """ Record one duration (in ns) of phase. """
+        stats = self.phases.get(phase)
+        if stats is None:
+            stats = self.phases[phase] = PhaseStats()
+        stats.add(ns)
+
+    def lap(self, phase, since):
+        """ Record the time from since (a time.perf_counter_ns() value) to now as one duration of phase, and return
+        now, so consecutive phases can be timed with one clock read each. """
+        now = time.perf_counter_ns()
+        self.add(phase, now - since)
+        return now
+
+    def agent_phase(self, agent, prefix="play;take_action"):
+        """ Return the phase of the decisions of an agent, named after it (cached, str(agent) can be slow). """
+        cached = self._agent_phases.get((id(agent), prefix))
+        if cached is None or cached[0] is not agent:
+            cached = self._agent_phases[id(agent), prefix] = (agent, f"{prefix};{agent}")
+        return cached[1]
+
+    def merge(self, other):
+        for phase, stats in other.phases.items():
+            if phase not in self.phases:
+                self.phases[phase] = PhaseStats()
+            self.phases[phase].merge(stats)
+        return self
+
+    def __add__(self, other):
+        return Profiler().merge(self).merge(other)
+
+    def __getstate__(self):
+        return {"phases": self.phases}
+
+    def __setstate__(self, state):
+        self.phases = state["phases"]
+        self._agent_phases = {}
+
+    def self_times(self):
+        """ Return {phase: total ns minus the totals of its child phases}, the time spent in the phase itself. A phase is
+        a child of its closest recorded ancestor (play;take_action;X is a child of play). """
+        times = {phase: stats.total for phase, stats in self.phases.items()}
+        for phase, stats in self.phases.items():
+            parent = phase.rpartition(";")[0]
+            while parent and parent not in times:
+                parent = parent.rpartition(";")[0]
+            if parent:
+                times[parent] -= stats.total
+        return times
+
+    def report(self):
+        """ Return a table (a str) of the phases, by total time. """
+        width = max([len(phase) for phase in self.phases] + [5])
+        lines = [f"{'Phase':<{width}}  {'Calls':>9}  {'Total':>9}  {'Mean':>9}  {'p50':>9}  {'p99':>9}  {'Max':>9}"]
+        for phase, stats in sorted(self.phases.items(), key=lambda item: -item[1].total):
+            lines.append(f"{phase:<{width}}  {stats.count:>9}  {stats.total / 1e9:>8.3f}s  {stats.mean() / 1e3:>7.2f}us  "
+                         f"{stats.percentile(50) / 1e3:>7.2f}us  {stats.percentile(99) / 1e3:>7.2f}us  {stats.max / 1e3:>7.1f}us")
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {"phases": {phase: stats.to_dict() for phase, stats in self.phases.items()}}
+
+    @classmethod
+    def from_dict(cls, d):
+        profiler = cls()
+        profiler.phases = {phase: PhaseStats.from_dict(stats) for phase, stats in d["phases"].items()}
+        return profiler
+
+    def save_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    @classmethod
+    def load_json(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def folded(self):
+        """ Return the phases in folded stack format: one "frame;frame;... self_time_ns" line per phase. """
+        return "\n".join(f"{phase} {max(ns, 0)}" for phase, ns in self.self_times().items()) + "\n"
+
+    def save_folded(self, path):
+        with open(path, "w") as f:
+            f.write(self.folded())
+
+
+class ProfiledAgent:
+    """ Wrap an agent to time its take_action and take_actions calls in a Profiler, in the agent's phase of
+    Profiler.agent_phase(). Other attributes are the agent's. """
+    def __init__(self, agent, profiler):
+        self._agent = agent
+        self._profiler = profiler
+        self._phase = profiler.agent_phase(agent)
+
+    def __str__(self):
+        return str(self._agent)
+
+    def __getattr__(self, name):
+        if name.startswith("_"): # Not set yet, e.g. while unpickling
+            raise AttributeError(name)
+        return getattr(self._agent, name)
+
+    def take_action(self, state, opp_state):
+        start = time.perf_counter_ns()
+        action = self._agent.take_action(state, opp_state)
+        self._profiler.lap(self._phase, start)
+        return action
+
+    def take_actions(self, states, opp_states):
+        if not hasattr(self._agent, "take_actions"):
+            # Let batch_poker.batch_policy wrap the agent's take_action instead
+            from batch_poker import ScalarPolicyAdapter
+            return ScalarPolicyAdapter(self).take_actions(states, opp_states)
+        start = time.perf_counter_ns()
+        actions = self._agent.take_actions(states, opp_states)
+        self._profiler.lap(self._phase, start)
+        return actions
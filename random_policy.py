@@ -1,4 +1,5 @@
 import random
+import numpy as np
 
 # Random policy agent for poker
 class Random_Agent:
@@ -15,4 +16,16 @@ class Random_Agent:
 
         state: (player_hand, community_cards, history)
         """
-        return random.choice([0, 1])
\ No newline at end of file
+        return random.choice([0, 1])
+
+    def take_actions(self, states, opp_states):
+        """
+        batched take_action(): return an array with one action per row of the batch (see batch_poker.py)
+        """
+        return np.random.randint(0, 2, size=len(states[0])).astype(np.int8)
+
+    def action_probabilities(self, states):
+        """
+        probabilities of each action for a batch of states: array of shape (n, 2) (see best_response.py)
+        """
+        return np.full((len(states[0]), 2), 0.5)
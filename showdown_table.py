@@ -0,0 +1,131 @@
+import os
+from math import comb
+import numpy as np
+
+# Precomputed hand strengths for every (hole card, community cards) deal of our game.
+#
+# Cards are the integer cards of deck.py: (rank - 1) * 4 + suit, with suits ordered S, H, D, C.
+# A board (the 3 community cards, in any order) is indexed by the colexicographic rank of its
+# sorted card indices, so a deal is indexed by hole * NUM_BOARDS + board.
+#
+# A strength packs the result of poker_utils.determine_best_hand into one integer:
+#     hand type << 8 | hand value
+# where the value of a flush [high, low] is stored as high * 14 + low. Comparing two strengths
+# with < / > / == gives exactly the same outcome as the category by category comparison in
+# PokerGame.determine_game_result.
+
+NUM_CARDS = 52
+NUM_COMMUNITY_CARDS = 3
+NUM_BOARDS = comb(NUM_CARDS, NUM_COMMUNITY_CARDS) # 22100
+NUM_STATES = NUM_CARDS * NUM_BOARDS
+
+TABLE_VERSION = 1
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"showdown_table_v{TABLE_VERSION}.npy")
+
+def all_boards():
+    """ Return an array of shape (NUM_BOARDS, 3) with the sorted card indices of every board, in board index order. """
+    boards = np.empty((NUM_BOARDS, NUM_COMMUNITY_CARDS), dtype=np.int16)
+    i = 0
+    # Colexicographic order: the board index of a < b < c is a + C(b, 2) + C(c, 3)
+    for c in range(2, NUM_CARDS):
+        for b in range(1, c):
+            boards[i:i + b, 0] = np.arange(b)
+            boards[i:i + b, 1] = b
+            boards[i:i + b, 2] = c
+            i += b
+    return boards
+
+
+def _build_board_index():
+    """ Map every ordered triple of distinct cards (a, b, c), flattened as (a * 52 + b) * 52 + c, to its board index. """
+    index = np.full(NUM_CARDS ** 3, -1, dtype=np.int32)
+    boards = all_boards().astype(np.int32)
+    ids = np.arange(NUM_BOARDS, dtype=np.int32)
+    for a, b, c in ((0, 1, 2), (0, 2, 1), (1, 0, 2), (1, 2, 0), (2, 0, 1), (2, 1, 0)):
+        index[(boards[:, a] * NUM_CARDS + boards[:, b]) * NUM_CARDS + boards[:, c]] = ids
+    return index
+
+BOARD_INDEX = _build_board_index()
+_board_index = memoryview(BOARD_INDEX)
+
+
+def board_index(community):
+    """ Return the board index of a list of 3 community cards (order doesn't matter). """
+    a, b, c = community
+    return _board_index[(a * NUM_CARDS + b) * NUM_CARDS + c]
+
+
+def state_index(hand, community):
+    """ Return the index of a (hand, community cards) deal in the strength table. """
+    return hand[0] * NUM_BOARDS + board_index(community)
+
+
+def build_strength_table():
+    """ Compute the strength of every deal. Entries where the hole card is also on the board are 0. """
+    ranks = np.arange(NUM_CARDS) // 4 + 1
+    suits = np.arange(NUM_CARDS) % 4
+
+    # Pairwise features for (hole card h, community card x), each an array of shape (52, 52)
+    r = ranks[:, None]
+    rx = ranks[None, :]
+    same_suit = suits[:, None] == suits[None, :]
+    straight = np.where(rx == r + 1, r + 1, np.where(rx == r - 1, r, 0))
+    straight_flush = np.where(same_suit, straight, 0)
+    pair = np.where(rx == r, r, 0)
+    flush = np.where(same_suit, rx, 0) # Highest community card of the hole card's suit
+
+    boards = all_boards()
+    def best(feature):
+        # Max of the feature over the 3 community cards of every board: shape (52, NUM_BOARDS)
+        return feature[:, boards].max(axis=2)
+
+    straight_flush = best(straight_flush)
+    pair = best(pair)
+    straight = best(straight)
+    flush = best(flush)
+
+    hole_rank = np.broadcast_to(ranks[:, None], straight_flush.shape)
+    flush_value = np.maximum(hole_rank, flush) * 14 + np.minimum(hole_rank, flush)
+
+    strength = np.select(
+        [straight_flush > 0, pair > 0, straight > 0, flush > 0],
+        [(4 << 8) | straight_flush, (3 << 8) | pair, (2 << 8) | straight, (1 << 8) | flush_value],
+        default=hole_rank,
+    ).astype(np.uint16)
+
+    # Invalid deals: the hole card is one of the community cards
+    strength[(boards[None, :, :] == np.arange(NUM_CARDS)[:, None, None]).any(axis=2)] = 0
+    return strength.reshape(NUM_STATES)
+
+
+def load_strength_table(path=DEFAULT_TABLE_PATH):
+    """ Load the strength table from path, building it (and saving it to path) if the file doesn't exist.
+        Pass path=None to build the table in memory without touching the disk.
+    """
+    if path is not None and os.path.exists(path):
+        table = np.load(path)
+        if table.shape == (NUM_STATES,) and table.dtype == np.uint16:
+            return table
+    table = build_strength_table()
+    if path is not None:
+        try:
+            np.save(path, table)
+        except OSError:
+            pass # Read-only location: just keep the in-memory table
+    return table
+
+
+_strengths = None
+
+def get_strength_table():
+    """ Return the strength table, loading or building it on first use. """
+    global _strengths
+    if _strengths is None:
+        _strengths = memoryview(load_strength_table())
+    return _strengths
+
+
+def hand_strength(hand, community):
+    """ Return the strength of a hand (list of 1 card) with the given community cards (list of 3 cards). """
+    return get_strength_table()[state_index(hand, community)]
+
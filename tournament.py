@@ -0,0 +1,291 @@
+import copy
+import pickle
+import random
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+import numpy as np
+import equity
+from poker import PokerGame
+from batch_poker import BatchPokerGame
+from profiling import Profiler, ProfiledAgent
+
+# Run many matchups between agents, split into chunks of games that can be played in a process pool.
+#
+# Every chunk is seeded from (tournament seed, matchup, chunk) and starts from its own copy of the agents as they
+# were when the tournament started, so a chunk plays exactly the same games whichever process runs it, and a
+# parallel tournament gives exactly the same results as a serial one. Agents are pickled once and shipped to each
+# worker when it starts: agents that train in __init__ (like CFR_Agent) are never retrained in the workers.
+#
+# Variance reduction (see estimate()):
+#     duplicate=True plays the games in pairs on the same deal, p0_agent in seat 0 then in seat 1, so the luck of
+#     the cards mostly cancels within a pair. Pairs are the units of the statistics, and the games are single units.
+#     Control variates: per unit sums of zero-mean functions of the deal, (showdown result of p0_agent's card
+#     against the opponent's, showdown_equity of p0_agent's card) for each seat, are regressed out of the results.
+# Each MatchupResult keeps the moment matrix sum(z z^T) of the unit vectors
+#     z = (1, games, p0 reward, p0 wins, ties, 4 control variates)
+# which adds up across chunks and is all estimate() needs.
+#
+# Sequential testing: with a stopping rule (ConfidenceWidth or SPRT), run_tournament plays the matchups one chunk
+# at a time each and stops a matchup as soon as its rule is satisfied, num_games being the maximum. The decisions are
+# only taken between rounds of chunks, so the results still don't depend on the number of workers.
+MOMENTS = ("units", "games", "reward", "wins", "ties", "p0_showdown", "p0_equity", "p1_showdown", "p1_equity")
+NUM_CONTROLS = 4
+
+
+class MatchupResult:
+    """ Stats of a matchup from p0_agent's point of view. Results of chunks of the same matchup add up with +. """
+    def __init__(self, games=0, p0_wins=0, ties=0, p0_reward=0, moments=None, seconds=0.0, profile=None, decision=None):
+        self.games = games
+        self.p0_wins = p0_wins
+        self.ties = ties
+        self.p0_reward = p0_reward
+        self.moments = np.zeros((len(MOMENTS), len(MOMENTS))) if moments is None else moments
+        self.seconds = seconds # Time spent playing the games (summed over the chunks, not compared by ==)
+        self.profile = profile # profiling.Profiler of the games, if they were profiled
+        self.decision = decision # Why run_tournament's stopping rule stopped the matchup ("done", "p0" or "p1"), None if it didn't
+
+    def __add__(self, other):
+        profile = other.profile if self.profile is None else self.profile if other.profile is None else self.profile + other.profile
+        return MatchupResult(self.games + other.games, self.p0_wins + other.p0_wins, self.ties + other.ties,
+                             self.p0_reward + other.p0_reward, self.moments + other.moments, self.seconds + other.seconds, profile)
+
+    def __eq__(self, other):
+        return (self.games, self.p0_wins, self.ties, self.p0_reward) == (other.games, other.p0_wins, other.ties, other.p0_reward) \
+            and np.array_equal(self.moments, other.moments)
+
+    def __repr__(self):
+        return f"MatchupResult(games={self.games}, p0_wins={self.p0_wins}, ties={self.ties}, p0_reward={self.p0_reward})"
+
+
+Estimate = namedtuple("Estimate", ["mean", "half_width"]) # Confidence interval mean +- half_width
+MatchupEstimate = namedtuple("MatchupEstimate", ["games", "reward", "wins", "ties"]) # Estimates per game
+
+def estimate(result, control_variate=True, confidence=0.95):
+    """ Return a MatchupEstimate of p0_agent's reward, win rate and tie rate per game, with normal confidence
+    intervals over the units (games, or pairs of duplicate games) of the result.
+
+    The rates are ratio estimators (sum over units / games). With control_variate=True the control variates of
+    each unit, whose expectation is exactly 0, are subtracted with least squares coefficients, which removes the
+    part of the variance they explain.
+    """
+    m = result.moments
+    units, games = m[0, 0], m[0, 1]
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    controls = slice(len(MOMENTS) - NUM_CONTROLS, len(MOMENTS))
+    estimates = []
+    for target in (2, 3, 4):
+        rate = m[0, target] / games
+        # Residuals e = y - rate * games of each unit: their second moments, and their cross moments with the controls
+        ee = m[target, target] - 2 * rate * m[target, 1] + rate ** 2 * m[1, 1]
+        ex = m[target, controls] - rate * m[1, controls]
+        if control_variate:
+            xx = m[controls, controls]
+            beta = np.linalg.pinv(xx) @ ex
+            rate -= beta @ m[0, controls] / games
+            ee = ee - 2 * beta @ ex + beta @ xx @ beta
+        variance = max(ee, 0) / max(units - 1, 1)
+        estimates.append(Estimate(rate, z * np.sqrt(variance * units) / games))
+    return MatchupEstimate(int(games), *estimates)
+
+
+class ConfidenceWidth:
+    """ Stopping rule: stop a matchup once the confidence interval of p0_agent's reward per game is at most
+    +- half_width (see estimate()), after at least min_games games. """
+    def __init__(self, half_width=0.02, confidence=0.95, control_variate=True, min_games=1000):
+        self.half_width = half_width
+        self.confidence = confidence
+        self.control_variate = control_variate
+        self.min_games = min_games
+
+    def decision(self, result):
+        """ Return "done" if the matchup can stop, None to keep playing. """
+        if result.games < self.min_games:
+            return None
+        e = estimate(result, self.control_variate, self.confidence)
+        return "done" if e.reward.half_width <= self.half_width else None
+
+
+class SPRT:
+    """ Stopping rule: Wald's sequential probability ratio test of "p0_agent wins delta chips per game" against
+    "p1_agent wins delta chips per game", on the (normal) estimate of the reward per game. Stops a matchup once one
+    of them is accepted, with error rates alpha (wrongly deciding for p0_agent) and beta (wrongly deciding for
+    p1_agent), after at least min_games games. Matchups closer than delta stop later, or at num_games.
+    """
+    def __init__(self, delta=0.05, alpha=0.05, beta=0.05, control_variate=True, min_games=1000):
+        self.delta = delta
+        self.control_variate = control_variate
+        self.min_games = min_games
+        self.upper = np.log((1 - beta) / alpha)
+        self.lower = np.log(beta / (1 - alpha))
+
+    def log_likelihood_ratio(self, result):
+        e = estimate(result, self.control_variate, confidence=NormalDist().cdf(1) * 2 - 1) # Half width = 1 std error
+        # log N(mean; delta, se^2) - log N(mean; -delta, se^2)
+        if e.reward.half_width == 0:
+            return np.sign(e.reward.mean) * np.inf
+        return 2 * self.delta * e.reward.mean / e.reward.half_width ** 2
+
+    def decision(self, result):
+        """ Return "p0" or "p1" (the agent found better) if the matchup can stop, None to keep playing. """
+        if result.games < self.min_games:
+            return None
+        llr = self.log_likelihood_ratio(result)
+        if llr >= self.upper:
+            return "p0"
+        if llr <= self.lower:
+            return "p1"
+        return None
+
+
+def chunk_seed(seed, matchup, chunk):
+    """ Seed of the RNGs for a chunk of games. """
+    return int(np.random.SeedSequence([seed, matchup, chunk]).generate_state(1)[0])
+
+
+def seed_everything(seed):
+    """ Seed every RNG the game and the agents draw from. """
+    random.seed(seed)
+    np.random.seed(seed)
+    if "torch" in sys.modules:
+        sys.modules["torch"].manual_seed(seed)
+
+
+def play_chunk(p0_agent, p1_agent, first_game, num_games, seed, batched=False, duplicate=False, profile=False):
+    """ Play games first_game .. first_game + num_games - 1 of a matchup and return their MatchupResult.
+
+        Since there is an advantage to being P1, p0_agent plays as P0 in the even games and as P1 in the odd games.
+        With duplicate=True, games 2k and 2k + 1 are played on the same deal (first_game must be even).
+        With batched=True the games are played with BatchPokerGame (each seat in one batch).
+        With profile=True the phases of the games are timed (see profiling.py), in the result's profile.
+    """
+    start = time.perf_counter()
+    profiler = Profiler() if profile else None
+    seed_everything(seed)
+    games = np.arange(first_game, first_game + num_games)
+    swapped = games % 2 == 1 # p0_agent plays as P1
+    dealer = BatchPokerGame(seed)
+    if duplicate:
+        assert first_game % 2 == 0, "duplicate games are played in pairs"
+        units = (games - first_game) // 2
+        hands, community_cards = dealer.deal_cards(units[-1] + 1 if num_games else 0)
+        hands, community_cards = hands[units], community_cards[units]
+    else:
+        units = games - first_game
+        hands, community_cards = dealer.deal_cards(num_games)
+
+    if batched:
+        if profiler is not None:
+            p0_agent, p1_agent = ProfiledAgent(p0_agent, profiler), ProfiledAgent(p1_agent, profiler)
+        winners = np.zeros(num_games, dtype=np.int64)
+        margins = np.zeros(num_games, dtype=np.int64)
+        for seat, (p0, p1) in enumerate(((p0_agent, p1_agent), (p1_agent, p0_agent))):
+            rows = np.nonzero(swapped == seat)[0]
+            if profiler is not None:
+                play_start = time.perf_counter_ns()
+            winners[rows], margins[rows] = dealer.play(p0, p1, len(rows), deal=(hands[rows], community_cards[rows]))
+            if profiler is not None:
+                profiler.lap("play", play_start) # The agents' decisions are phases under it, like in PokerGame
+    else:
+        game = PokerGame(profiler=profiler)
+        winners = np.zeros(num_games, dtype=np.int64)
+        margins = np.zeros(num_games, dtype=np.int64)
+        hand_lists = hands[:, :, None].tolist() # [[P0 card], [P1 card]] per game
+        community_lists = community_cards.tolist()
+        for k in range(num_games):
+            deal = (hand_lists[k], community_lists[k])
+            if swapped[k]:
+                winners[k], margins[k] = game.play(p1_agent, p0_agent, verbose=False, deal=deal)
+            else:
+                winners[k], margins[k] = game.play(p0_agent, p1_agent, verbose=False, deal=deal)
+
+    # From p0_agent's point of view
+    sign = np.where(swapped, -1, 1)
+    rewards = sign * margins
+    wins = sign * winners == 1
+    ties = winners == 0
+    own = np.where(swapped, hands[:, 1], hands[:, 0])
+    showdown = sign * dealer.showdown(hands, community_cards)
+    own_equity = equity.showdown_equity(own, community_cards)
+    z = np.stack([np.ones(num_games), np.ones(num_games), rewards, wins, ties,
+                  showdown * ~swapped, own_equity * ~swapped, showdown * swapped, own_equity * swapped], axis=1)
+    per_unit = np.zeros((units[-1] + 1 if num_games else 0, len(MOMENTS)))
+    np.add.at(per_unit, units, z)
+    per_unit[:, 0] = 1
+    return MatchupResult(num_games, int(wins.sum()), int(ties.sum()), int(rewards.sum()), per_unit.T @ per_unit,
+                         time.perf_counter() - start, profiler)
+
+
+_worker_agents = None # The agents, unpickled once per worker process
+
+def _init_worker(pickled_agents):
+    global _worker_agents
+    _worker_agents = pickle.loads(pickled_agents)
+
+def _play_task(task):
+    matchup, p0, p1, first_game, num_games, seed, batched, duplicate, profile = task
+    # Every chunk starts from fresh copies of its two agents (copied together, so an agent playing itself stays one
+    # object): agents that change as they play can't carry state across chunks, whichever worker plays them
+    p0_agent, p1_agent = copy.deepcopy((_worker_agents[p0], _worker_agents[p1]))
+    return matchup, play_chunk(p0_agent, p1_agent, first_game, num_games, seed, batched, duplicate, profile)
+
+
+def run_tournament(agents, matchups, num_games=25000, chunk_size=2500, num_workers=1, seed=0, batched=False, duplicate=False, stopping=None, profile=False):
+    """ Play every matchup and return a list with the MatchupResult of each.
+
+        agents -- list of agents
+        matchups -- list of (p0 index, p1 index) pairs of agents to play against each other
+        num_games -- games per matchup (the maximum, with a stopping rule)
+        chunk_size -- games per task given to a worker (keep it even so both seats are played equally)
+        num_workers -- number of processes; 1 plays everything in this process
+        seed -- tournament seed: the same seed gives the same results for any num_workers
+        batched, duplicate, profile -- see play_chunk
+        stopping -- optional stopping rule (ConfidenceWidth or SPRT), checked for each matchup after each of its
+                    chunks; its matchups stop early when rule.decision(result) isn't None, which is kept as the
+                    result's decision (e.g. the hypothesis an SPRT accepted)
+    """
+    pickled_agents = pickle.dumps(agents)
+    chunks = [[(m, p0, p1, first_game, min(chunk_size, num_games - first_game), chunk_seed(seed, m, c), batched, duplicate, profile)
+               for c, first_game in enumerate(range(0, num_games, chunk_size))] for m, (p0, p1) in enumerate(matchups)]
+    results = [MatchupResult() for _ in matchups]
+
+    def play_rounds(play):
+        if stopping is None:
+            rounds = [[task for tasks in chunks for task in tasks]]
+        else:
+            # One chunk of each matchup still running per round
+            rounds = ([tasks[c] for m, tasks in enumerate(chunks) if c < len(tasks) and results[m].decision is None]
+                      for c in range(max(map(len, chunks), default=0)))
+        for tasks in rounds:
+            for m, result in play(_play_task, tasks):
+                results[m] += result
+            if stopping is not None:
+                for m in {task[0] for task in tasks}:
+                    results[m].decision = stopping.decision(results[m])
+
+    if num_workers <= 1:
+        _init_worker(pickled_agents)
+        play_rounds(map)
+        return results
+
+    equity.get_equity_table() # Built (or opened) once here rather than by every worker that misses the file
+    with ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(pickled_agents,)) as pool:
+        play_rounds(pool.map)
+    return results
+
+
+def format_table(agents, matchups, results, control_variate=True, confidence=0.95):
+    """ Return a table (a str) with one row per matchup, with confidence intervals (see estimate()), and the games
+    played, time spent and stopping decision (see run_tournament) of each matchup. """
+    names = [str(agent) for agent in agents]
+    width = max(len(name) for name in names)
+    lines = [f"{'P0':<{width}}  {'P1':<{width}}  {'Games':>7}  {'P0 reward/game':>16}  {'P0 win':>15}  {'Tie':>15}  {'P1 win':>7}  {'Time':>7}  {'Stopped':>7}"]
+    for (p0, p1), result in zip(matchups, results):
+        n = result.games
+        e = estimate(result, control_variate, confidence)
+        p1_wins = 1 - e.wins.mean - e.ties.mean
+        lines.append(f"{names[p0]:<{width}}  {names[p1]:<{width}}  {n:>7}  {e.reward.mean:>7.3f} +- {e.reward.half_width:<5.3f}  "
+                     f"{e.wins.mean * 100:>6.2f}% +- {e.wins.half_width * 100:<4.2f}  {e.ties.mean * 100:>6.2f}% +- {e.ties.half_width * 100:<4.2f}  {p1_wins * 100:>6.2f}%  {result.seconds:>6.1f}s  {result.decision or '-':>7}")
+    return "\n".join(lines)